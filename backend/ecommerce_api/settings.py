@@ -16,6 +16,7 @@ import logging
 from pathlib import Path
 from datetime import timedelta
 import environ
+from corsheaders.defaults import default_headers
 
 # -----------------------------------------------------------------------------
 # 1. ENVIRONMENT CONFIGURATION
@@ -147,41 +148,74 @@ DATABASES['default']['CONN_MAX_AGE'] = 600
 # 5. CACHING & REDIS
 # -----------------------------------------------------------------------------
 
-# Try to use Redis if available, fallback to database cache for development
-REDIS_AVAILABLE = False
-try:
-    import redis
-    redis_client = redis.from_url(env('REDIS_URL'))
-    redis_client.ping()
-    REDIS_AVAILABLE = True
-except Exception:
-    # Redis not available - will use database fallback
-    REDIS_AVAILABLE = False
-
-if REDIS_AVAILABLE:
-    # Redis is available - use it for caching and sessions
-    CACHES = {
-        'default': {
-            'BACKEND': 'django_redis.cache.RedisCache',
-            'LOCATION': env('REDIS_URL'),
-            'OPTIONS': {
-                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-                # Use compression to save memory on large cached objects (like product lists)
-                "COMPRESSOR": "django_redis.compressors.zlib.ZlibCompressor",
-            }
-        }
-    }
-    SESSION_ENGINE = "django.contrib.sessions.backends.cache"
-    SESSION_CACHE_ALIAS = "default"
-else:
-    # Redis not available - use database cache and sessions for development
-    CACHES = {
-        'default': {
-            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-            'LOCATION': 'cache_table',
+# Redis is reached through a resilient wrapper: no import-time ping, tight
+# socket timeouts, and a circuit breaker that serves from a bounded in-memory
+# cache (never the database) while Redis is down. It recovers on its own.
+CACHES = {
+    'default': {
+        'BACKEND': 'store.utils.cache_backend.ResilientRedisCache',
+        'LOCATION': env('REDIS_URL'),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            # Use compression to save memory on large cached objects (like product lists)
+            "COMPRESSOR": "django_redis.compressors.zlib.ZlibCompressor",
+            'SOCKET_CONNECT_TIMEOUT': env.float('REDIS_CONNECT_TIMEOUT', default=0.25),
+            'SOCKET_TIMEOUT': env.float('REDIS_SOCKET_TIMEOUT', default=0.25),
+            # Circuit breaker tuning
+            'FAILURE_THRESHOLD': env.int('REDIS_FAILURE_THRESHOLD', default=3),
+            'RECOVERY_TIMEOUT': env.int('REDIS_RECOVERY_TIMEOUT', default=30),
+            'FALLBACK_MAX_ENTRIES': env.int('CACHE_FALLBACK_MAX_ENTRIES', default=5000),
         }
     }
-    SESSION_ENGINE = "django.contrib.sessions.backends.db"  # Use database sessions
+}
+# Sessions are read from the cache and written through to the database, so a
+# Redis outage does not log everyone out of the admin.
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+SESSION_CACHE_ALIAS = "default"
+
+# Cart engine: 'db' (Cart/CartItem tables) or 'redis' (Redis hash per user,
+# persisted write-behind by `manage.py flush_cart_writes`)
+CART_ENGINE = env('CART_ENGINE', default='db')
+CART_REDIS_TTL = env.int('CART_REDIS_TTL', default=60 * 60 * 24 * 7)
+# Anonymous carts are kept in the cache under an opaque token for this long (sliding)
+GUEST_CART_TTL = env.int('GUEST_CART_TTL', default=60 * 60 * 24 * 7)
+# Cart lines hold stock softly for this long after the last cart write
+# (expired rows are purged by `manage.py reap_reservations`)
+STOCK_RESERVATION_TTL = env.int('STOCK_RESERVATION_TTL', default=15 * 60)
+# Responses to requests sent with an Idempotency-Key are replayed for this long;
+# a claim whose handler never finished is taken over after the lock timeout
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', default=60 * 60 * 24)
+IDEMPOTENCY_LOCK_TIMEOUT = env.int('IDEMPOTENCY_LOCK_TIMEOUT', default=60)
+# Transactional outbox (`manage.py run_outbox_worker`): retry with exponential
+# backoff up to OUTBOX_MAX_ATTEMPTS; claims older than the lease are retaken
+OUTBOX_MAX_ATTEMPTS = env.int('OUTBOX_MAX_ATTEMPTS', default=8)
+OUTBOX_RETRY_BASE_SECONDS = env.int('OUTBOX_RETRY_BASE_SECONDS', default=5)
+OUTBOX_RETRY_MAX_SECONDS = env.int('OUTBOX_RETRY_MAX_SECONDS', default=60 * 60)
+OUTBOX_LEASE_SECONDS = env.int('OUTBOX_LEASE_SECONDS', default=300)
+# Bulk order status changes (admin actions, `manage.py transition_orders`) are
+# written this many orders per transaction
+ORDER_TRANSITION_BATCH_SIZE = env.int('ORDER_TRANSITION_BATCH_SIZE', default=500)
+# Each process keeps active coupons in memory and checks the shared cache for
+# changes at most this often
+COUPON_CACHE_CHECK_SECONDS = env.int('COUPON_CACHE_CHECK_SECONDS', default=5)
+# Basket prices are cached per cart contents; product saves invalidate them,
+# this bounds staleness after bulk price updates that bypass save()
+PRICING_CACHE_TTL = env.int('PRICING_CACHE_TTL', default=300)
+# Checkout quotes (POST /orders/quote/) can be used to place the order for this long
+QUOTE_TTL = env.int('QUOTE_TTL', default=10 * 60)
+# Pincode index built by `manage.py load_pincodes`; workers mmap it and check
+# for a new file this often. Zones missing from PINCODE_ZONE_SHIPPING pay the
+# flat shipping fee.
+PINCODE_INDEX_PATH = env('PINCODE_INDEX_PATH', default=str(BASE_DIR / 'data' / 'pincodes.idx'))
+PINCODE_INDEX_CHECK_SECONDS = env.int('PINCODE_INDEX_CHECK_SECONDS', default=30)
+PINCODE_ZONE_SHIPPING = {'A': 49, 'B': 69, 'C': 99, 'D': 129, 'E': 149}
+# `manage.py archive_orders` moves finished orders untouched for this many days
+# out of the hot order tables, this many orders per transaction
+ORDER_ARCHIVE_AFTER_DAYS = env.int('ORDER_ARCHIVE_AFTER_DAYS', default=180)
+ORDER_ARCHIVE_BATCH_SIZE = env.int('ORDER_ARCHIVE_BATCH_SIZE', default=500)
+# When order ids became time-ordered UUIDv7 (ISO datetime, e.g. the deploy of
+# that change); time-range queries use the pk index from then on
+ORDER_UUID7_SINCE = env('ORDER_UUID7_SINCE', default='')
 
 # -----------------------------------------------------------------------------
 # 6. PASSWORD & AUTHENTICATION
@@ -297,6 +331,9 @@ SIMPLE_JWT = {
 
 CORS_ALLOWED_ORIGINS = env('CORS_ALLOWED_ORIGINS')
 CORS_ALLOW_CREDENTIALS = True
+# Guest cart token travels in a custom header both ways
+CORS_ALLOW_HEADERS = (*default_headers, 'x-cart-token', 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['X-Cart-Token', 'Idempotent-Replayed']
 
 # -----------------------------------------------------------------------------
 # 12. SWAGGER / OPENAPI (Spectacular)
@@ -383,4 +420,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # -----------------------------------------------------------------------------
 
 RAZORPAY_KEY_ID = env('RAZORPAY_KEY_ID')
-RAZORPAY_KEY_SECRET = env('RAZORPAY_KEY_SECRET')
\ No newline at end of file
+RAZORPAY_KEY_SECRET = env('RAZORPAY_KEY_SECRET')
+# Empty for the live API; point at `manage.py razorpay_stub` to test locally
+RAZORPAY_BASE_URL = env('RAZORPAY_BASE_URL', default='')
+# One pooled keep-alive client per process; every call is bounded by these
+# timeouts (seconds) and retried at most RAZORPAY_MAX_RETRIES times
+RAZORPAY_CONNECT_TIMEOUT = env.float('RAZORPAY_CONNECT_TIMEOUT', default=3.05)
+RAZORPAY_READ_TIMEOUT = env.float('RAZORPAY_READ_TIMEOUT', default=10.0)
+RAZORPAY_MAX_RETRIES = env.int('RAZORPAY_MAX_RETRIES', default=2)
+RAZORPAY_POOL_SIZE = env.int('RAZORPAY_POOL_SIZE', default=10)
+# Gateway metrics are counted per process and written to the cache this often
+RAZORPAY_METRICS_FLUSH_SECONDS = env.int('RAZORPAY_METRICS_FLUSH_SECONDS', default=10)
@@ -1,14 +1,48 @@
+from collections import Counter
+from decimal import Decimal
 from django.contrib import admin
+from django.contrib.auth import get_permission_codename
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
-from django.db.models import Sum, Count
+from django.contrib import messages
+from django.db import transaction
+from django.core.files.storage import default_storage
+from django.db.models import Sum, Count, Q, OuterRef, Subquery, IntegerField, DecimalField
+from django.db.models.functions import Coalesce
 from mptt.admin import DraggableMPTTAdmin
 from .models import (
     User, Address, Category, Brand, Product, ProductImage, ProductSize, ProductVariant,
-    Wishlist, Cart, CartItem, Order, OrderItem, Review, Coupon, ReturnRequest
+    Wishlist, Cart, CartItem, Order, OrderItem, Review, Coupon, ReturnRequest, InventoryMovement,
+    OrderEvent, DailySales, ArchivedOrder, CART_LINE_TOTAL
 )
+from .utils import archive, inventory, order_events, order_transitions, rollups
+
+
+def save_with_stock_movement(request, form, obj, kind, field):
+    """
+    Save an admin form without writing the stock field directly: the edit is
+    turned into a ledger movement (restock if it adds units, adjustment if it
+    removes them) relative to the value the form was loaded with, so
+    concurrent sales are not overwritten.
+    """
+    target = getattr(obj, field)
+    initial = form.initial.get(field, 0) if obj.pk else 0
+    if obj.pk:
+        obj.save(update_fields=[
+            f.attname for f in obj._meta.concrete_fields if not f.primary_key and f.name != field
+        ])
+    else:
+        setattr(obj, field, 0)
+        obj.save()
+    delta = target - initial
+    if delta:
+        inventory.adjust(
+            (kind, obj.pk), delta, 'restock' if delta > 0 else 'adjustment',
+            created_by=request.user, note='Admin edit',
+        )
+    obj.refresh_from_db(fields=[field])
 
 # -----------------------------------------------------------------------------
 # 1. USER & AUTHENTICATION
@@ -87,14 +121,13 @@ class CategoryAdmin(DraggableMPTTAdmin):
     image_preview.short_description = 'Image'
     
     def product_count(self, instance):
-        if instance:
-            return instance.products.filter(is_active=True).count()
-        return 0
+        return getattr(instance, 'active_product_count', 0)
     product_count.short_description = 'Products'
+    product_count.admin_order_field = 'active_product_count'
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related('products')
+        return qs.annotate(active_product_count=Count('products', filter=Q(products__is_active=True)))
 
 
 @admin.register(Brand)
@@ -105,7 +138,7 @@ class BrandAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related('products')
+        return qs.annotate(product_total=Count('products'))
 
     def logo_preview(self, obj):
         if obj and obj.logo:
@@ -117,10 +150,9 @@ class BrandAdmin(admin.ModelAdmin):
     logo_preview.short_description = 'Logo'
 
     def product_count(self, obj):
-        if obj:
-            return obj.products.count()
-        return 0
+        return getattr(obj, 'product_total', 0)
     product_count.short_description = 'Products'
+    product_count.admin_order_field = 'product_total'
 
 
 class ProductImageInline(admin.TabularInline):
@@ -201,22 +233,51 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
-    def thumbnail(self, obj):
+    def get_queryset(self, request):
+        # Thumbnail path and size stock as subqueries: one query for the whole page
+        images = ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_primary', 'sort_order', 'id')
+        size_stock = (
+            ProductSize.objects.filter(product=OuterRef('pk')).order_by()
+            .values('product').annotate(total=Sum('stock_count')).values('total')
+        )
+        return super().get_queryset(request).annotate(
+            thumbnail_path=Subquery(images.values('image')[:1]),
+            size_stock=Coalesce(Subquery(size_stock, output_field=IntegerField()), 0),
+        )
+
+    def save_model(self, request, obj, form, change):
         try:
-            if obj:
-                img = obj.images.filter(is_primary=True).first()
-                if not img and obj.images.exists():
-                    img = obj.images.first()
-                if img and img.image:
-                    try:
-                        return format_html(
-                            '<img src="{}" style="width: 60px; height: 80px; object-fit: cover; border: 1px solid #ddd;" />', 
-                            img.image.url
-                        )
-                    except Exception:
-                        return "Image error"
-        except Exception as e:
-            return f"Error: {str(e)}"
+            save_with_stock_movement(request, form, obj, 'product', 'inventory_count')
+        except inventory.InsufficientStock:
+            self.message_user(request, "Stock was not changed: it dropped below the requested reduction.", messages.ERROR)
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not ProductSize:
+            return super().save_formset(request, form, formset, change)
+        # Size stock edits go through the inventory ledger as well
+        formset.save(commit=False)
+        for size in formset.deleted_objects:
+            size.delete()
+        for size_form in formset.forms:
+            if size_form in formset.deleted_forms or not size_form.has_changed():
+                continue
+            size = size_form.instance
+            size.product = form.instance
+            try:
+                save_with_stock_movement(request, size_form, size, 'size', 'stock_count')
+            except inventory.InsufficientStock:
+                self.message_user(request, f"Stock for size {size.size} was not changed: it dropped below the requested reduction.", messages.ERROR)
+
+    def thumbnail(self, obj):
+        path = getattr(obj, 'thumbnail_path', None)
+        if path:
+            try:
+                return format_html(
+                    '<img src="{}" style="width: 60px; height: 80px; object-fit: cover; border: 1px solid #ddd;" />', 
+                    default_storage.url(path)
+                )
+            except Exception:
+                return "Image error"
         return "-"
     thumbnail.short_description = 'Image'
 
@@ -230,7 +291,7 @@ class ProductAdmin(admin.ModelAdmin):
             if obj.product_type == 'simple':
                 count = obj.inventory_count
             else:
-                count = obj.variants.aggregate(total=Sum('stock_count'))['total'] or 0
+                count = obj.size_stock
             
             color = 'green' if count > 10 else 'orange' if count > 0 else 'red'
             return format_html('<span style="color: {}; font-weight: bold;">{} Units</span>', color, count)
@@ -270,13 +331,27 @@ class ReturnRequestInline(admin.TabularInline):
         return False
 
 
+class OrderEventInline(admin.TabularInline):
+    model = OrderEvent
+    extra = 0
+    can_delete = False
+    fields = ('created_at', 'kind', 'previous_status', 'status', 'actor', 'source', 'note')
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'get_total_amount', 'order_status', 'payment_status', 'razorpay_order_id', 'razorpay_payment_id', 'created_at')
     list_filter = ('order_status', 'payment_status', 'created_at')
     search_fields = ('id', 'user__email', 'tracking_number', 'razorpay_order_id', 'razorpay_payment_id')
     readonly_fields = ('id', 'tax_amount', 'shipping_cost', 'discount_amount', 'created_at', 'updated_at', 'razorpay_order_id', 'razorpay_payment_id', 'razorpay_signature')
-    inlines = [OrderItemInline, ReturnRequestInline]
+    inlines = [OrderItemInline, ReturnRequestInline, OrderEventInline]
     
     fieldsets = (
         (_('Order Info'), {
@@ -302,25 +377,130 @@ class OrderAdmin(admin.ModelAdmin):
     get_total_amount.short_description = 'Total Amount'
     get_total_amount.admin_order_field = 'total_amount'
     
-    actions = ['mark_processing', 'mark_shipped', 'mark_delivered']
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'mark_cancelled', 'mark_refunded']
+
+    def get_readonly_fields(self, request, obj=None):
+        # Status moves go through the actions, which lock the rows and allow only ALLOWED_TRANSITIONS
+        if obj is not None:
+            return self.readonly_fields + ('order_status',)
+        return self.readonly_fields
+
+    def _transition(self, request, queryset, order_status):
+        moved, skipped = order_transitions.transition(queryset, order_status, actor=request.user, source='admin')
+        self.message_user(request, f"{len(moved)} order(s) marked as {order_status}.", messages.SUCCESS)
+        if skipped:
+            counts = Counter(skipped.values())
+            reasons = '; '.join(
+                f"{count} {current} ({order_transitions.refusal(current, order_status)})"
+                for current, count in sorted(counts.items())
+            )
+            self.message_user(
+                request, f"{len(skipped)} order(s) not marked as {order_status}: {reasons}.", messages.WARNING
+            )
 
     def mark_processing(self, request, queryset):
-        queryset.update(order_status='processing')
+        self._transition(request, queryset, 'processing')
     mark_processing.short_description = "Mark selected orders as processing"
     
     def mark_shipped(self, request, queryset):
-        queryset.update(order_status='shipped')
+        self._transition(request, queryset, 'shipped')
     mark_shipped.short_description = "Mark selected orders as shipped"
     
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        previous = {field: form.initial.get(field) for field in ('order_status', 'payment_status')} if change else {}
+        order_events.record(order_events.changes(obj, previous, actor=request.user, source='admin'))
+        if {'order_status', 'payment_status', 'payment_method', 'discount_amount'} & set(form.changed_data):
+            rollups.schedule([obj.pk])
+
     def mark_delivered(self, request, queryset):
-        from django.utils import timezone
-        # Use save() instead of update() so the save() method triggers and sets delivered_at
-        for order in queryset:
-            order.order_status = 'delivered'
-            order.payment_status = 'paid'
-            order.save()
+        # Only shipped orders can be delivered. Pending (cash on delivery) payments become paid;
+        # failed ones are left for staff to resolve. delivered_at is stamped in the same UPDATE
+        self._transition(request, queryset, 'delivered')
     mark_delivered.short_description = "Mark selected orders as delivered"
 
+    def mark_cancelled(self, request, queryset):
+        # Returns the stock and coupon uses of the cancelled orders
+        self._transition(request, queryset, 'cancelled')
+    mark_cancelled.short_description = "Cancel selected orders"
+
+    def mark_refunded(self, request, queryset):
+        self._transition(request, queryset, 'refunded')
+    mark_refunded.short_description = "Mark selected orders as refunded"
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'get_total_amount', 'order_status', 'payment_status', 'payment_method', 'created_at', 'archived_at')
+    list_filter = ('order_status', 'payment_status', 'created_at')
+    search_fields = ('=id', 'user__email')
+    list_select_related = ('user',)
+    date_hierarchy = 'created_at'
+    actions = ['restore_orders']
+
+    def get_total_amount(self, obj):
+        return f"₹{obj.total_amount:,.2f}"
+    get_total_amount.short_description = 'Total Amount'
+    get_total_amount.admin_order_field = 'total_amount'
+
+    # Snapshots are read-only; restore an order to change it
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def restore_orders(self, request, queryset):
+        restored = archive.restore(list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, f"{restored} order(s) moved back to the order tables.", messages.SUCCESS)
+    restore_orders.short_description = "Restore selected orders from the archive"
+    restore_orders.allowed_permissions = ('restore',)
+
+    def has_restore_permission(self, request):
+        # Restoring writes Order, OrderItem and ReturnRequest rows, so it takes order change rights
+        opts = Order._meta
+        return request.user.has_perm(f'{opts.app_label}.{get_permission_codename("change", opts)}')
+
+
+@admin.register(InventoryMovement)
+class InventoryMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'kind', 'ref_id', 'delta', 'reason', 'order', 'created_by', 'note')
+    list_filter = ('reason', 'kind', 'created_at')
+    search_fields = ('=ref_id', 'order__id', 'note')
+    list_select_related = ('created_by',)
+    raw_id_fields = ('order', 'order_item', 'created_by')
+
+    # The ledger is append-only; corrections are new movements
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'dimension', 'key', 'orders', 'units', 'gross', 'discount', 'tax', 'returned_units', 'returned_amount')
+    list_filter = ('dimension', 'date')
+    search_fields = ('=key',)
+    date_hierarchy = 'date'
+
+    # Maintained by utils/rollups.py; rebuild with `manage.py rebuild_sales_rollups`
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
 
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
@@ -349,16 +529,44 @@ class ReturnRequestAdmin(admin.ModelAdmin):
     readonly_fields = ('user', 'created_at', 'updated_at')
     fields = ('order', 'order_item', 'user', 'reason', 'status', 'admin_notes', 'created_at', 'updated_at')
     
-    actions = ['approve_returns', 'reject_returns']
+    actions = ['approve_returns', 'reject_returns', 'complete_returns']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'status' in form.changed_data and obj.status == 'completed':
+            self._restock(request, [obj])
+        elif 'status' in form.changed_data and form.initial.get('status') == 'completed':
+            rollups.schedule([obj.order_id])
+
+    def _restock(self, request, return_requests):
+        """Returned goods are back on the shelf: 'return' movements for what was sold."""
+        for return_request in return_requests:
+            order_items = [return_request.order_item] if return_request.order_item_id else None
+            inventory.restock_order(return_request.order, 'return', order_items=order_items, created_by=request.user)
+        rollups.schedule({return_request.order_id for return_request in return_requests})
     
+    def _set_status(self, queryset, status):
+        # Moving a completed return back out of 'completed' takes it off the sales rollups
+        with transaction.atomic():
+            reopened = set(queryset.filter(status='completed').values_list('order_id', flat=True))
+            queryset.update(status=status)
+            rollups.schedule(reopened)
+
     def approve_returns(self, request, queryset):
-        queryset.update(status='approved')
+        self._set_status(queryset, 'approved')
     approve_returns.short_description = "Approve selected return requests"
     
     def reject_returns(self, request, queryset):
-        queryset.update(status='rejected')
+        self._set_status(queryset, 'rejected')
     reject_returns.short_description = "Reject selected return requests"
 
+    @transaction.atomic
+    def complete_returns(self, request, queryset):
+        pending = list(queryset.exclude(status='completed').select_related('order'))
+        ReturnRequest.objects.filter(id__in=[r.id for r in pending]).update(status='completed')
+        self._restock(request, pending)
+    complete_returns.short_description = "Mark selected returns as completed (restock items)"
+
 
 @admin.register(Wishlist)
 class WishlistAdmin(admin.ModelAdmin):
@@ -373,19 +581,23 @@ class CartAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related('items')
+        # Same line totals as Cart.total_price, summed per cart in a subquery
+        totals = (
+            CartItem.objects.filter(cart=OuterRef('pk')).order_by()
+            .values('cart').annotate(total=Sum(CART_LINE_TOTAL)).values('total')
+        )
+        money = DecimalField(max_digits=12, decimal_places=2)
+        return qs.annotate(
+            line_count=Count('items'),
+            items_total=Coalesce(Subquery(totals, output_field=money), Decimal('0'), output_field=money),
+        )
     
     def item_count(self, obj):
-        if obj:
-            return obj.items.count()
-        return 0
+        return getattr(obj, 'line_count', 0)
     item_count.short_description = 'Items'
+    item_count.admin_order_field = 'line_count'
     
     def get_total_price(self, obj):
-        if obj:
-            try:
-                return f"₹{obj.total_price:,.2f}"
-            except Exception:
-                return "₹0.00"
-        return "₹0.00"
-    get_total_price.short_description = 'Total Price'
\ No newline at end of file
+        return f"₹{getattr(obj, 'items_total', 0):,.2f}"
+    get_total_price.short_description = 'Total Price'
+    get_total_price.admin_order_field = 'items_total'
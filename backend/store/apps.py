@@ -6,3 +6,7 @@ class StoreConfig(AppConfig):
     name = 'store'
     verbose_name = 'Store'
 
+    def ready(self):
+        # Register outbox handlers and the coupon/pricing cache invalidation signals
+        from . import tasks  # noqa: F401
+        from .utils import coupons, pricing  # noqa: F401
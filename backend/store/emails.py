@@ -7,9 +7,10 @@ logger = logging.getLogger(__name__)
 # Configure Resend with the API key from settings
 resend.api_key = settings.RESEND_API_KEY
 
-def send_otp_email(to_email, otp_code):
+def send_otp_email(to_email, otp_code, fail_silently=True):
     """
     Sends an OTP code to the specified email using Resend.
+    With fail_silently=False errors are re-raised (so the outbox can retry).
     """
     try:
         # Check if API key is configured
@@ -42,7 +43,49 @@ def send_otp_email(to_email, otp_code):
 
     except Exception as e:
         logger.error(f"Failed to send email to {to_email}: {str(e)}")
+        if not fail_silently:
+            raise
         # In development, print to console as fallback
         if settings.DEBUG:
             print(f"--- FAILED TO SEND EMAIL. OTP for {to_email}: {otp_code} ---")
-        return None
\ No newline at end of file
+        return None
+
+ORDER_STATUS_MESSAGES = {
+    'shipped': "Your order is on its way.",
+    'delivered': "Your order has been delivered. We hope you love it!",
+    'cancelled': "Your order has been cancelled. Any payment made will be refunded.",
+}
+
+def send_order_status_email(to_email, order_id, order_status, tracking_number='', fail_silently=True):
+    """
+    Tells a customer their order moved to `order_status` (see ORDER_STATUS_MESSAGES).
+    """
+    try:
+        if not settings.RESEND_API_KEY:
+            logger.warning(f"RESEND_API_KEY not configured; not sending order {order_id} {order_status} email to {to_email}")
+            return {"id": "mock-id", "success": True}
+
+        short_id = str(order_id)[:8].upper()
+        tracking = f"<p>Tracking number: <strong>{tracking_number}</strong></p>" if tracking_number else ""
+        params = {
+            "from": "Aura Fashion <onboarding@resend.dev>",
+            "to": [to_email],
+            "subject": f"Order #{short_id} {order_status} - Aura Fashion",
+            "html": f"""
+                <div style="font-family: sans-serif; max-width: 600px; margin: 0 auto;">
+                    <h2 style="color: #333;">Order #{short_id}</h2>
+                    <p>{ORDER_STATUS_MESSAGES.get(order_status, f"Your order is now {order_status}.")}</p>
+                    {tracking}
+                </div>
+            """
+        }
+
+        email = resend.Emails.send(params)
+        logger.info(f"Order status email sent to {to_email} for order {order_id}: {email}")
+        return email
+
+    except Exception as e:
+        logger.error(f"Failed to send order status email to {to_email}: {str(e)}")
+        if not fail_silently:
+            raise
+        return None
@@ -0,0 +1,39 @@
+"""
+Move old finished orders out of the hot order tables into ArchivedOrder.
+
+    python manage.py archive_orders                     # ORDER_ARCHIVE_AFTER_DAYS
+    python manage.py archive_orders --older-than-days 365 --limit 10000
+    python manage.py archive_orders --dry-run
+
+Delivered, cancelled and refunded orders without an open return, placed and
+last changed before the cutoff, are archived in batched transactions, so the
+command can run on a schedule next to live traffic and be stopped at any time.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from store.utils import archive
+
+
+class Command(BaseCommand):
+    help = 'Archive delivered/cancelled/refunded orders older than a given age'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=None,
+            help=f'Age cutoff in days (default ORDER_ARCHIVE_AFTER_DAYS, {getattr(settings, "ORDER_ARCHIVE_AFTER_DAYS", 180)})',
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help='Orders per transaction (default ORDER_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after archiving this many orders')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the orders that would be archived')
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        if days is not None and days < 1:
+            raise CommandError('--older-than-days must be at least 1')
+        before = archive.cutoff(days)
+        if options['dry_run']:
+            count = archive.candidates(before).count()
+            self.stdout.write(f'{count} order(s) placed before {before:%Y-%m-%d %H:%M} would be archived')
+            return
+        count = archive.archive(before, batch_size=options['batch_size'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {count} order(s) placed before {before:%Y-%m-%d %H:%M}'))
@@ -0,0 +1,32 @@
+"""
+Write-behind flusher for the Redis cart store (CART_ENGINE='redis').
+Persists dirty carts to Cart/CartItem in batches.
+"""
+import time
+from django.core.management.base import BaseCommand
+from store.utils.cart_store import flush_dirty_carts
+from store.utils.cache_backend import RedisUnavailable
+
+
+class Command(BaseCommand):
+    help = 'Persist carts changed in Redis to the database in batches (write-behind)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='Carts flushed per transaction')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when nothing is dirty')
+        parser.add_argument('--once', action='store_true', help='Drain the dirty set once and exit')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            try:
+                flushed = flush_dirty_carts(batch_size=batch_size)
+            except RedisUnavailable as e:
+                self.stderr.write(self.style.WARNING(f'Redis unavailable: {e}'))
+                flushed = 0
+            if flushed:
+                self.stdout.write(f'Flushed {flushed} cart(s)')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
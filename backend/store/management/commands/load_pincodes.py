@@ -0,0 +1,35 @@
+"""
+Compile a pincode CSV into the index file every worker reads (PINCODE_INDEX_PATH).
+
+    pincode,zone,eta_min_days,eta_max_days,cod
+    110001,A,1,2,1
+    793001,E,5,8,0
+
+The file is replaced atomically; running workers switch to it within
+PINCODE_INDEX_CHECK_SECONDS.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from store.utils import pincodes
+
+
+class Command(BaseCommand):
+    help = 'Load a pincode/zone/ETA CSV into the memory-mapped pincode index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV with pincode, zone, eta_min_days, eta_max_days and optional cod columns')
+        parser.add_argument('--output', help='Index file to write (default: PINCODE_INDEX_PATH)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            rows = pincodes.read_csv(options['file'])
+            count, zones = pincodes.write_index(rows, options['output'])
+        except OSError as e:
+            raise CommandError(f'Cannot load pincodes: {e}')
+        except pincodes.PincodeIndexError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} pincode(s) in {len(zones)} zone(s) ({", ".join(zones)}) '
+            f'to {options["output"] or pincodes.index_path()} in {time.monotonic() - started:.1f}s'
+        ))
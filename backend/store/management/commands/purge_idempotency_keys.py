@@ -0,0 +1,17 @@
+"""
+Delete expired Idempotency-Key records. Expired records are already ignored
+(and taken over) by new requests; this only keeps the table small.
+"""
+from django.core.management.base import BaseCommand
+from store.utils.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency records in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        removed = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired idempotency record(s)'))
@@ -0,0 +1,27 @@
+"""
+Print Razorpay gateway call metrics (counts, errors, retries, latency buckets)
+collected by store.utils.razorpay_utils across all processes.
+
+    python manage.py razorpay_stats
+    python manage.py razorpay_stats --reset
+"""
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from store.utils import razorpay_utils
+
+
+class Command(BaseCommand):
+    help = 'Show Razorpay gateway latency and error metrics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Clear the counters after printing them')
+
+    def handle(self, *args, **options):
+        figures = razorpay_utils.stats()
+        for operation, values in figures.items():
+            self.stdout.write(f'{operation} ' + ' '.join(f'{key}={value}' for key, value in values.items()))
+        if options['reset']:
+            cache.delete_many([
+                f'{razorpay_utils.METRICS_PREFIX}:{operation}:{name}'
+                for operation, values in figures.items() for name in [*values, 'total_ms'] if name != 'avg_ms'
+            ])
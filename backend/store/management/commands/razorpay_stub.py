@@ -0,0 +1,157 @@
+"""
+Minimal local stand-in for the Razorpay API, for development and load tests.
+
+    python manage.py razorpay_stub --port 8090 --fail-rate 0.2 --delay-ms 50
+    RAZORPAY_BASE_URL=http://127.0.0.1:8090 python manage.py runserver
+
+Serves the calls the store makes: POST /v1/orders, GET /v1/orders (by
+?receipt=), GET /v1/orders/<id> and GET /v1/payments/<id>. A payment id
+`pay_<x>` is a captured payment of order `order_<x>` for its full amount.
+--fail-rate answers that share of requests with a 503 *after* handling
+them, which is the ambiguous failure the client's retries must survive.
+Tests run a StubServer on a free port and queue exact outcomes in
+`server.script` instead.
+"""
+import json
+import time
+import uuid
+import random
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from django.core.management.base import BaseCommand, CommandError
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    The stub's HTTP server and its state. `script` holds outcomes for the
+    next requests, in order: 'fail' answers 503 after handling the request,
+    'reject' answers 503 without handling it, a number delays the reply by
+    that many seconds. Once it is empty, fail_rate and delay apply.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, fail_rate=0.0, delay=0.0, log=None):
+        super().__init__(address, _Handler)
+        self.orders = {}
+        self.lock = threading.Lock()
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.log = log
+        self.script = deque()
+        self.requests = []
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def next_step(self, request_line):
+        """('ok' | 'fail' | 'reject', delay in seconds) for the request being handled."""
+        with self.lock:
+            self.requests.append(request_line)
+            step = self.script.popleft() if self.script else None
+        if step is None:
+            return 'fail' if random.random() < self.fail_rate else 'ok', self.delay
+        if isinstance(step, str):
+            return step, 0.0
+        return 'ok', step
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        if self.server.log:
+            self.server.log(f'{self.command} {self.path} -> {format % args}')
+
+    def _rejected(self):
+        """Take this request's step from the server; True (and a 503 sent) if it is rejected."""
+        self.step, self.delay = self.server.next_step(f'{self.command} {self.path}')
+        if self.step == 'reject':
+            self._reply(503, {'error': {'code': 'SERVER_ERROR', 'description': 'Stub rejected the request'}})
+        return self.step == 'reject'
+
+    def _reply(self, status, body):
+        if status < 400 and self.step == 'fail':
+            status, body = 503, {'error': {'code': 'SERVER_ERROR', 'description': 'Stub failure'}}
+        payload = json.dumps(body).encode()
+        time.sleep(self.delay)
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and went away
+
+    def _not_found(self):
+        self._reply(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}})
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        if self._rejected():
+            return
+        if urlsplit(self.path).path.rstrip('/') != '/v1/orders':
+            return self._not_found()
+        if not isinstance(data.get('amount'), int) or data['amount'] < 100:
+            return self._reply(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The amount must be at least INR 1.00'}})
+        order = {
+            'id': f'order_{uuid.uuid4().hex[:14]}', 'entity': 'order', 'amount': data['amount'],
+            'amount_paid': 0, 'amount_due': data['amount'], 'currency': data.get('currency', 'INR'),
+            'receipt': data.get('receipt'), 'status': 'created', 'notes': data.get('notes', {}),
+            'created_at': int(time.time()),
+        }
+        with self.server.lock:
+            self.server.orders[order['id']] = order
+        self._reply(200, order)
+
+    def do_GET(self):
+        if self._rejected():
+            return
+        url = urlsplit(self.path)
+        orders = self.server.orders
+        parts = url.path.strip('/').split('/')
+        if parts == ['v1', 'orders']:
+            receipt = parse_qs(url.query).get('receipt', [None])[0]
+            with self.server.lock:
+                items = [o for o in orders.values() if receipt is None or o['receipt'] == receipt]
+            return self._reply(200, {'entity': 'collection', 'count': len(items), 'items': items})
+        if len(parts) == 3 and parts[:2] == ['v1', 'orders'] and parts[2] in orders:
+            return self._reply(200, orders[parts[2]])
+        if len(parts) == 3 and parts[:2] == ['v1', 'payments'] and parts[2].startswith('pay_'):
+            order = orders.get('order_' + parts[2][len('pay_'):])
+            if order is None:
+                return self._not_found()
+            return self._reply(200, {
+                'id': parts[2], 'entity': 'payment', 'amount': order['amount'], 'currency': order['currency'],
+                'status': 'captured', 'order_id': order['id'], 'method': 'upi', 'captured': True,
+            })
+        self._not_found()
+
+
+class Command(BaseCommand):
+    help = 'Run a local Razorpay API stub (point RAZORPAY_BASE_URL at it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--fail-rate', type=float, default=0.0, help='Share of requests answered with 503 after handling them')
+        parser.add_argument('--delay-ms', type=int, default=0, help='Added latency per request')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['fail_rate'] <= 1:
+            raise CommandError('--fail-rate must be between 0 and 1')
+        server = StubServer(
+            (options['host'], options['port']), fail_rate=options['fail_rate'],
+            delay=options['delay_ms'] / 1000, log=self.stdout.write,
+        )
+        self.stdout.write(f"Razorpay stub on http://{options['host']}:{options['port']} (RAZORPAY_BASE_URL)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,17 @@
+"""
+Delete expired stock reservations. Expired holds are already ignored by stock
+checks; this only keeps the table small. Safe to run from cron at any interval.
+"""
+from django.core.management.base import BaseCommand
+from store.utils.reservations import reap
+
+
+class Command(BaseCommand):
+    help = 'Delete expired cart stock reservations in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        removed = reap(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired reservation(s)'))
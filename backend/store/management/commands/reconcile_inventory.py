@@ -0,0 +1,31 @@
+"""
+Verify stock balances against the inventory ledger.
+
+Every Product.inventory_count / ProductSize.stock_count should equal the sum of
+its InventoryMovement rows. Drift means stock was edited outside the ledger
+(raw SQL, shell, fixtures). Run periodically, e.g. nightly from cron.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from store.utils.inventory import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Check stock balances against the inventory ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Record an adjustment movement for each drifted row so the ledger matches the balance',
+        )
+
+    def handle(self, *args, **options):
+        drift = reconcile(fix=options['fix'])
+        for kind, pk, balance, ledger in drift:
+            self.stdout.write(self.style.WARNING(f'{kind} {pk}: balance {balance}, ledger {ledger} ({balance - ledger:+d})'))
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All stock balances match the ledger'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Recorded {len(drift)} reconciliation adjustment(s)'))
+        else:
+            # Non-zero exit so cron/monitoring notices
+            raise CommandError(f'{len(drift)} stock row(s) drifted from the ledger (use --fix to record adjustments)')
@@ -0,0 +1,60 @@
+"""
+Outbox worker: runs side effects recorded with store.utils.outbox.enqueue().
+
+Claims due messages with SELECT ... FOR UPDATE SKIP LOCKED (several workers
+can run at once), executes their handlers on a thread pool, retries failures
+with backoff and periodically logs backlog/lag metrics.
+"""
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from store.utils import outbox
+
+logger = logging.getLogger('store.outbox')
+
+
+class Command(BaseCommand):
+    help = 'Process the transactional outbox (emails, notifications, gateway calls)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Handler threads')
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed per round')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when nothing is due')
+        parser.add_argument('--metrics-interval', type=float, default=60.0, help='Seconds between metrics log lines')
+        parser.add_argument('--once', action='store_true', help='Drain due messages once and exit')
+        parser.add_argument('--stats', action='store_true', help='Print backlog/lag metrics and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(self._format(outbox.stats()))
+            return
+
+        processed = failed = 0
+        last_metrics = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='outbox') as pool:
+            while True:
+                messages = outbox.claim(batch_size=options['batch_size'])
+                for result in pool.map(outbox.process, messages):
+                    if result == 'done':
+                        processed += 1
+                    else:
+                        failed += 1
+
+                if time.monotonic() - last_metrics >= options['metrics_interval']:
+                    logger.info(f"{self._format(outbox.stats())} processed={processed} failed={failed}")
+                    outbox.purge_done()
+                    processed = failed = 0
+                    last_metrics = time.monotonic()
+
+                if messages:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Outbox drained: processed={processed} failed={failed}'))
+
+    @staticmethod
+    def _format(stats):
+        return ' '.join(f'{key}={value}' for key, value in stats.items())
@@ -0,0 +1,60 @@
+"""
+Move orders listed in a CSV file (e.g. a courier manifest) to a new status.
+
+The file needs an `order_id` column and may have a `tracking_number` column:
+
+    python manage.py transition_orders shipped manifest.csv
+    python manage.py transition_orders delivered delivered.csv --source courier
+"""
+import csv
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from store.models import Order
+from store.utils.order_transitions import ALLOWED_TRANSITIONS, transition
+
+
+class Command(BaseCommand):
+    help = 'Bulk-change the status of the orders listed in a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('status', choices=sorted(ALLOWED_TRANSITIONS), help='Status to move the orders to')
+        parser.add_argument('file', help='CSV file with an order_id and optional tracking_number column')
+        parser.add_argument('--source', default='manifest', help='Recorded as the source of the order events')
+        parser.add_argument('--note', default='', help='Note recorded on the order events')
+        parser.add_argument('--batch-size', type=int, default=None, help='Orders per transaction')
+        parser.add_argument('--no-notify', action='store_true', help='Do not email customers')
+
+    def handle(self, *args, **options):
+        order_ids, tracking_numbers = self._read(options['file'])
+        found = Order.objects.filter(id__in=order_ids)
+        missing = len(order_ids) - found.count()
+
+        moved, skipped = transition(
+            found, options['status'], source=options['source'], note=options['note'],
+            tracking_numbers=tracking_numbers, notify=not options['no_notify'],
+            batch_size=options['batch_size'],
+        )
+        for pk, current in skipped.items():
+            self.stdout.write(self.style.WARNING(f'{pk}: cannot move from {current} to {options["status"]}'))
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} order id(s) not found'))
+        self.stdout.write(self.style.SUCCESS(f'Moved {len(moved)} order(s) to {options["status"]}'))
+
+    def _read(self, path):
+        order_ids, tracking_numbers = [], {}
+        try:
+            with open(path, newline='') as f:
+                reader = csv.DictReader(f)
+                if 'order_id' not in (reader.fieldnames or []):
+                    raise CommandError('The file needs an order_id column')
+                for line, row in enumerate(reader, start=2):
+                    try:
+                        order_id = uuid.UUID(row['order_id'].strip())
+                    except ValueError:
+                        raise CommandError(f'Line {line}: invalid order id {row["order_id"]!r}')
+                    order_ids.append(order_id)
+                    if (row.get('tracking_number') or '').strip():
+                        tracking_numbers[order_id] = row['tracking_number'].strip()
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+        return order_ids, tracking_numbers
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_cart_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=80)),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('size', 'Product Size')], max_length=10)),
+                ('ref_id', models.PositiveBigIntegerField(help_text='Product or ProductSize id holding the stock')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'ref_id', 'expires_at'], name='store_stock_kind_769bd2_idx'), models.Index(fields=['expires_at'], name='store_stock_expires_f1477d_idx')],
+                'unique_together': {('owner', 'kind', 'ref_id')},
+            },
+        ),
+    ]
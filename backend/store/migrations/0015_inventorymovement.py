@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    """Seed the ledger with current stock so balances reconcile from day one."""
+    Product = apps.get_model('store', 'Product')
+    ProductSize = apps.get_model('store', 'ProductSize')
+    InventoryMovement = apps.get_model('store', 'InventoryMovement')
+
+    movements = [
+        InventoryMovement(kind='product', ref_id=pk, delta=stock, reason='adjustment', note='Opening balance')
+        for pk, stock in Product.objects.exclude(inventory_count=0).values_list('id', 'inventory_count').iterator()
+    ] + [
+        InventoryMovement(kind='size', ref_id=pk, delta=stock, reason='adjustment', note='Opening balance')
+        for pk, stock in ProductSize.objects.exclude(stock_count=0).values_list('id', 'stock_count').iterator()
+    ]
+    InventoryMovement.objects.bulk_create(movements, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('size', 'Product Size')], max_length=10)),
+                ('ref_id', models.PositiveBigIntegerField(help_text='Product or ProductSize id holding the stock')),
+                ('delta', models.IntegerField(help_text='Signed change in units (negative for sales)')),
+                ('reason', models.CharField(choices=[('sale', 'Sale'), ('cancel', 'Order Cancelled'), ('return', 'Return'), ('restock', 'Restock'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_movements', to='store.order')),
+                ('order_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_movements', to='store.orderitem')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['kind', 'ref_id'], name='store_inven_kind_b36652_idx'), models.Index(fields=['order', 'reason'], name='store_inven_order_i_ecb2c3_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:04
+
+from django.db import migrations, models
+
+
+def backfill_product_images(apps, schema_editor):
+    """Snapshot the current primary image for order items placed before this field existed."""
+    OrderItem = apps.get_model('store', 'OrderItem')
+    ProductImage = apps.get_model('store', 'ProductImage')
+
+    # One image per product: primary first, then by sort order (first row per product wins)
+    images = {}
+    for product_id, name in (
+        ProductImage.objects.order_by('product_id', '-is_primary', 'sort_order', 'id')
+        .values_list('product_id', 'image').iterator()
+    ):
+        images.setdefault(product_id, name)
+
+    batch = []
+    for item in OrderItem.objects.filter(product_image='').only('id', 'product_id', 'variant_product_id').iterator():
+        name = images.get(item.variant_product_id) or images.get(item.product_id)
+        if name:
+            item.product_image = name
+            batch.append(item)
+        if len(batch) >= 1000:
+            OrderItem.objects.bulk_update(batch, ['product_image'])
+            batch = []
+    if batch:
+        OrderItem.objects.bulk_update(batch, ['product_image'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_image',
+            field=models.ImageField(blank=True, max_length=255, upload_to='products/'),
+        ),
+        migrations.RunPython(backfill_product_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_order_user_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('order', 'Order Status'), ('payment', 'Payment Status')], max_length=10)),
+                ('status', models.CharField(help_text='Status moved to', max_length=20)),
+                ('previous_status', models.CharField(blank=True, help_text='Empty for the initial status', max_length=20)),
+                ('source', models.CharField(blank=True, help_text='checkout, payment, customer, admin, ...', max_length=30)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, help_text='Empty for system changes', null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='store.order')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='store_order_status_765f15_idx'), models.Index(fields=['order', 'created_at'], name='store_order_order_i_db1d2e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_orderevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupState',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup_state', serialize=False, to='store.order')),
+                ('counted', models.BooleanField(default=False, help_text='The sale is included in the rollups')),
+                ('returned_items', models.JSONField(default=list, help_text='Ids of order items counted as returned')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('dimension', models.CharField(choices=[('product', 'Product'), ('category', 'Category'), ('brand', 'Brand'), ('payment_method', 'Payment Method')], max_length=20)),
+                ('key', models.CharField(help_text='Product, category or brand id, or the payment method', max_length=64)),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('gross', models.DecimalField(decimal_places=2, default=0, help_text='Units x price at purchase', max_digits=14)),
+                ('discount', models.DecimalField(decimal_places=2, default=0, help_text='Order discounts, allocated by line value', max_digits=14)),
+                ('tax', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('returned_units', models.IntegerField(default=0)),
+                ('returned_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales',
+                'indexes': [models.Index(fields=['dimension', 'date'], name='store_daily_dimensi_209615_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key', 'date'), name='unique_daily_sales_row')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:27
+
+import store.utils.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_archived_order'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='id',
+            field=models.UUIDField(default=store.utils.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='returnrequest',
+            name='id',
+            field=models.UUIDField(default=store.utils.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -1,12 +1,20 @@
 import uuid
+from decimal import Decimal
 from django.db import models
+from django.db.models import (
+    Case, When, F, Value, Sum, Count, Prefetch, OuterRef, Subquery, ExpressionWrapper, DecimalField
+)
+from django.db.models.functions import Coalesce, NullIf
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from mptt.models import MPTTModel, TreeForeignKey
 
+from .utils.ids import uuid7
+
 # -----------------------------------------------------------------------------
 # 1. ABSTRACT BASE MODELS
 # -----------------------------------------------------------------------------
@@ -230,6 +238,12 @@ class Product(TimeStampedModel):
     def final_price(self):
         return self.discount_price if self.discount_price else self.price
 
+    @property
+    def primary_image(self):
+        """Primary image, else the first one; uses prefetched `images` when present."""
+        images = list(self.images.all())
+        return next((img for img in images if img.is_primary), images[0] if images else None)
+
     @property
     def discount_percentage(self):
         if self.discount_price and self.price > 0:
@@ -357,14 +371,62 @@ class Coupon(models.Model):
 
 class Cart(TimeStampedModel):
     user = models.ForeignKey(User, related_name='cart', on_delete=models.CASCADE)
-    # Could add 'session_key' here for guest checkout in future
+    # Guest carts live in the cache keyed by an opaque token (see utils/guest_carts.py)
+    # Bumped on every write-behind flush so stale snapshots never overwrite newer ones
+    version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f"Cart for {self.user.email}"
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.items.total()
+
+
+def _final_price_sql(prefix):
+    """SQL twin of Product.final_price: discount price unless missing/zero, else MRP."""
+    return Coalesce(NullIf(F(f'{prefix}__discount_price'), Value(Decimal('0'))), F(f'{prefix}__price'))
+
+
+# Line total computed in the database (variant product price if chosen, else product price)
+CART_LINE_TOTAL = ExpressionWrapper(
+    Case(
+        When(variant_product__isnull=False, then=_final_price_sql('variant_product')),
+        default=_final_price_sql('product'),
+    ) * F('quantity'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def active_related_variants(lookup='related_variants'):
+    """Prefetch active related variants with everything ProductVariantSerializer reads."""
+    return Prefetch(
+        lookup,
+        queryset=ProductVariant.objects.filter(is_active=True)
+            .select_related('variant_product__brand', 'variant_product__category')
+            .prefetch_related('variant_product__images'),
+    )
+
+
+class CartItemQuerySet(models.QuerySet):
+    def with_line_totals(self):
+        return self.annotate(line_total=CART_LINE_TOTAL)
+
+    def for_display(self):
+        """Everything CartItemSerializer touches, loaded in a fixed number of queries."""
+        return self.select_related(
+            'product__brand', 'product__category',
+            'variant_product__brand', 'variant_product__category',
+            'selected_size',
+            'variant__variant_product__brand', 'variant__variant_product__category',
+        ).prefetch_related(
+            'product__images', 'variant_product__images', 'variant__variant_product__images',
+            active_related_variants('variant__related_variants'),
+        ).with_line_totals()
+
+    def total(self):
+        total = self.aggregate(total=Sum(CART_LINE_TOTAL))['total'] or Decimal('0')
+        return total.quantize(Decimal('0.01'))
 
 
 class CartItem(models.Model):
@@ -381,20 +443,76 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         ordering = ['added_at']
 
     @property
     def total_price(self):
+        # Prefer the SQL-computed total when loaded through with_line_totals()
+        line_total = getattr(self, 'line_total', None)
+        if line_total is not None:
+            return line_total
         # Use variant_product if selected, otherwise use main product
         product_to_price = self.variant_product if self.variant_product else self.product
-        price = product_to_price.final_price
-        
-        # Backward compatibility: if old variant exists, use its price adjustment
-        if self.variant:
-            price += self.variant.price_adjustment
-            
-        return price * self.quantity
+        return product_to_price.final_price * self.quantity
+
+
+class StockReservation(models.Model):
+    """
+    Time-limited soft hold on stock placed when a cart line is added/changed.
+    Available-to-sell = stock - live (unexpired) reservations of other owners.
+    """
+    KIND_CHOICES = [
+        ('product', _('Product')),
+        ('size', _('Product Size')),
+    ]
+
+    # 'user:<id>' or 'guest:<cart token>'
+    owner = models.CharField(max_length=80)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    ref_id = models.PositiveBigIntegerField(help_text="Product or ProductSize id holding the stock")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'kind', 'ref_id')
+        indexes = [
+            models.Index(fields=['kind', 'ref_id', 'expires_at']),
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} holds {self.quantity} of {self.kind} {self.ref_id}"
+
+
+class OrderQuerySet(models.QuerySet):
+    def for_display(self):
+        """Everything OrderSerializer touches, loaded in a fixed number of queries."""
+        return_requests = ReturnRequest.objects.select_related('order_item')
+        return self.select_related('shipping_address').prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product').prefetch_related(
+                Prefetch('reviews', queryset=Review.objects.select_related('user', 'product')),
+                Prefetch('return_requests', queryset=return_requests),
+            )),
+            Prefetch('return_requests', queryset=return_requests),
+        )
+
+    def summaries(self):
+        """
+        Lightweight projection for order lists: item count/quantity and the
+        first item's name and image, computed in the same single query.
+        """
+        first_item = OrderItem.objects.filter(order=OuterRef('pk')).order_by('id')
+        return self.only(
+            'id', 'created_at', 'order_status', 'payment_status', 'payment_method', 'total_amount',
+        ).annotate(
+            item_count=Count('items'),
+            item_quantity=Sum('items__quantity'),
+            first_item_name=Subquery(first_item.values('product_name')[:1]),
+            first_item_image=Subquery(first_item.values('product_image')[:1]),
+        )
 
 
 class Order(TimeStampedModel):
@@ -412,7 +530,8 @@ class Order(TimeStampedModel):
         ('failed', _('Failed')),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Time-ordered (see utils/ids.py); orders placed before the switch keep their uuid4 ids
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     user = models.ForeignKey(User, related_name='orders', on_delete=models.PROTECT)
     
     # Snapshot of address at time of order (In production, maybe copy fields to JSON or dedicated text fields)
@@ -440,9 +559,15 @@ class Order(TimeStampedModel):
     
     tracking_number = models.CharField(max_length=100, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True, help_text="Timestamp when order was marked as delivered")
-    
+
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Per-user history, newest first (cursor pagination)
+            models.Index(fields=['user', '-created_at']),
+        ]
 
     def __str__(self):
         return f"Order {self.id}"
@@ -485,7 +610,9 @@ class OrderItem(models.Model):
     variant_name = models.CharField(max_length=255, blank=True)
     price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
     tax_at_purchase = models.DecimalField(max_digits=5, decimal_places=2, default=0)
-    
+    # Points at the product's image file as it was at purchase; nothing is uploaded
+    product_image = models.ImageField(upload_to='products/', blank=True, max_length=255)
+
     quantity = models.PositiveIntegerField(default=1)
 
     def save(self, *args, **kwargs):
@@ -493,16 +620,18 @@ class OrderItem(models.Model):
         if not self.product_name:
             product_to_use = self.variant_product if self.variant_product else self.product
             self.product_name = product_to_use.title
+        if not self.product_image:
+            image = (self.variant_product or self.product).primary_image or self.product.primary_image
+            self.product_image = image.image.name if image else ''
         if not self.price_at_purchase:
+            # Same unit price and GST as utils/pricing.py (checkout passes both in)
             product_to_use = self.variant_product if self.variant_product else self.product
-            base = product_to_use.final_price
-            # Backward compatibility
             if self.variant:
-                base += self.variant.price_adjustment
-                self.variant_name = f"{self.variant.size} {self.variant.color}"
+                self.variant_name = self.variant.difference
             elif self.selected_size:
                 self.variant_name = f"Size: {self.selected_size}"
-            self.price_at_purchase = base
+            self.price_at_purchase = product_to_use.final_price
+            self.tax_at_purchase = product_to_use.tax_percent
         super().save(*args, **kwargs)
 
     @property
@@ -513,6 +642,211 @@ class OrderItem(models.Model):
         return f"{self.quantity} x {self.product_name}"
 
 
+class InventoryMovement(models.Model):
+    """
+    Append-only stock ledger. Every change to Product.inventory_count or
+    ProductSize.stock_count is recorded here (see utils/inventory.py), so the
+    balance of a stock row always equals the sum of its movements.
+    """
+    REASON_CHOICES = [
+        ('sale', _('Sale')),
+        ('cancel', _('Order Cancelled')),
+        ('return', _('Return')),
+        ('restock', _('Restock')),
+        ('adjustment', _('Adjustment')),
+    ]
+
+    kind = models.CharField(max_length=10, choices=StockReservation.KIND_CHOICES)
+    ref_id = models.PositiveBigIntegerField(help_text="Product or ProductSize id holding the stock")
+    delta = models.IntegerField(help_text="Signed change in units (negative for sales)")
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    order = models.ForeignKey(Order, null=True, blank=True, related_name='inventory_movements', on_delete=models.SET_NULL)
+    order_item = models.ForeignKey(OrderItem, null=True, blank=True, related_name='inventory_movements', on_delete=models.SET_NULL)
+    created_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['kind', 'ref_id']),
+            models.Index(fields=['order', 'reason']),
+        ]
+
+    def __str__(self):
+        return f"{self.reason} {self.delta:+d} on {self.kind} {self.ref_id}"
+
+
+class OrderEvent(models.Model):
+    """
+    Append-only timeline of order and payment status transitions, written in
+    bulk alongside every status change (see utils/order_events.py).
+    """
+    KIND_CHOICES = [
+        ('order', _('Order Status')),
+        ('payment', _('Payment Status')),
+    ]
+
+    order = models.ForeignKey(Order, related_name='events', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, help_text="Status moved to")
+    previous_status = models.CharField(max_length=20, blank=True, help_text="Empty for the initial status")
+    actor = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, help_text="Empty for system changes")
+    source = models.CharField(max_length=30, blank=True, help_text="checkout, payment, customer, admin, ...")
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            # "What moved to shipped in the last hour" and per-order timelines are range scans
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['order', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id} {self.kind}: {self.previous_status or '-'} -> {self.status}"
+
+
+class ArchivedOrder(models.Model):
+    """
+    An old delivered/cancelled/refunded order moved out of the hot order
+    tables by `manage.py archive_orders` (see utils/archive.py). The order,
+    its items, return requests and events are kept as one JSON snapshot;
+    the columns are what lists and admin search filter on.
+    """
+    id = models.UUIDField(primary_key=True, editable=False, help_text="The original order id")
+    user = models.ForeignKey(User, related_name='archived_orders', on_delete=models.PROTECT)
+    created_at = models.DateTimeField(help_text="When the order was placed")
+    order_status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    payment_status = models.CharField(max_length=20, choices=Order.PAYMENT_STATUS_CHOICES)
+    payment_method = models.CharField(max_length=50)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.id}"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    First response to a request sent with an `Idempotency-Key` header, kept
+    until `expires_at` so client retries are answered from here instead of
+    re-running the handler (see utils/idempotency.py).
+    """
+    STATUS_CHOICES = [
+        ('processing', _('Processing')),
+        ('completed', _('Completed')),
+    ]
+
+    user = models.ForeignKey(User, related_name='idempotency_records', on_delete=models.CASCADE)
+    # Endpoint the key was used on, so one key cannot replay another endpoint's response
+    scope = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the request body")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'scope', 'key')
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status})"
+
+
+class OutboxMessage(models.Model):
+    """
+    Transactional outbox: side effects (emails, notifications, gateway calls)
+    are written here in the same transaction as the business change and run
+    later by `manage.py run_outbox_worker` (see utils/outbox.py).
+    """
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('processing', _('Processing')),
+        ('done', _('Done')),
+        ('dead', _('Dead')),
+    ]
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now, help_text="Not run before this time (retry backoff)")
+    locked_at = models.DateTimeField(null=True, blank=True, help_text="When a worker claimed it")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id} ({self.status})"
+
+
+class DailySales(models.Model):
+    """
+    Pre-aggregated sales for one day and one product, category, brand or
+    payment method, kept up to date by utils/rollups.py.
+    """
+    DIMENSION_CHOICES = [
+        ('product', _('Product')),
+        ('category', _('Category')),
+        ('brand', _('Brand')),
+        ('payment_method', _('Payment Method')),
+    ]
+
+    date = models.DateField()
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=64, help_text="Product, category or brand id, or the payment method")
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    gross = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Units x price at purchase")
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0, help_text="Order discounts, allocated by line value")
+    tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    returned_units = models.IntegerField(default=0)
+    returned_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'Daily sales'
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key', 'date'], name='unique_daily_sales_row'),
+        ]
+        indexes = [
+            models.Index(fields=['dimension', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.dimension}={self.key}"
+
+
+class SalesRollupState(models.Model):
+    """What an order currently contributes to DailySales, so refreshes only apply the difference."""
+    order = models.OneToOneField(Order, primary_key=True, related_name='rollup_state', on_delete=models.CASCADE)
+    counted = models.BooleanField(default=False, help_text="The sale is included in the rollups")
+    returned_items = models.JSONField(default=list, help_text="Ids of order items counted as returned")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Rollup state for order {self.order_id}"
+
+
 # -----------------------------------------------------------------------------
 # 5. USER INTERACTION
 # -----------------------------------------------------------------------------
@@ -556,7 +890,7 @@ class ReturnRequest(TimeStampedModel):
         ('completed', 'Completed'),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     order = models.ForeignKey('Order', related_name='return_requests', on_delete=models.CASCADE)
     order_item = models.ForeignKey(OrderItem, related_name='return_requests', on_delete=models.CASCADE, null=True, blank=True, help_text="Specific item being returned")
     user = models.ForeignKey(User, related_name='return_requests', on_delete=models.CASCADE)
@@ -1,10 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.core.files.storage import default_storage
 from .models import (
     Address, Category, Brand, Product, ProductImage, ProductSize, ProductVariant,
     Wishlist, Cart, CartItem, Order, OrderItem, Review, Coupon, ReturnRequest
 )
+from .utils import pincodes
 import logging
 
 logger = logging.getLogger(__name__)
@@ -42,6 +44,13 @@ class AddressSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id', 'user')
 
+    def validate_pincode(self, value):
+        if pincodes.normalize(value) is None:
+            raise serializers.ValidationError("Enter a valid 6-digit pincode.")
+        if not pincodes.is_serviceable(value):
+            raise serializers.ValidationError("We do not deliver to this pincode yet.")
+        return str(pincodes.normalize(value))
+
 # -----------------------------------------------------------------------------
 # 3. REVIEWS (Moved up to be accessible by ProductDetail)
 # -----------------------------------------------------------------------------
@@ -208,9 +217,9 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         """Get the primary image of the variant product"""
         if obj and obj.variant_product:
             try:
-                img = obj.variant_product.images.filter(is_primary=True).first()
-                if not img and obj.variant_product.images.exists():
-                    img = obj.variant_product.images.first()
+                # Iterate .all() so prefetched images are used instead of new queries
+                images = list(obj.variant_product.images.all())
+                img = next((i for i in images if i.is_primary), images[0] if images else None)
                 
                 if img and img.image:
                     request = self.context.get('request')
@@ -224,7 +233,11 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         if not obj:
             return []
         
-        related = obj.related_variants.filter(is_active=True).distinct()
+        if 'related_variants' in getattr(obj, '_prefetched_objects_cache', {}):
+            # Loaded via models.active_related_variants(), already filtered
+            related = obj.related_variants.all()
+        else:
+            related = obj.related_variants.filter(is_active=True).distinct()
         
         # Use a simple serializer without related_variants to prevent recursion
         serializer = ProductVariantSerializer(
@@ -328,21 +341,11 @@ class CartItemSerializer(serializers.ModelSerializer):
         if not product.is_active:
              raise serializers.ValidationError("This product is no longer active.")
 
-        # Check stock based on size if size is selected
-        if selected_size:
-            if selected_size.product != product:
-                raise serializers.ValidationError("Invalid size for this product.")
-            if selected_size.stock_count < quantity:
-                raise serializers.ValidationError(f"Only {selected_size.stock_count} units available in size {selected_size.size}.")
-        # Check variant product stock if variant is selected
-        elif variant_product:
-            if variant_product.inventory_count < quantity:
-                raise serializers.ValidationError(f"Only {variant_product.inventory_count} units available.")
-        # Check main product stock if no size/variant selected
-        else:
-            if product.inventory_count < quantity:
-                raise serializers.ValidationError(f"Only {product.inventory_count} units available.")
+        if selected_size and selected_size.product != product:
+            raise serializers.ValidationError("Invalid size for this product.")
 
+        # Stock is checked by the cart view against the whole cart, net of
+        # other shoppers' reservations (CartViewSet._stock_errors)
         return data
 
 class CartSerializer(serializers.ModelSerializer):
@@ -353,6 +356,45 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ('id', 'items', 'total_price', 'updated_at')
 
+
+class StoredCartItemSerializer(CartItemSerializer):
+    """
+    Cart line materialised from the Redis cart store (not a DB row).
+    Its id is the opaque line key, which update_item/remove_item accept back.
+    """
+    id = serializers.CharField(read_only=True)
+
+    class Meta(CartItemSerializer.Meta):
+        pass
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """One operation of a /cart/batch/ request. Ids are validated in bulk by the view."""
+    op = serializers.ChoiceField(choices=('add', 'update', 'remove'))
+    product_id = serializers.IntegerField(required=False)
+    size_id = serializers.IntegerField(required=False, allow_null=True)
+    variant_product_id = serializers.IntegerField(required=False, allow_null=True)
+    variant_id = serializers.IntegerField(required=False, allow_null=True)
+    item_id = serializers.CharField(required=False)
+    quantity = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, data):
+        if data['op'] == 'add':
+            if not data.get('product_id'):
+                raise serializers.ValidationError("product_id is required for add.")
+            data.setdefault('quantity', 1)
+        elif not data.get('item_id'):
+            raise serializers.ValidationError(f"item_id is required for {data['op']}.")
+        elif data['op'] == 'update' and not data.get('quantity'):
+            raise serializers.ValidationError("quantity is required for update.")
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=50)
+    # 'full' returns the whole cart, 'delta' only changed/removed lines plus totals
+    response = serializers.ChoiceField(choices=('full', 'delta'), default='full')
+
 # -----------------------------------------------------------------------------
 # 6. ORDERS & CHECKOUT
 # -----------------------------------------------------------------------------
@@ -391,18 +433,37 @@ class OrderItemSerializer(serializers.ModelSerializer):
         )
     
     def get_product_image(self, obj):
-        try:
-            # First try to find primary image on product
-            img = obj.product.images.filter(is_primary=True).first()
-            if not img and obj.product.images.exists():
-                img = obj.product.images.first()
-            
-            if img and img.image:
-                request = self.context.get('request')
-                return request.build_absolute_uri(img.image.url) if request else img.image.url
-        except:
+        # Snapshotted at purchase, so no image queries per item
+        if not obj.product_image:
             return None
-        return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(obj.product_image.url) if request else obj.product_image.url
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """Order list row for `?view=summary`; reads annotations from Order.objects.summaries()."""
+    item_count = serializers.IntegerField(read_only=True)
+    item_quantity = serializers.IntegerField(read_only=True)
+    first_item_name = serializers.CharField(read_only=True)
+    first_item_image = serializers.SerializerMethodField()
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Order
+        fields = (
+            'id', 'created_at', 'order_status', 'payment_status', 'payment_method', 'total_amount',
+            'item_count', 'item_quantity', 'first_item_name', 'first_item_image', 'archived'
+        )
+
+    def get_archived(self, obj):
+        return getattr(obj, 'is_archived', False)
+
+    def get_first_item_image(self, obj):
+        if not obj.first_item_image:
+            return None
+        url = default_storage.url(obj.first_item_image)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -412,15 +473,20 @@ class OrderSerializer(serializers.ModelSerializer):
         queryset=Address.objects.all(), write_only=True, source='shipping_address'
     )
     return_requests = ReturnRequestSerializer(many=True, read_only=True)
+    # True for orders read from the archive (utils/archive.py)
+    archived = serializers.SerializerMethodField()
 
     class Meta:
         model = Order
         fields = (
             'id', 'created_at', 'updated_at', 'delivered_at', 'order_status', 'payment_status', 'payment_method',
             'total_amount', 'shipping_cost', 'tax_amount', 'discount_amount',
-            'shipping_address', 'shipping_address_id', 'items', 'return_requests'
+            'shipping_address', 'shipping_address_id', 'items', 'return_requests', 'archived'
         )
         read_only_fields = (
             'order_status', 'payment_status', 'total_amount', 
             'shipping_cost', 'tax_amount', 'discount_amount', 'delivered_at'
-        )
\ No newline at end of file
+        )
+
+    def get_archived(self, obj):
+        return getattr(obj, 'is_archived', False)
\ No newline at end of file
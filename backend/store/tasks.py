@@ -0,0 +1,39 @@
+"""
+Outbox handlers. Each receives the JSON payload stored by outbox.enqueue()
+and must be safe to run more than once. Raise to have the message retried.
+"""
+import logging
+
+from .models import PasswordResetOTP, Order
+from .emails import send_otp_email, send_order_status_email
+from .utils import rollups
+from .utils.outbox import handler
+
+logger = logging.getLogger(__name__)
+
+
+@handler('email.password_reset_otp')
+def send_password_reset_otp(payload):
+    otp = PasswordResetOTP.objects.select_related('user').filter(id=payload['otp_id']).first()
+    if otp is None or not otp.is_valid():
+        # Superseded, used or expired by the time we got to it: nothing to send
+        logger.info(f"Skipping password reset email for OTP {payload['otp_id']}: no longer valid")
+        return
+    send_otp_email(otp.user.email, otp.otp, fail_silently=False)
+
+
+@handler('email.order_status')
+def send_order_status_emails(payload):
+    # One message per bulk transition batch. Orders that moved on since are
+    # skipped, and a failed send is only logged so a retry cannot re-send the
+    # rest of the batch.
+    orders = Order.objects.filter(
+        id__in=payload['order_ids'], order_status=payload['status']
+    ).select_related('user')
+    for order in orders:
+        send_order_status_email(order.user.email, order.id, payload['status'], order.tracking_number)
+
+
+@handler(rollups.TOPIC)
+def refresh_sales_rollups(payload):
+    rollups.refresh(payload['order_ids'])
@@ -0,0 +1,85 @@
+"""
+Small builders for store tests.
+
+Tests run against an in-process cache so they neither need Redis nor see
+counters and cached prices left behind by another run (see TEST_SETTINGS).
+"""
+
+from decimal import Decimal
+from itertools import count
+
+from django.test import override_settings
+
+from ..models import (
+    Address, Brand, Category, Order, OrderItem, Product, ProductImage, ProductSize, ProductVariant,
+    ReturnRequest, Review, User,
+)
+
+TEST_SETTINGS = override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'store-tests'}},
+    CART_ENGINE='db',
+)
+
+_serial = count(1)
+
+
+def user(email=None):
+    email = email or f'shopper{next(_serial)}@example.com'
+    return User.objects.create_user(username=email, email=email, password='secret-pass-123')
+
+
+def address(owner):
+    return Address.objects.create(
+        user=owner, full_name='Test Shopper', phone='9999999999', address_line_1='1 Test Street',
+        city='Bengaluru', state='Karnataka', pincode='560001',
+    )
+
+
+def product(price='500.00', images=2, sizes=(), stock=50, **fields):
+    """An active product with `images` gallery images and one ProductSize per entry of `sizes`."""
+    n = next(_serial)
+    brand, _ = Brand.objects.get_or_create(slug='test-brand', defaults={'name': 'Test Brand'})
+    category, _ = Category.objects.get_or_create(slug='test-category', defaults={'name': 'Test Category'})
+    item = Product.objects.create(
+        title=f'Product {n}', sku=f'TEST-{n}', brand=brand, category=category, description='Test product',
+        price=Decimal(price), inventory_count=stock,
+        product_type='variable' if sizes else 'simple', **fields,
+    )
+    for index in range(images):
+        ProductImage.objects.create(product=item, image=f'products/test-{n}-{index}.jpg', is_primary=index == 0, sort_order=index)
+    for index, size in enumerate(sizes):
+        ProductSize.objects.create(product=item, size=size, stock_count=stock, sort_order=index)
+    return item
+
+
+def variant(parent, difference='Blue', **product_fields):
+    """A variant product of `parent`, linked through ProductVariant."""
+    variant_product = product(**product_fields)
+    return ProductVariant.objects.create(product=parent, variant_product=variant_product, difference=difference)
+
+
+def order(owner, shipping_address, products, status='delivered', reviewed=True, returned=True):
+    """
+    A paid order of one line per product, with a review on the first line and
+    a return request on the last (when `reviewed`/`returned`).
+    """
+    placed = Order.objects.create(
+        user=owner, shipping_address=shipping_address, total_amount=Decimal('0'),
+        order_status=status, payment_status='paid', payment_method='UPI',
+    )
+    lines = [
+        OrderItem.objects.create(
+            order=placed, product=item, product_name=item.title, price_at_purchase=item.price,
+            product_image=f'products/snapshot-{item.pk}.jpg', quantity=1,
+        )
+        for item in products
+    ]
+    placed.total_amount = sum(item.price for item in products)
+    placed.save(update_fields=['total_amount'])
+    if reviewed and lines:
+        Review.objects.create(
+            product=lines[0].product, user=owner, order_item=lines[0], rating=5, title='Great', comment='Fits well',
+        )
+    if returned and lines:
+        ReturnRequest.objects.create(order=placed, order_item=lines[-1], user=owner, reason='Too small')
+    return placed
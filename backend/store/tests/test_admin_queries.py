@@ -0,0 +1,72 @@
+"""Query budgets of the admin changelists: columns read annotations, never a query per row."""
+
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import Brand, Cart, CartItem, Category
+from . import factories
+from .factories import TEST_SETTINGS
+
+# Each changelist loads the staff user, counts the filtered and the full
+# result, and reads the page in one annotated query
+# ... plus the brand and category filter choices
+PRODUCT_CHANGELIST_QUERIES = 6
+# ... plus the parent links DraggableMPTTAdmin needs for the tree
+CATEGORY_CHANGELIST_QUERIES = 5
+BRAND_CHANGELIST_QUERIES = 4
+CART_CHANGELIST_QUERIES = 4
+
+
+@TEST_SETTINGS
+class ChangelistQueryBudgetTests(TestCase):
+
+    def setUp(self):
+        admin = factories.user()
+        admin.is_staff = admin.is_superuser = True
+        admin.save()
+        self.client.force_login(admin)
+
+    def get(self, model, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse(f'admin:store_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def add_products(self, count):
+        for index in range(count):
+            factories.product(sizes=('S', 'M') if index % 2 else ())
+
+    def add_carts(self, count):
+        for _ in range(count):
+            cart = Cart.objects.create(user=factories.user())
+            for product in (factories.product(), factories.product(price='120.00')):
+                CartItem.objects.create(cart=cart, product=product, quantity=2)
+
+    def test_product_changelist_query_count_is_fixed(self):
+        self.add_products(1)
+        self.get('product', PRODUCT_CHANGELIST_QUERIES)
+        self.add_products(10)
+        response = self.get('product', PRODUCT_CHANGELIST_QUERIES)
+        self.assertContains(response, 'products/test-')  # the primary image thumbnails
+
+    def test_category_changelist_query_count_is_fixed(self):
+        factories.product()
+        self.get('category', CATEGORY_CHANGELIST_QUERIES)
+        for index in range(10):
+            parent = Category.objects.create(name=f'Category {index}', slug=f'category-{index}')
+            Category.objects.create(name=f'Child {index}', slug=f'child-{index}', parent=parent)
+        self.get('category', CATEGORY_CHANGELIST_QUERIES)
+
+    def test_brand_changelist_query_count_is_fixed(self):
+        factories.product()
+        self.get('brand', BRAND_CHANGELIST_QUERIES)
+        for index in range(10):
+            Brand.objects.create(name=f'Brand {index}', slug=f'brand-{index}')
+        self.get('brand', BRAND_CHANGELIST_QUERIES)
+
+    def test_cart_changelist_query_count_is_fixed(self):
+        self.add_carts(1)
+        self.get('cart', CART_CHANGELIST_QUERIES)
+        self.add_carts(10)
+        response = self.get('cart', CART_CHANGELIST_QUERIES)
+        self.assertContains(response, '₹1,240.00', count=11)
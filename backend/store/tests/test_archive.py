@@ -0,0 +1,81 @@
+"""Archived orders: what customers and staff see, and who may restore them."""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import Permission
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import ArchivedOrder, Order
+from ..utils import archive
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+def archived_order(owner):
+    """Place a delivered order for `owner` and move it to the archive."""
+    placed = factories.order(owner, factories.address(owner), [factories.product()], returned=False)
+    archive.archive_orders([placed.pk], before=timezone.now() + timedelta(days=1))
+    return placed
+
+
+@TEST_SETTINGS
+class ArchivedHistoryTests(APITestCase):
+
+    def setUp(self):
+        self.user = factories.user()
+        self.client.force_authenticate(self.user)
+        self.archived = archived_order(self.user)
+        factories.order(self.user, factories.address(self.user), [factories.product()])
+
+    def test_hot_lists_report_archived_orders(self):
+        for url in ('/api/v1/orders/', '/api/v1/orders/?view=summary'):
+            response = self.client.get(url)
+            self.assertEqual(len(response.data['results']), 1)
+            self.assertEqual(response.data['archived_count'], 1)
+
+    def test_archived_list_and_detail(self):
+        response = self.client.get('/api/v1/orders/?archived=true')
+        self.assertEqual([row['id'] for row in response.data['results']], [str(self.archived.pk)])
+        detail = self.client.get(f'/api/v1/orders/{self.archived.pk}/')
+        self.assertEqual(detail.status_code, 200)
+        self.assertTrue(detail.data['archived'])
+
+    def test_export_flags_excluded_archived_orders(self):
+        staff = factories.user()
+        staff.is_staff = True
+        staff.save()
+        self.client.force_authenticate(staff)
+        response = self.client.get('/api/v1/orders/export/?kind=orders&output=jsonl')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+        self.assertEqual(response['X-Archived-Orders-Excluded'], '1')
+
+
+@TEST_SETTINGS
+class RestorePermissionTests(TestCase):
+
+    def setUp(self):
+        self.archived = archived_order(factories.user())
+        self.staff = factories.user()
+        self.staff.is_staff = True
+        self.staff.save()
+        self.staff.user_permissions.add(Permission.objects.get(codename='view_archivedorder'))
+        self.client.force_login(self.staff)
+
+    def restore(self):
+        return self.client.post('/admin/store/archivedorder/', {
+            'action': 'restore_orders', '_selected_action': [str(self.archived.pk)],
+        })
+
+    def test_view_only_staff_cannot_restore(self):
+        self.restore()
+        self.assertTrue(ArchivedOrder.objects.filter(pk=self.archived.pk).exists())
+        self.assertFalse(Order.objects.filter(pk=self.archived.pk).exists())
+
+    def test_order_change_permission_allows_restore(self):
+        self.staff.user_permissions.add(Permission.objects.get(codename='change_order'))
+        self.restore()
+        self.assertFalse(ArchivedOrder.objects.filter(pk=self.archived.pk).exists())
+        self.assertTrue(Order.objects.filter(pk=self.archived.pk).exists())
@@ -0,0 +1,60 @@
+"""Query budget of the cart endpoint: the count must not grow with the number of lines."""
+
+from decimal import Decimal
+
+from rest_framework.test import APITestCase
+
+from ..models import Cart, CartItem
+from . import factories
+from .factories import TEST_SETTINGS
+
+# cart; items joined to products, sizes and variants; images of products,
+# of variant products and of related variants' products; related variants;
+# SQL cart total
+CART_QUERIES = 7
+
+
+@TEST_SETTINGS
+class CartQueryBudgetTests(APITestCase):
+
+    def setUp(self):
+        self.user = factories.user()
+        self.cart = Cart.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+
+    def add_lines(self, count):
+        """`count` lines cycling through sized, variant and plain products, each with images."""
+        for index in range(count):
+            kind = index % 3
+            if kind == 0:
+                product = factories.product(sizes=('S', 'M', 'L'))
+                CartItem.objects.create(cart=self.cart, product=product, selected_size=product.sizes.first(), quantity=2)
+            elif kind == 1:
+                parent = factories.product()
+                link = factories.variant(parent, price='650.00')
+                CartItem.objects.create(
+                    cart=self.cart, product=parent, variant_product=link.variant_product, variant=link, quantity=1,
+                )
+            else:
+                CartItem.objects.create(cart=self.cart, product=factories.product(images=3), quantity=3)
+
+    def get_cart(self, lines):
+        with self.assertNumQueries(CART_QUERIES):
+            response = self.client.get('/api/v1/cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['items']), lines)
+        return response
+
+    def test_cart_query_count_is_fixed(self):
+        self.add_lines(3)
+        small = self.get_cart(3)
+        self.add_lines(9)
+        large = self.get_cart(12)
+        self.assertGreater(Decimal(large.data['pricing']['total']), Decimal(small.data['pricing']['total']))
+
+    def test_cart_lines_carry_images_sizes_and_variants(self):
+        self.add_lines(3)
+        items = self.get_cart(3).data['items']
+        self.assertEqual(sum(1 for item in items if item['selected_size']), 1)
+        self.assertEqual(sum(1 for item in items if item['variant_product'] and item['variant']), 1)
+        self.assertTrue(all(item['product']['primary_image'] for item in items))
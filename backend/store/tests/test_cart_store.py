@@ -0,0 +1,142 @@
+"""Redis carts across a Redis outage: database edits made meanwhile must survive recovery."""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from ..models import Cart
+from ..utils import cart_store
+from ..utils.cache_backend import RedisUnavailable
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+class FakeRedis:
+    """The hash and set commands the cart store uses, on dicts; `down` makes every call fail."""
+
+    def __init__(self):
+        self.data = {}
+        self.down = False
+
+    def execute(self, fn):
+        if self.down:
+            raise RedisUnavailable('fake outage')
+        return fn(self)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hsetnx(self, key, field, value):
+        self.data.setdefault(key, {}).setdefault(field, str(value))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        self.data.setdefault(key, {}).update(mapping or {field: str(value)})
+
+    def hincrby(self, key, field, amount):
+        fields = self.data.setdefault(key, {})
+        fields[field] = str(int(fields.get(field, 0)) + amount)
+        return int(fields[field])
+
+    def hdel(self, key, field):
+        self.data.get(key, {}).pop(field, None)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def expire(self, key, seconds):
+        pass
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+
+    def srem(self, key, member):
+        self.data.get(key, set()).discard(member)
+
+    def spop(self, key, count):
+        members = self.data.pop(key, set())
+        return list(members)[:count]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((getattr(self.redis, name), args, kwargs))
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+@override_settings(CART_ENGINE='redis')
+@TEST_SETTINGS
+class RedisOutageTests(APITestCase):
+
+    def setUp(self):
+        # Cached catalog prices of an earlier test would price these products
+        cache.clear()
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(cart_store, 'execute_redis', self.redis.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = factories.user()
+        self.client.force_authenticate(self.user)
+        self.shirt, self.shoes, self.cap = factories.product(), factories.product(), factories.product()
+
+    def add(self, product, quantity=1):
+        response = self.client.post('/api/v1/cart/add/', {'product_id': product.id, 'quantity': quantity})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def cart_quantities(self):
+        items = self.client.get('/api/v1/cart/').data['items']
+        return {item['product']['id']: item['quantity'] for item in items}
+
+    def db_quantities(self):
+        cart = Cart.objects.get(user=self.user)
+        return {item.product_id: item.quantity for item in cart.items.all()}
+
+    def test_outage_edits_survive_a_flushed_hash(self):
+        self.add(self.shirt)
+        cart_store.flush_dirty_carts()
+
+        self.redis.down = True
+        self.add(self.shoes)
+        self.redis.down = False
+
+        self.assertEqual(self.cart_quantities(), {self.shirt.id: 1, self.shoes.id: 1})
+        self.add(self.cap)
+        cart_store.flush_dirty_carts()
+        self.assertEqual(self.db_quantities(), {self.shirt.id: 1, self.shoes.id: 1, self.cap.id: 1})
+
+    def test_outage_edits_win_over_unflushed_redis_writes(self):
+        self.add(self.shirt)
+        cart_store.flush_dirty_carts()
+        self.add(self.shirt, 2)  # only in Redis when it goes down
+
+        self.redis.down = True
+        self.add(self.shoes)
+        self.redis.down = False
+
+        # the write-behind flush must not overwrite the outage edit
+        cart_store.flush_dirty_carts()
+        self.assertEqual(self.db_quantities(), {self.shirt.id: 1, self.shoes.id: 1})
+        self.assertEqual(self.cart_quantities(), {self.shirt.id: 1, self.shoes.id: 1})
+
+    def test_normal_writes_are_flushed(self):
+        self.add(self.shirt)
+        cart_store.flush_dirty_carts()
+        self.add(self.shirt, 2)
+        self.assertEqual(self.cart_quantities(), {self.shirt.id: 3})
+        cart_store.flush_dirty_carts()
+        self.assertEqual(self.db_quantities(), {self.shirt.id: 3})
@@ -0,0 +1,124 @@
+"""Coupon pricing rule, eligibility errors, redemption checks and releases."""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import Cart, CartItem, Coupon, Order
+from ..utils import coupons, order_transitions
+from ..utils.razorpay_utils import release_unpaid_order
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+def coupon(code='SAVE', **fields):
+    now = timezone.now()
+    values = {
+        'discount_percent': 10, 'flat_discount': Decimal('0'), 'usage_limit': 100,
+        'valid_from': now - timedelta(days=1), 'valid_to': now + timedelta(days=1), 'active': True,
+    }
+    values.update(fields)
+    return Coupon.objects.create(code=code, **values)
+
+
+@TEST_SETTINGS
+class DiscountRuleTests(TestCase):
+
+    def test_larger_of_percent_and_flat(self):
+        both = coupon(discount_percent=10, flat_discount=Decimal('150'))
+        self.assertEqual(coupons.discount_for(both, Decimal('1000')), Decimal('150.00'))
+        self.assertEqual(coupons.discount_for(both, Decimal('3000')), Decimal('300.00'))
+
+    def test_cap_and_minimum_purchase(self):
+        capped = coupon(discount_percent=50, max_discount_amount=Decimal('200'), min_purchase_amount=Decimal('500'))
+        self.assertEqual(coupons.discount_for(capped, Decimal('1000')), Decimal('200.00'))
+        with self.assertRaises(coupons.CouponError):
+            coupons.discount_for(capped, Decimal('499'))
+
+    def test_redeem_rechecks_expiry(self):
+        expired = coupon(valid_to=timezone.now() - timedelta(minutes=1))
+        with self.assertRaises(coupons.CouponNotFound):
+            coupons.redeem(expired)
+        expired.refresh_from_db()
+        self.assertEqual(expired.used_count, 0)
+
+    def test_redeem_stops_at_usage_limit(self):
+        limited = coupon(usage_limit=1)
+        coupons.redeem(limited)
+        with self.assertRaisesMessage(coupons.CouponError, 'usage limit'):
+            coupons.redeem(limited)
+
+
+@TEST_SETTINGS
+class ValidateCouponTests(APITestCase):
+
+    def setUp(self):
+        # Cached catalog prices of an earlier test would price these products
+        cache.clear()
+        self.user = factories.user()
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=factories.product(price='400.00'), quantity=1)
+        self.client.force_authenticate(self.user)
+
+    def add_coupon(self, code, **fields):
+        # Saving a coupon reloads the cached rules once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            coupon(code, **fields)
+
+    def validate(self, code):
+        return self.client.post('/api/v1/orders/validate_coupon/', {'coupon_code': code})
+
+    def test_unknown_coupon_is_not_found(self):
+        response = self.validate('NOPE')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.data['valid'])
+
+    def test_ineligible_cart_is_a_bad_request(self):
+        self.add_coupon('BIGSPEND', min_purchase_amount=Decimal('1000'))
+        response = self.validate('BIGSPEND')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('minimum purchase', response.data['error'])
+
+    def test_valid_coupon(self):
+        self.add_coupon('TENOFF')
+        response = self.validate('TENOFF')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['discount'], '40.00')
+
+
+@TEST_SETTINGS
+class CouponReleaseTests(TestCase):
+
+    def setUp(self):
+        self.coupon = coupon(usage_limit=1)
+        owner = factories.user()
+        self.order = factories.order(owner, factories.address(owner), [factories.product()], status='processing')
+        Order.objects.filter(pk=self.order.pk).update(coupon=self.coupon)
+        coupons.redeem(self.coupon)
+
+    def used(self):
+        self.coupon.refresh_from_db()
+        return self.coupon.used_count
+
+    def test_cancelling_gives_the_use_back(self):
+        order_transitions.transition(Order.objects.filter(pk=self.order.pk), 'cancelled')
+        self.assertEqual(self.used(), 0)
+        coupons.redeem(self.coupon)  # the slot can be used again
+
+    def test_failed_payment_gives_the_use_back(self):
+        Order.objects.filter(pk=self.order.pk).update(order_status='pending', payment_status='pending')
+        self.assertTrue(release_unpaid_order(self.order))
+        self.assertEqual(self.used(), 0)
+
+    def test_other_moves_keep_the_use(self):
+        order_transitions.transition(Order.objects.filter(pk=self.order.pk), 'shipped')
+        self.assertEqual(self.used(), 1)
+
+    def test_release_never_goes_below_zero(self):
+        coupons.release(self.coupon)
+        coupons.release(self.coupon)
+        self.assertEqual(self.used(), 0)
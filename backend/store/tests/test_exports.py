@@ -0,0 +1,87 @@
+"""Order exports: the streamed rows, their columns and the response headers."""
+
+import csv
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import Order
+from ..utils import exports
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+@TEST_SETTINGS
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        self.owner = factories.user()
+        address = factories.address(self.owner)
+        self.shirt, self.shoes = factories.product(price='500.00'), factories.product(price='1200.00')
+        self.delivered = factories.order(self.owner, address, [self.shirt, self.shoes], reviewed=False, returned=False)
+        self.delivered.items.filter(product=self.shoes).update(quantity=2)
+        self.cancelled = factories.order(self.owner, address, [self.shirt], status='cancelled', returned=False)
+        # placed three days ago, so date filters can tell the two apart
+        Order.objects.filter(pk=self.cancelled.pk).update(created_at=timezone.now() - timedelta(days=3))
+        staff = factories.user()
+        staff.is_staff = True
+        staff.save()
+        self.client.force_authenticate(staff)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/v1/orders/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_items_csv(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(
+            response['Content-Disposition'], f'attachment; filename="orders-items-{timezone.localdate()}.csv"'
+        )
+        self.assertNotIn('X-Archived-Orders-Excluded', response)
+        header, *rows = csv.reader(io.StringIO(body))
+        self.assertEqual(header, exports.columns('items'))
+        rows = [dict(zip(header, row)) for row in rows]
+        # oldest order first; the line total is computed, so its scale depends on the database
+        self.assertEqual(
+            [(row['order_id'], row['product_name'], row['quantity'], Decimal(row['line_total'])) for row in rows],
+            [
+                (str(self.cancelled.pk), self.shirt.title, '1', Decimal('500')),
+                (str(self.delivered.pk), self.shirt.title, '1', Decimal('500')),
+                (str(self.delivered.pk), self.shoes.title, '2', Decimal('2400')),
+            ],
+        )
+        self.assertEqual({row['customer_email'] for row in rows}, {self.owner.email})
+        self.assertEqual({row['shipping_pincode'] for row in rows}, {'560001'})
+
+    def test_orders_jsonl(self):
+        response, body = self.export('?kind=orders&output=jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([list(row) for row in rows], [exports.columns('orders')] * 2)
+        self.assertEqual(
+            [(row['order_id'], row['order_status'], row['total_amount']) for row in rows],
+            [(str(self.cancelled.pk), 'cancelled', '500.00'), (str(self.delivered.pk), 'delivered', '1700.00')],
+        )
+
+    def test_date_and_status_filters(self):
+        today = timezone.localdate().isoformat()
+        _, body = self.export(f'?kind=orders&output=jsonl&from={today}')
+        self.assertEqual([json.loads(line)['order_id'] for line in body.splitlines()], [str(self.delivered.pk)])
+        _, body = self.export('?kind=orders&output=jsonl&status=cancelled&status=refunded')
+        self.assertEqual([json.loads(line)['order_id'] for line in body.splitlines()], [str(self.cancelled.pk)])
+        _, body = self.export(f'?to={(timezone.localdate() - timedelta(days=5)).isoformat()}')
+        self.assertEqual(body.splitlines(), [','.join(exports.columns('items'))])
+
+    def test_bad_parameters(self):
+        for query in ('?kind=returns', '?output=xlsx', '?from=yesterday'):
+            self.assertEqual(self.client.get(f'/api/v1/orders/export/{query}').status_code, 400, query)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get('/api/v1/orders/export/').status_code, 403)
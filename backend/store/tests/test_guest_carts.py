@@ -0,0 +1,66 @@
+"""Merging a guest cart into the user's cart at login."""
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..models import Cart, CartItem, Product, StockReservation
+from ..utils import cart_store, guest_carts, reservations
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+@TEST_SETTINGS
+class MergeGuestCartTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = factories.user()
+        self.cart = Cart.objects.create(user=self.user)
+        self.guest = guest_carts.GuestCartStore()
+
+    def guest_add(self, product, quantity):
+        key = cart_store.line_key(product.id)
+        self.guest.add(key, quantity)
+        reservations.hold(reservations.guest_owner(self.guest.token), self.guest.snapshot()[1])
+        return key
+
+    def merge(self):
+        return guest_carts.merge_into_user_cart(self.guest.token, self.user)
+
+    def quantities(self):
+        return {item.product_id: item.quantity for item in CartItem.objects.filter(cart=self.cart)}
+
+    def test_quantities_are_summed(self):
+        shirt, cap = factories.product(), factories.product()
+        CartItem.objects.create(cart=self.cart, product=shirt, quantity=2)
+        self.guest_add(shirt, 3)
+        self.guest_add(cap, 1)
+        self.assertEqual(self.merge(), 2)
+        self.assertEqual(self.quantities(), {shirt.id: 5, cap.id: 1})
+        self.assertEqual(guest_carts.GuestCartStore(self.guest.token).snapshot()[1], {})
+
+    def test_quantities_are_clamped_to_available_stock(self):
+        shirt = factories.product(stock=6)
+        CartItem.objects.create(cart=self.cart, product=shirt, quantity=2)
+        # another shopper holds 2 of the 6
+        reservations.hold(reservations.user_owner(factories.user()), {cart_store.line_key(shirt.id): 2})
+        self.guest_add(shirt, 3)
+        self.merge()
+        self.assertEqual(self.quantities(), {shirt.id: 4})
+
+    def test_inactive_and_sold_out_products_are_dropped(self):
+        kept, retired, sold_out = factories.product(), factories.product(), factories.product(stock=0)
+        self.guest_add(kept, 1)
+        self.guest_add(retired, 1)
+        self.guest.add(cart_store.line_key(sold_out.id), 1)
+        Product.objects.filter(pk=retired.pk).update(is_active=False)
+        self.assertEqual(self.merge(), 1)
+        self.assertEqual(self.quantities(), {kept.id: 1})
+
+    def test_holds_move_to_the_user(self):
+        shirt = factories.product()
+        self.guest_add(shirt, 2)
+        self.merge()
+        self.assertFalse(StockReservation.objects.filter(owner=reservations.guest_owner(self.guest.token)).exists())
+        hold = StockReservation.objects.get(owner=reservations.user_owner(self.user))
+        self.assertEqual((hold.kind, hold.ref_id, hold.quantity), ('product', shirt.id, 2))
@@ -0,0 +1,63 @@
+"""Idempotency-Key on order creation: retries replay the first response instead of ordering twice."""
+
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from ..models import Cart, CartItem, IdempotencyRecord, Order, Product
+from ..utils import idempotency
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+@TEST_SETTINGS
+class IdempotentCheckoutTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = factories.user()
+        self.address = factories.address(self.user)
+        self.product = factories.product(stock=5)
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=self.product, quantity=1)
+        self.client.force_authenticate(self.user)
+
+    def body(self, **data):
+        return {'shipping_address_id': self.address.id, 'payment_method': 'COD', **data}
+
+    def place(self, key, **data):
+        return self.client.post('/api/v1/orders/', self.body(**data), format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.place('checkout-1')
+        self.assertEqual(first.status_code, 201, first.data)
+        retry = self.place('checkout-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).inventory_count, 4)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        self.place('checkout-1')
+        response = self.place('checkout-1', payment_method='UPI')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    def test_retry_while_the_first_is_running_conflicts(self):
+        # the first request has claimed the key and not finished yet
+        first = SimpleNamespace(method='POST', path='/api/v1/orders/', data=self.body())
+        IdempotencyRecord.objects.create(
+            user=self.user, scope='orders.create', key='checkout-1',
+            fingerprint=idempotency.fingerprint(first), expires_at=timezone.now() + timedelta(hours=1),
+        )
+        response = self.place('checkout-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failed_requests_can_be_retried(self):
+        response = self.place('checkout-1', shipping_address_id=999999)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(IdempotencyRecord.objects.exists())
@@ -0,0 +1,108 @@
+"""Time-ordered order ids: uuid7() ordering and the bounds created_between() puts on a scan."""
+
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from ..models import Order, OrderItem
+from ..utils import ids
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+class Uuid7Tests(SimpleTestCase):
+
+    def test_ids_keep_increasing(self):
+        generated = [ids.uuid7() for _ in range(5000)]
+        self.assertEqual(generated, sorted(generated))
+        self.assertEqual(len(set(generated)), len(generated))
+        self.assertTrue(all(value.version == 7 and value.variant == uuid.RFC_4122 for value in generated[:10]))
+
+    def test_ids_keep_increasing_within_one_millisecond(self):
+        # more ids than the 12-bit counter holds: the overflow borrows the next millisecond
+        clock = mock.patch.object(ids.time, 'time_ns', return_value=1_700_000_000_000_000_000)
+        with clock, mock.patch.dict(ids._last, {'ms': 0, 'counter': 0}):
+            generated = [ids.uuid7() for _ in range(5000)]
+        self.assertEqual(generated, sorted(generated))
+        self.assertEqual(ids.timestamp(generated[0]).timestamp(), 1_700_000_000)
+        self.assertEqual(ids.timestamp(generated[-1]).timestamp(), 1_700_000_000.001)
+
+    def test_timestamp_and_floor(self):
+        before = timezone.now()
+        value = ids.uuid7()
+        self.assertLessEqual(ids.floor(before), value)
+        self.assertLess(abs(ids.timestamp(value) - before), timedelta(seconds=1))
+        self.assertFalse(ids.is_uuid7(uuid.uuid4()))
+        with self.assertRaises(ValueError):
+            ids.timestamp(uuid.uuid4())
+
+
+@TEST_SETTINGS
+class CreatedBetweenTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.since = self.now - timedelta(days=5)
+        owner = factories.user()
+        address, product = factories.address(owner), factories.product()
+        self.orders = {}
+        # a uuid4 order from before the switch, and time-ordered ones since
+        for name, days_ago in (('legacy', 10), ('week', 3), ('today', 0)):
+            placed = self.now - timedelta(days=days_ago, minutes=1)
+            if name == 'legacy':
+                key = uuid.uuid4()
+            else:
+                # as if generated back then: ids of this process never go backwards
+                clock = mock.patch.object(ids.time, 'time_ns', return_value=int(placed.timestamp() * 1e9))
+                with clock, mock.patch.dict(ids._last, {'ms': 0, 'counter': 0}):
+                    key = ids.uuid7()
+            order = Order.objects.create(
+                id=key, user=owner, shipping_address=address, total_amount=product.price,
+                order_status='delivered', payment_status='paid', payment_method='UPI',
+            )
+            OrderItem.objects.create(order=order, product=product, product_name=product.title, price_at_purchase=product.price)
+            Order.objects.filter(pk=key).update(created_at=placed)
+            self.orders[name] = key
+
+    def between(self, start=None, end=None):
+        matched = set(Order.objects.filter(ids.created_between(start, end)).values_list('pk', flat=True))
+        return sorted(name for name, pk in self.orders.items() if pk in matched)
+
+    def test_ranges(self):
+        days = lambda n: self.now - timedelta(days=n)
+        cases = [
+            ((None, None), ['legacy', 'today', 'week']),
+            ((days(12), None), ['legacy', 'today', 'week']),
+            ((days(12), days(1)), ['legacy', 'week']),
+            ((days(4), None), ['today', 'week']),
+            ((days(4), days(1)), ['week']),
+            ((days(1), None), ['today']),
+            ((None, days(6)), ['legacy']),
+        ]
+        for since in (None, self.since):
+            with override_settings(ORDER_UUID7_SINCE=since):
+                for (start, end), expected in cases:
+                    self.assertEqual(self.between(start, end), expected, (since, start, end))
+
+    def test_pk_bounds_follow_the_switch(self):
+        with override_settings(ORDER_UUID7_SINCE=None):
+            self.assertNotIn('pk', str(ids.created_between(self.now - timedelta(days=1))))
+        with override_settings(ORDER_UUID7_SINCE=self.since.isoformat()):
+            query = ids.created_between(self.now - timedelta(days=1), self.now)
+            self.assertIn(('pk__gte', ids.floor(self.now - timedelta(days=1) - ids.CLOCK_SLACK)), query.children)
+            self.assertIn(('pk__lt', ids.floor(self.now + ids.CLOCK_SLACK)), query.children)
+            self.assertTrue(ids.pk_ordered(self.since))
+            self.assertFalse(ids.pk_ordered(self.since - timedelta(seconds=1)))
+            self.assertFalse(ids.pk_ordered(None))
+            # ranges ending before the switch cannot use the keys at all
+            self.assertNotIn('pk', str(ids.created_between(end=self.since)))
+
+    def test_prefix_reaches_the_order(self):
+        with override_settings(ORDER_UUID7_SINCE=self.since):
+            items = OrderItem.objects.filter(ids.created_between(self.now - timedelta(days=4), prefix='order__'))
+            self.assertEqual(
+                set(items.values_list('order_id', flat=True)), {self.orders['week'], self.orders['today']}
+            )
@@ -0,0 +1,66 @@
+"""Stock ledger: conditional decrements never oversell, restocks never double up."""
+
+from django.test import TestCase
+
+from ..models import InventoryMovement, Product, ProductSize
+from ..utils import inventory
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+@TEST_SETTINGS
+class ApplyMovementsTests(TestCase):
+
+    def setUp(self):
+        self.shirt = factories.product(stock=3)
+        self.shoes = factories.product(sizes=('9',), stock=2)
+        self.size = self.shoes.sizes.get()
+
+    def stock(self):
+        return (
+            Product.objects.get(pk=self.shirt.pk).inventory_count,
+            ProductSize.objects.get(pk=self.size.pk).stock_count,
+        )
+
+    def sell(self, shirts, shoes):
+        return inventory.apply_movements([
+            inventory.movement(inventory.stock_key(self.shirt.id), -shirts, 'sale'),
+            inventory.movement(inventory.stock_key(self.shoes.id, self.size.id), -shoes, 'sale'),
+        ])
+
+    def test_sale_within_stock_updates_balances_and_ledger(self):
+        self.sell(3, 1)
+        self.assertEqual(self.stock(), (0, 1))
+        self.assertEqual(InventoryMovement.objects.filter(reason='sale').count(), 2)
+
+    def test_oversell_is_refused_as_a_whole(self):
+        with self.assertRaises(inventory.InsufficientStock):
+            self.sell(1, 3)
+        # the shirt row had enough, but nothing of the batch was applied
+        self.assertEqual(self.stock(), (3, 2))
+        self.assertFalse(InventoryMovement.objects.exists())
+
+    def test_movements_on_one_row_are_summed(self):
+        key = inventory.stock_key(self.shirt.id)
+        with self.assertRaises(inventory.InsufficientStock):
+            inventory.apply_movements([inventory.movement(key, -2, 'sale'), inventory.movement(key, -2, 'sale')])
+        inventory.apply_movements([inventory.movement(key, -2, 'sale'), inventory.movement(key, 1, 'restock')])
+        self.assertEqual(self.stock(), (2, 2))
+
+    def test_restocking_an_order_twice_returns_the_units_once(self):
+        owner = factories.user()
+        order = factories.order(owner, factories.address(owner), [self.shirt], reviewed=False, returned=False)
+        line = order.items.get()
+        inventory.apply_movements([
+            inventory.movement(inventory.stock_key(self.shirt.id), -2, 'sale', order=order, order_item=line)
+        ])
+        inventory.restock_order(order, 'cancel')
+        inventory.restock_order(order, 'cancel')
+        self.assertEqual(self.stock(), (3, 2))
+
+    def test_reconcile_reports_edits_outside_the_ledger(self):
+        inventory.adjust(inventory.stock_key(self.shirt.id), -1)
+        Product.objects.filter(pk=self.shirt.pk).update(inventory_count=10)
+        # factory stock has no opening movement, so the ledger only holds the -1
+        self.assertIn(('product', self.shirt.id, 10, -1), inventory.reconcile(fix=True))
+        self.assertEqual(inventory.reconcile(), [])
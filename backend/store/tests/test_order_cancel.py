@@ -0,0 +1,52 @@
+"""Order cancellation by customers and staff goes through the locked status transitions."""
+
+from django.contrib import admin
+from django.test import RequestFactory, TestCase
+from rest_framework.test import APITestCase
+
+from ..models import Order, OrderEvent
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+@TEST_SETTINGS
+class CustomerCancelTests(APITestCase):
+
+    def setUp(self):
+        self.user = factories.user()
+        self.client.force_authenticate(self.user)
+
+    def place(self, status):
+        return factories.order(self.user, factories.address(self.user), [factories.product()], status=status)
+
+    def cancel(self, order):
+        return self.client.post(f'/api/v1/orders/{order.pk}/cancel/')
+
+    def test_processing_order_is_cancelled(self):
+        order = self.place('processing')
+        response = self.cancel(order)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['order_status'], 'cancelled')
+        event = OrderEvent.objects.get(order=order, kind='order')
+        self.assertEqual((event.previous_status, event.status, event.source), ('processing', 'cancelled', 'customer'))
+
+    def test_shipped_order_is_not_cancelled(self):
+        order = self.place('shipped')
+        response = self.cancel(order)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('shipped', response.data['error'])
+        order.refresh_from_db()
+        self.assertEqual(order.order_status, 'shipped')
+        self.assertFalse(OrderEvent.objects.filter(order=order).exists())
+
+
+@TEST_SETTINGS
+class AdminStatusTests(TestCase):
+
+    def test_status_is_read_only_on_the_change_form(self):
+        model_admin = admin.site._registry[Order]
+        request = RequestFactory().get('/')
+        owner = factories.user()
+        order = factories.order(owner, factories.address(owner), [])
+        self.assertIn('order_status', model_admin.get_readonly_fields(request, order))
+        self.assertNotIn('order_status', model_admin.get_readonly_fields(request))
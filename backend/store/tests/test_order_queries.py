@@ -0,0 +1,52 @@
+"""Query budgets of the order history endpoints: fixed whatever the number of orders."""
+
+from rest_framework.test import APITestCase
+
+from . import factories
+from .factories import TEST_SETTINGS
+
+# page count; orders with shipping addresses; items with products; item
+# reviews with users and products; return requests per item and per order;
+# archived order count
+ORDER_LIST_QUERIES = 7
+# one annotated query for the page (cursor pagination needs no count) and
+# the archived order count
+ORDER_SUMMARY_QUERIES = 2
+
+
+@TEST_SETTINGS
+class OrderListQueryBudgetTests(APITestCase):
+
+    def setUp(self):
+        self.user = factories.user()
+        self.address = factories.address(self.user)
+        self.products = [factories.product(sizes=('M',)) for _ in range(3)]
+        self.client.force_authenticate(self.user)
+
+    def place_orders(self, count):
+        for index in range(count):
+            factories.order(self.user, self.address, self.products[:1 + index % 3])
+
+    def get(self, url, queries, orders):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), orders)
+        return response.data['results']
+
+    def test_order_list_query_count_is_fixed(self):
+        self.place_orders(1)
+        self.get('/api/v1/orders/', ORDER_LIST_QUERIES, 1)
+        self.place_orders(8)
+        orders = self.get('/api/v1/orders/', ORDER_LIST_QUERIES, 9)
+        self.assertTrue(all(order['items'] for order in orders))
+        self.assertTrue(all(order['return_requests'] for order in orders))
+        self.assertTrue(all(any(item['reviews'] for item in order['items']) for order in orders))
+
+    def test_order_summary_query_count_is_fixed(self):
+        self.place_orders(1)
+        self.get('/api/v1/orders/?view=summary', ORDER_SUMMARY_QUERIES, 1)
+        self.place_orders(8)
+        rows = self.get('/api/v1/orders/?view=summary', ORDER_SUMMARY_QUERIES, 9)
+        self.assertEqual(sorted(row['item_count'] for row in rows), [1, 1, 1, 1, 2, 2, 2, 3, 3])
+        self.assertTrue(all(row['first_item_image'] for row in rows))
@@ -0,0 +1,63 @@
+"""Pincode index: lookups binary-search a small generated index file."""
+
+import os
+import tempfile
+from datetime import date
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from ..utils import pincodes
+
+ROWS = {
+    110001: ('NORTH', 2, 4, True),
+    400001: ('WEST', 1, 3, False),
+    560001: ('SOUTH', 3, 5, True),
+    560002: ('SOUTH', 3, 6, True),
+}
+
+
+class PincodeLookupTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'pincodes.idx')
+        pincodes.write_index(ROWS, self.path)
+        settings = override_settings(PINCODE_INDEX_PATH=self.path, PINCODE_INDEX_CHECK_SECONDS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Start without the index an earlier test (or the real data dir) left mapped
+        state = mock.patch.dict(pincodes._state, {'index': None, 'checked_at': 0.0})
+        state.start()
+        self.addCleanup(state.stop)
+
+    def test_lookup_finds_every_pincode(self):
+        for pincode, (zone, eta_min, eta_max, cod) in ROWS.items():
+            self.assertEqual(
+                pincodes.lookup(str(pincode)),
+                pincodes.Serviceability(str(pincode), zone, eta_min, eta_max, cod),
+            )
+
+    def test_lookup_misses(self):
+        # below the first key, between keys, after the last key, and malformed
+        for pincode in ('100000', '400002', '999999', '56000', '0560001', 'abcdef', None):
+            self.assertIsNone(pincodes.lookup(pincode), pincode)
+
+    def test_serviceability_follows_the_index(self):
+        self.assertTrue(pincodes.is_serviceable('560 001'))
+        self.assertFalse(pincodes.is_serviceable('560003'))
+        self.assertEqual(
+            pincodes.delivery_estimate('400001', start=date(2024, 1, 1)), (date(2024, 1, 2), date(2024, 1, 4))
+        )
+
+    def test_replaced_index_is_reopened(self):
+        self.assertIsNone(pincodes.lookup('600001'))
+        pincodes.write_index({**ROWS, 600001: ('SOUTH', 2, 3, True)}, self.path)
+        self.assertEqual(pincodes.lookup('600001').zone, 'SOUTH')
+
+    def test_everything_is_serviceable_without_an_index(self):
+        os.remove(self.path)
+        self.assertFalse(pincodes.is_loaded())
+        self.assertTrue(pincodes.is_serviceable('560003'))
+        self.assertFalse(pincodes.is_serviceable('12345'))
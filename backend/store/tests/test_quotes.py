@@ -0,0 +1,76 @@
+"""Checkout quotes: an order placed with a quote_id is refused once the quote no longer applies."""
+
+from decimal import Decimal
+
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from ..models import Cart, CartItem, Order
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+@TEST_SETTINGS
+class QuoteTests(APITestCase):
+
+    def setUp(self):
+        # Cached catalog prices of an earlier test would price these products
+        cache.clear()
+        self.user = factories.user()
+        self.address = factories.address(self.user)
+        self.product = factories.product(price='500.00', stock=5)
+        self.item = CartItem.objects.create(
+            cart=Cart.objects.create(user=self.user), product=self.product, quantity=1
+        )
+        self.client.force_authenticate(self.user)
+
+    def quote(self):
+        response = self.client.post(
+            '/api/v1/orders/quote/', {'shipping_address_id': self.address.id}, format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def place(self, quote_id):
+        return self.client.post('/api/v1/orders/', {
+            'shipping_address_id': self.address.id, 'payment_method': 'COD', 'quote_id': quote_id,
+        }, format='json')
+
+    def assertRefused(self, response):
+        self.assertEqual(response.status_code, 409, response.data)
+        self.assertEqual(response.data['code'], 'quote_invalid')
+        self.assertFalse(Order.objects.filter(user=self.user).exists())
+
+    def test_unchanged_quote_is_honoured(self):
+        quote = self.quote()
+        response = self.place(quote['quote_id'])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Order.objects.get(user=self.user).total_amount, Decimal(quote['total']))
+
+    def test_cart_change_invalidates_the_quote(self):
+        quote = self.quote()
+        CartItem.objects.filter(pk=self.item.pk).update(quantity=2)
+        self.assertRefused(self.place(quote['quote_id']))
+
+    def test_price_change_invalidates_the_quote(self):
+        quote = self.quote()
+        self.product.price = Decimal('450.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertRefused(self.place(quote['quote_id']))
+
+    def test_tampered_quote_is_refused(self):
+        quote = self.quote()
+        self.assertRefused(self.place(quote['quote_id'] + 'x'))
+
+    def test_quote_belongs_to_its_shopper(self):
+        quote = self.quote()
+        other = factories.user()
+        CartItem.objects.create(cart=Cart.objects.create(user=other), product=self.product, quantity=1)
+        self.client.force_authenticate(other)
+        response = self.client.post('/api/v1/orders/', {
+            'shipping_address_id': factories.address(other).id, 'payment_method': 'COD',
+            'quote_id': quote['quote_id'],
+        }, format='json')
+        self.assertEqual(response.status_code, 409, response.data)
+        self.assertFalse(Order.objects.filter(user=other).exists())
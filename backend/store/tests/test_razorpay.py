@@ -0,0 +1,128 @@
+"""The Razorpay client against the local stub: timeouts, retries, receipt dedupe and metrics."""
+
+import socket
+import threading
+import time
+
+from django.core.cache import cache
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+from django.test import SimpleTestCase, override_settings
+
+from ..management.commands.razorpay_stub import StubServer
+from ..utils import razorpay_utils
+from ..utils.razorpay_utils import RazorpayPaymentHandler
+from .factories import TEST_SETTINGS
+
+READ_TIMEOUT = 0.3
+
+
+@TEST_SETTINGS
+class RazorpayClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.stub = StubServer(('127.0.0.1', 0))
+        thread = threading.Thread(target=self.stub.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+        settings = override_settings(
+            RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='secret', RAZORPAY_BASE_URL=self.stub.url,
+            RAZORPAY_CONNECT_TIMEOUT=READ_TIMEOUT, RAZORPAY_READ_TIMEOUT=READ_TIMEOUT, RAZORPAY_MAX_RETRIES=2,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        razorpay_utils.reset_client()
+        self.addCleanup(razorpay_utils.reset_client)
+        razorpay_utils.flush_metrics()
+        cache.clear()
+        self.handler = RazorpayPaymentHandler()
+
+    def create(self, receipt='order-1', amount=50000):
+        return self.handler.create_razorpay_order(amount, receipt, 'shopper@example.com', '9999999999')
+
+    def test_client_is_shared(self):
+        self.assertIs(RazorpayPaymentHandler().client, self.handler.client)
+
+    def test_fetch_times_out_within_the_bound(self):
+        self.stub.script.extend([READ_TIMEOUT * 4] * 3)
+        started = time.monotonic()
+        with self.assertRaisesMessage(Exception, 'Failed to fetch payment details'):
+            self.handler.fetch_payment_details('pay_missing')
+        # three attempts of READ_TIMEOUT each, plus backoff, never the stub's full delay
+        self.assertLess(time.monotonic() - started, 3 * READ_TIMEOUT + 1.0)
+        self.assertEqual(len(self.stub.requests), 3)
+
+    def test_fetch_retries_server_errors(self):
+        order = self.create()
+        self.stub.script.extend(['fail', 'fail'])
+        payment = self.handler.fetch_payment_details('pay_' + order['id'][len('order_'):])
+        self.assertEqual(payment['order_id'], order['id'])
+        self.assertEqual(self.stub.requests[1:], [f"GET /v1/payments/pay_{order['id'][len('order_'):]}"] * 3)
+
+    def test_create_failing_after_the_order_was_made_reuses_it(self):
+        self.stub.script.append('fail')
+        order = self.create()
+        self.assertEqual(list(self.stub.orders), [order['id']])
+        self.assertEqual(self.stub.requests, ['POST /v1/orders', 'GET /v1/orders?receipt=order-1'])
+
+    def test_create_timing_out_after_the_order_was_made_reuses_it(self):
+        self.stub.script.append(READ_TIMEOUT * 4)
+        order = self.create()
+        self.assertEqual(list(self.stub.orders), [order['id']])
+        self.assertEqual(len(self.stub.requests), 2)
+
+    def test_create_is_retried_when_no_order_was_made(self):
+        self.stub.script.append('reject')
+        order = self.create()
+        self.assertEqual(list(self.stub.orders), [order['id']])
+        self.assertEqual(self.stub.requests, ['POST /v1/orders', 'GET /v1/orders?receipt=order-1', 'POST /v1/orders'])
+
+    def test_create_gives_up_after_max_retries(self):
+        self.stub.script.extend(['reject', 'ok'] * 3)
+        with self.assertRaisesMessage(Exception, 'Failed to create payment order'):
+            self.create()
+        self.assertEqual(self.stub.orders, {})
+
+    def test_pool_retries_only_gets(self):
+        retry = self.handler.client.session.get_adapter(self.stub.url).max_retries
+        error = ConnectTimeoutError('connect timed out')
+        self.assertEqual(retry.increment('GET', '/v1/payments/pay_x', error=error).connect, 1)
+        with self.assertRaises(MaxRetryError):
+            retry.increment('POST', '/v1/orders', error=error)
+
+    def test_unreachable_gateway_is_retried_in_one_layer(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            closed_port = sock.getsockname()[1]
+        with override_settings(RAZORPAY_BASE_URL=f'http://127.0.0.1:{closed_port}'):
+            razorpay_utils.reset_client()
+            handler = RazorpayPaymentHandler()
+            with self.assertRaisesMessage(Exception, 'Failed to create payment order'):
+                handler.create_razorpay_order(50000, 'order-1', 'shopper@example.com', '9999999999')
+        figures = razorpay_utils.stats()
+        # one connection attempt per loop iteration, and no lookups for requests never sent
+        self.assertEqual(figures['order.create']['calls'], 3)
+        self.assertEqual(figures['order.create']['retries'], 2)
+        self.assertEqual(figures['order.lookup']['calls'], 0)
+
+    def test_metrics(self):
+        self.stub.script.append('reject')
+        order = self.create()
+        self.handler.fetch_payment_details('pay_' + order['id'][len('order_'):])
+        self.stub.script.append('ok')
+        with self.assertRaises(Exception):
+            self.create(amount=50)  # below the minimum: rejected, not retried
+        figures = razorpay_utils.stats()
+        self.assertEqual(
+            {name: figures['order.create'][name] for name in ('calls', 'errors', 'rejected', 'retries')},
+            {'calls': 3, 'errors': 1, 'rejected': 1, 'retries': 1},
+        )
+        self.assertEqual(figures['order.lookup']['calls'], 1)
+        self.assertEqual(figures['payment.fetch']['calls'], 1)
+        self.assertEqual(figures['payment.fetch']['errors'], 0)
+
+    def test_metrics_are_written_in_batches(self):
+        with override_settings(RAZORPAY_METRICS_FLUSH_SECONDS=3600):
+            self.create()
+            self.assertIsNone(cache.get(f'{razorpay_utils.METRICS_PREFIX}:order.create:calls'))
+            self.assertEqual(razorpay_utils.stats()['order.create']['calls'], 1)
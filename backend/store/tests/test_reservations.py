@@ -0,0 +1,58 @@
+"""Stock holds: another shopper's cart reduces what is available, checkout consumes the holds."""
+
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from ..models import StockReservation
+from ..utils import inventory, reservations
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+@TEST_SETTINGS
+class ReservationTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = factories.product(stock=5)
+        self.first, self.second = factories.user(), factories.user()
+
+    def add(self, shopper, quantity):
+        self.client.force_authenticate(shopper)
+        return self.client.post('/api/v1/cart/add/', {'product_id': self.product.id, 'quantity': quantity})
+
+    def available(self, shopper=None):
+        owner = reservations.user_owner(shopper) if shopper else None
+        levels = inventory.stock_levels({self.product.id}, set(), exclude_owner=owner)
+        return levels[inventory.stock_key(self.product.id)]['available']
+
+    def test_other_shoppers_hold_reduces_availability(self):
+        self.assertEqual(self.add(self.first, 3).status_code, 200)
+        self.assertEqual(self.available(self.second), 2)
+        self.assertEqual(self.available(self.first), 5)  # a shopper's own hold does not count against them
+
+        refused = self.add(self.second, 3)
+        self.assertEqual(refused.status_code, 400)
+        self.assertFalse(StockReservation.objects.filter(owner=reservations.user_owner(self.second)).exists())
+        self.assertEqual(self.add(self.second, 2).status_code, 200)
+
+    def test_update_respects_other_holds(self):
+        self.add(self.first, 3)
+        item_id = self.add(self.second, 1).data['items'][0]['id']
+        response = self.client.post('/api/v1/cart/update_item/', {'item_id': item_id, 'quantity': 3})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/v1/cart/update_item/', {'item_id': item_id, 'quantity': 2})
+        self.assertEqual(response.status_code, 200)
+        hold = StockReservation.objects.get(owner=reservations.user_owner(self.second))
+        self.assertEqual(hold.quantity, 2)
+
+    def test_checkout_releases_the_holds(self):
+        self.add(self.first, 3)
+        self.assertTrue(StockReservation.objects.filter(owner=reservations.user_owner(self.first)).exists())
+        response = self.client.post('/api/v1/orders/', {
+            'shipping_address_id': factories.address(self.first).id, 'payment_method': 'COD',
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertFalse(StockReservation.objects.filter(owner=reservations.user_owner(self.first)).exists())
+        # the sale took the units instead
+        self.assertEqual(self.available(self.second), 2)
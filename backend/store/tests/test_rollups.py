@@ -0,0 +1,76 @@
+"""Daily sales rollups: refresh() applies only what changed since an order was last counted."""
+
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import DailySales, Order, SalesRollupState
+from ..utils import rollups
+from . import factories
+from .factories import TEST_SETTINGS
+
+
+@TEST_SETTINGS
+class RollupRefreshTests(TestCase):
+
+    def setUp(self):
+        owner = factories.user()
+        self.shirt, self.shoes = factories.product(price='500.00'), factories.product(price='1200.00')
+        self.order = factories.order(owner, factories.address(owner), [self.shirt, self.shoes], reviewed=False)
+        self.order.items.filter(product=self.shoes).update(quantity=2)
+        Order.objects.filter(pk=self.order.pk).update(discount_amount=Decimal('290.00'))
+        self.return_request = self.order.return_requests.get()  # for the shoes line
+        self.day = timezone.localtime(self.order.created_at).date()
+        rollups.refresh([self.order.pk])
+
+    def row(self, dimension, key):
+        row = DailySales.objects.get(date=self.day, dimension=dimension, key=str(key))
+        return {field: getattr(row, field) for field in rollups.FIELDS}
+
+    def refresh(self, **changes):
+        Order.objects.filter(pk=self.order.pk).update(**changes)
+        rollups.refresh([self.order.pk])
+
+    def test_sale_is_counted_once(self):
+        rollups.refresh([self.order.pk])  # nothing changed: applies nothing
+        shoes = self.row('product', self.shoes.id)
+        # the 290 discount is spread by line value: 500 of 2900 takes 50
+        self.assertEqual(
+            (shoes['orders'], shoes['units'], shoes['gross'], shoes['discount']), (1, 2, Decimal('2400'), Decimal('240'))
+        )
+        upi = self.row('payment_method', 'UPI')
+        self.assertEqual((upi['orders'], upi['units'], upi['gross'], upi['discount']), (1, 3, Decimal('2900'), Decimal('290')))
+
+    def test_cancelling_takes_the_sale_back(self):
+        self.refresh(order_status='cancelled')
+        for dimension, key in (('product', self.shirt.id), ('product', self.shoes.id), ('payment_method', 'UPI')):
+            self.assertEqual(set(self.row(dimension, key).values()), {0}, (dimension, key))
+        self.assertFalse(SalesRollupState.objects.get(order=self.order).counted)
+
+    def test_completed_return_counts_only_its_item(self):
+        self.return_request.status = 'completed'
+        self.return_request.save()
+        rollups.refresh([self.order.pk])
+        shoes, shirt = self.row('product', self.shoes.id), self.row('product', self.shirt.id)
+        self.assertEqual((shoes['units'], shoes['returned_units'], shoes['returned_amount']), (2, 2, Decimal('2400')))
+        self.assertEqual((shirt['returned_units'], shirt['returned_amount']), (0, 0))
+        self.assertEqual(self.row('brand', self.shoes.brand_id)['returned_units'], 2)
+
+        # refunded: every item is returned now, the shoes are not counted twice
+        self.refresh(order_status='refunded')
+        self.assertEqual(self.row('product', self.shoes.id)['returned_units'], 2)
+        self.assertEqual(self.row('product', self.shirt.id)['returned_units'], 1)
+        self.assertEqual(self.row('payment_method', 'UPI')['returned_amount'], Decimal('2900'))
+
+    def test_refresh_matches_a_rebuild(self):
+        self.return_request.status = 'completed'
+        self.return_request.save()
+        self.refresh(order_status='cancelled')
+        self.refresh(order_status='delivered')
+        refreshed = {(row.dimension, row.key): row for row in DailySales.objects.all()}
+        rollups.rebuild(self.day, self.day)
+        self.assertEqual(DailySales.objects.count(), len(refreshed))
+        for row in DailySales.objects.all():
+            for field in rollups.FIELDS:
+                self.assertEqual(getattr(refreshed[(row.dimension, row.key)], field), getattr(row, field), field)
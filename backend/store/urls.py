@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    AuthViewSet, UserViewSet, AddressViewSet,
+    AuthViewSet, UserViewSet, AddressViewSet, PincodeViewSet,
     ProductViewSet, CategoryViewSet,
     CartViewSet, OrderViewSet, ReviewViewSet, ReturnRequestViewSet, WishlistViewSet
 )
@@ -15,6 +15,7 @@ router.register(r'products', ProductViewSet, basename='product')
 
 # User & Profile
 router.register(r'addresses', AddressViewSet, basename='address')
+router.register(r'pincodes', PincodeViewSet, basename='pincode')
 
 # Shopping
 router.register(r'cart', CartViewSet, basename='cart')
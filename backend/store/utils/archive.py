@@ -0,0 +1,264 @@
+"""
+Cold order archival.
+
+Almost all traffic touches recent orders, so finished orders (delivered,
+cancelled or refunded, no open return) untouched for ORDER_ARCHIVE_AFTER_DAYS
+are moved out of Order/OrderItem/ReturnRequest/OrderEvent into ArchivedOrder,
+one row per order holding a JSON snapshot, ORDER_ARCHIVE_BATCH_SIZE orders
+per transaction (`manage.py archive_orders`).
+
+Nothing else is lost: reviews and inventory movements of archived items stay
+where they are (their order links are remembered in the snapshot), and
+restore() puts an order back exactly as it was. orders() rebuilds unsaved
+Order instances from archived rows, with items, return requests, reviews and
+address attached, so the order serializers read archived orders like hot ones.
+"""
+
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from . import ids
+from ..models import (
+    Address, ArchivedOrder, InventoryMovement, Order, OrderEvent, OrderItem, Product, ReturnRequest,
+    Review, SalesRollupState, User,
+)
+
+ARCHIVABLE_STATUSES = ('delivered', 'cancelled', 'refunded')
+OPEN_RETURN_STATUSES = ('requested', 'approved')
+
+
+def cutoff(days=None):
+    """Orders placed and last changed before this are archivable."""
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 180)
+    return timezone.now() - timedelta(days=days)
+
+
+def between(start=None, end=None):
+    """ArchivedOrder rows for orders placed in [start, end) (either may be None)."""
+    rows = ArchivedOrder.objects.all()
+    if start:
+        rows = rows.filter(created_at__gte=start)
+    if end:
+        rows = rows.filter(created_at__lt=end)
+    return rows
+
+
+def candidates(before):
+    return Order.objects.filter(
+        ids.created_between(end=before), order_status__in=ARCHIVABLE_STATUSES, updated_at__lt=before,
+    ).exclude(return_requests__status__in=OPEN_RETURN_STATUSES)
+
+
+def _dump(obj):
+    """Concrete field values of `obj` by attname, JSON-ready with DjangoJSONEncoder."""
+    values = {}
+    for field in obj._meta.concrete_fields:
+        value = field.value_from_object(obj)
+        if isinstance(value, FieldFile):
+            value = value.name
+        elif isinstance(value, datetime):
+            value = value.isoformat()  # DjangoJSONEncoder would drop the microseconds
+        values[field.attname] = value
+    return values
+
+
+def _build(model, values):
+    """Unsaved `model` instance from _dump() output."""
+    return model(**{
+        field.attname: field.to_python(values[field.attname])
+        for field in model._meta.concrete_fields if field.attname in values
+    })
+
+
+# -----------------------------------------------------------------------------
+# Archiving
+# -----------------------------------------------------------------------------
+
+def archive(before=None, batch_size=None, limit=None):
+    """Archive every order candidates(before) matches, in batches. Returns the number archived."""
+    before = before or cutoff()
+    batch_size = batch_size or getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 500)
+    archived = 0
+    while limit is None or archived < limit:
+        size = batch_size if limit is None else min(batch_size, limit - archived)
+        # Batches walk the pk index; with time-ordered ids that is also oldest first
+        batch = list(candidates(before).order_by('pk').values_list('pk', flat=True)[:size])
+        if not batch:
+            break
+        done = archive_orders(batch, before)
+        if not done:
+            break
+        archived += done
+    return archived
+
+
+@transaction.atomic
+def archive_orders(order_ids, before):
+    """Move the given orders, if still archivable, into ArchivedOrder. Returns how many moved."""
+    # Re-checking under the lock skips orders that changed since they were picked
+    orders = list(
+        candidates(before).select_for_update().filter(pk__in=order_ids)
+        .prefetch_related('items', 'return_requests', 'events')
+    )
+    if not orders:
+        return 0
+    pks = [order.pk for order in orders]
+
+    movements = {}
+    for pk, order_id, item_id in InventoryMovement.objects.filter(order_id__in=pks).values_list('id', 'order_id', 'order_item_id'):
+        movements.setdefault(order_id, []).append([pk, item_id])
+    reviews = {}
+    for pk, order_id, item_id in Review.objects.filter(order_item__order_id__in=pks).values_list('id', 'order_item__order_id', 'order_item_id'):
+        reviews.setdefault(order_id, []).append([pk, item_id])
+    states = {state.order_id: state for state in SalesRollupState.objects.filter(order_id__in=pks)}
+
+    snapshots = []
+    for order in orders:
+        state = states.get(order.pk)
+        snapshots.append(ArchivedOrder(
+            id=order.pk,
+            user_id=order.user_id,
+            created_at=order.created_at,
+            order_status=order.order_status,
+            payment_status=order.payment_status,
+            payment_method=order.payment_method,
+            total_amount=order.total_amount,
+            data={
+                'order': _dump(order),
+                'items': [_dump(item) for item in order.items.all()],
+                'return_requests': [_dump(return_request) for return_request in order.return_requests.all()],
+                'events': [_dump(event) for event in order.events.all()],
+                'reviews': reviews.get(order.pk, []),
+                'movements': movements.get(order.pk, []),
+                'rollup_state': state and {'counted': state.counted, 'returned_items': state.returned_items},
+            },
+        ))
+    ArchivedOrder.objects.bulk_create(snapshots)
+
+    # Reviews would cascade with their order items; detach them instead (restore re-links them)
+    Review.objects.filter(order_item__order_id__in=pks).update(order_item=None)
+    # Items, return requests, events and rollup state go with the order; movements are SET_NULL
+    Order.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+# -----------------------------------------------------------------------------
+# Reading
+# -----------------------------------------------------------------------------
+
+def orders(archived):
+    """
+    Unsaved Order instances for ArchivedOrder rows, newest first as given,
+    with `items`, `return_requests`, item reviews and the shipping address
+    attached like for_display() would, plus the summaries() annotations.
+    Marked `is_archived`; never save() them (use restore()).
+    """
+    archived = list(archived)
+    built = []
+    for row in archived:
+        order = _build(Order, row.data['order'])
+        items = [_build(OrderItem, values) for values in row.data['items']]
+        return_requests = [_build(ReturnRequest, values) for values in row.data['return_requests']]
+        built.append((row, order, items, return_requests))
+
+    addresses = Address.objects.in_bulk({order.shipping_address_id for _, order, _, _ in built})
+    products = Product.objects.in_bulk({item.product_id for _, _, items, _ in built for item in items})
+    reviews = Review.objects.select_related('user', 'product').in_bulk(
+        {pk for row, _, _, _ in built for pk, _ in row.data['reviews']}
+    )
+
+    result = []
+    for row, order, items, return_requests in built:
+        by_item = {item.pk: item for item in items}
+        item_reviews = {}
+        for pk, item_id in row.data['reviews']:
+            review = reviews.get(pk)
+            if review is not None and item_id in by_item:
+                review.order_item_id = item_id
+                item_reviews.setdefault(item_id, []).append(review)
+        for return_request in return_requests:
+            return_request.order = order
+            if return_request.order_item_id in by_item:
+                return_request.order_item = by_item[return_request.order_item_id]
+        for item in items:
+            item.order = order
+            if item.product_id in products:
+                item.product = products[item.product_id]
+            item._prefetched_objects_cache = {
+                'reviews': item_reviews.get(item.pk, []),
+                'return_requests': [r for r in return_requests if r.order_item_id == item.pk],
+            }
+        if order.shipping_address_id in addresses:
+            order.shipping_address = addresses[order.shipping_address_id]
+        order._prefetched_objects_cache = {'items': items, 'return_requests': return_requests}
+
+        first_item = items[0] if items else None
+        order.item_count = len(items)
+        order.item_quantity = sum(item.quantity for item in items)
+        order.first_item_name = first_item.product_name if first_item else None
+        order.first_item_image = first_item.product_image.name if first_item else None
+        order.is_archived = True
+        result.append(order)
+    return result
+
+
+def get(order_id, user=None):
+    """The archived order `order_id` as an Order instance (see orders()), or None."""
+    rows = ArchivedOrder.objects.filter(pk=order_id)
+    if user is not None:
+        rows = rows.filter(user=user)
+    found = orders(rows[:1])
+    return found[0] if found else None
+
+
+# -----------------------------------------------------------------------------
+# Restoring
+# -----------------------------------------------------------------------------
+
+def _insert(model, rows):
+    """Insert _dump() rows, keeping primary keys and the original auto_now(_add) timestamps."""
+    instances = [_build(model, values) for values in rows]
+    model.objects.bulk_create(instances)
+    stamped = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    if stamped:
+        for instance, values in zip(instances, rows):
+            model.objects.filter(pk=instance.pk).update(**{
+                field.attname: field.to_python(values[field.attname]) for field in stamped
+            })
+
+
+@transaction.atomic
+def restore(order_ids):
+    """Move archived orders back into the hot tables. Returns how many were restored."""
+    rows = list(ArchivedOrder.objects.select_for_update().filter(pk__in=order_ids))
+    if not rows:
+        return 0
+    actors = {event['actor_id'] for row in rows for event in row.data['events'] if event['actor_id']}
+    existing_actors = set(User.objects.filter(pk__in=actors).values_list('pk', flat=True))
+    for row in rows:
+        for event in row.data['events']:
+            if event['actor_id'] not in existing_actors:
+                event['actor_id'] = None
+
+    _insert(Order, [row.data['order'] for row in rows])
+    _insert(OrderItem, [values for row in rows for values in row.data['items']])
+    _insert(ReturnRequest, [values for row in rows for values in row.data['return_requests']])
+    _insert(OrderEvent, [values for row in rows for values in row.data['events']])
+    SalesRollupState.objects.bulk_create([
+        SalesRollupState(order_id=row.pk, **row.data['rollup_state'])
+        for row in rows if row.data['rollup_state']
+    ])
+    for row in rows:
+        for pk, item_id in row.data['movements']:
+            InventoryMovement.objects.filter(pk=pk, order__isnull=True).update(order_id=row.pk, order_item_id=item_id)
+        for pk, item_id in row.data['reviews']:
+            Review.objects.filter(pk=pk, order_item__isnull=True).update(order_item_id=item_id)
+    ArchivedOrder.objects.filter(pk__in=[row.pk for row in rows]).delete()
+    return len(rows)
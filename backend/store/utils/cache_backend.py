@@ -0,0 +1,281 @@
+"""
+Resilient Redis cache backend.
+
+Wraps django-redis so that:
+- No connection is attempted at import time (workers boot even if Redis is down).
+- Every Redis call uses tight socket timeouts.
+- A circuit breaker stops hammering a dead Redis and serves from a bounded
+  in-process LocMemCache instead of falling back to the database.
+- The breaker half-opens after a cooldown and recovers automatically once
+  Redis answers again.
+- Keys written or deleted in memory while Redis was unreachable are deleted
+  from Redis before it is used again, so values that changed during the
+  outage (version counters, invalidated entries) do not come back stale.
+"""
+
+import threading
+import time
+import logging
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+
+class RedisUnavailable(Exception):
+    """Raised when Redis cannot be used (breaker open or call failed)."""
+
+
+class CircuitBreaker:
+    """
+    Minimal thread-safe circuit breaker.
+
+    closed    -> calls go to Redis; consecutive failures are counted
+    open      -> calls are short-circuited until `recovery_timeout` elapses
+    half-open -> a single trial call is let through; success closes the
+                 breaker, failure re-opens it
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=3, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                # Let exactly one request probe Redis
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Redis reachable again; closing cache circuit breaker")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(
+                        f"Redis unavailable after {self.failures} failure(s); "
+                        f"serving cache from memory for {self.recovery_timeout}s"
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ResilientRedisCache(BaseCache):
+    """
+    Django cache backend: django-redis behind a circuit breaker with a
+    bounded in-memory fallback.
+
+    Extra OPTIONS (everything else is passed through to django-redis):
+        FAILURE_THRESHOLD      consecutive failures before opening (default 3)
+        RECOVERY_TIMEOUT       seconds before a half-open probe (default 30)
+        FALLBACK_MAX_ENTRIES   size bound of the in-memory fallback (default 5000)
+    """
+
+    _OWN_OPTIONS = ('FAILURE_THRESHOLD', 'RECOVERY_TIMEOUT', 'FALLBACK_MAX_ENTRIES')
+
+    # Methods whose fallback calls leave Redis out of date: {name: key position}
+    _WRITES = {
+        'add': 'key', 'set': 'key', 'touch': 'key', 'delete': 'key', 'incr': 'key', 'decr': 'key',
+        'set_many': 'many', 'delete_many': 'many',
+    }
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = dict(params.get('OPTIONS', {}))
+        own = {key: options.pop(key) for key in self._OWN_OPTIONS if key in options}
+
+        # Tight defaults so a dead Redis costs milliseconds, not seconds
+        options.setdefault('SOCKET_CONNECT_TIMEOUT', 0.25)
+        options.setdefault('SOCKET_TIMEOUT', 0.25)
+
+        self._server = server
+        self._redis_params = {**params, 'OPTIONS': options}
+        self._redis = None
+        self._redis_lock = threading.Lock()
+        # (key, version) pairs changed in the fallback, to delete from Redis on recovery
+        self._stale = set()
+        self._stale_lock = threading.Lock()
+        self._max_stale = own.get('FALLBACK_MAX_ENTRIES', 5000) * 10
+
+        self.breaker = CircuitBreaker(
+            failure_threshold=own.get('FAILURE_THRESHOLD', 3),
+            recovery_timeout=own.get('RECOVERY_TIMEOUT', 30),
+        )
+        self._fallback = LocMemCache(f'resilient-fallback-{id(self)}', {
+            'TIMEOUT': params.get('TIMEOUT', 300),
+            'KEY_PREFIX': params.get('KEY_PREFIX', ''),
+            'VERSION': params.get('VERSION', 1),
+            'OPTIONS': {'MAX_ENTRIES': own.get('FALLBACK_MAX_ENTRIES', 5000)},
+        })
+
+    def _get_redis(self):
+        """Build the django-redis backend lazily (it connects on first command)."""
+        if self._redis is None:
+            with self._redis_lock:
+                if self._redis is None:
+                    from django_redis.cache import RedisCache
+                    self._redis = RedisCache(self._server, self._redis_params)
+        return self._redis
+
+    @staticmethod
+    def _connection_errors():
+        from redis.exceptions import ConnectionError, TimeoutError
+        from django_redis.exceptions import ConnectionInterrupted
+        return (ConnectionError, TimeoutError, ConnectionInterrupted, OSError)
+
+    def _mark_stale(self, method, args, kwargs):
+        """Remember the keys a fallback write touched."""
+        keys = args[0] if args else kwargs.get('data' if method == 'set_many' else 'keys', kwargs.get('key'))
+        if self._WRITES[method] == 'key':
+            keys = [keys]
+        version = kwargs.get('version')
+        with self._stale_lock:
+            if len(self._stale) >= self._max_stale:
+                logger.warning(f"Too many cache keys changed during the Redis outage; not tracking {method}")
+                return
+            self._stale.update((key, version) for key in keys)
+
+    def _replay(self, redis):
+        """Delete the keys changed during the outage from Redis, then drop the fallback entries."""
+        with self._stale_lock:
+            stale, self._stale = self._stale, set()
+        by_version = {}
+        for key, version in stale:
+            by_version.setdefault(version, []).append(key)
+        try:
+            for version, keys in by_version.items():
+                redis.delete_many(keys, version=version)
+        except Exception:
+            with self._stale_lock:
+                self._stale |= stale
+            raise
+        logger.info(f"Deleted {len(stale)} cache key(s) changed while Redis was unreachable")
+        self._fallback.clear()
+
+    def _call(self, method, *args, **kwargs):
+        if self.breaker.allow():
+            try:
+                redis = self._get_redis()
+                if self._stale:
+                    self._replay(redis)
+                result = getattr(redis, method)(*args, **kwargs)
+            except self._connection_errors() as e:
+                logger.debug(f"Redis cache {method} failed: {e}")
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+                return result
+        if method in self._WRITES:
+            self._mark_stale(method, args, kwargs)
+        return getattr(self._fallback, method)(*args, **kwargs)
+
+    @property
+    def is_available(self):
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def execute(self, fn):
+        """
+        Run `fn(client)` against the raw redis-py client behind the breaker.
+        Raises RedisUnavailable instead of falling back, so callers that need
+        real Redis semantics (hashes, sets) can choose their own fallback.
+        """
+        if not self.breaker.allow():
+            raise RedisUnavailable("Redis circuit breaker is open")
+        try:
+            redis = self._get_redis()
+            if self._stale:
+                self._replay(redis)
+            result = fn(redis.client.get_client(write=True))
+        except self._connection_errors() as e:
+            self.breaker.record_failure()
+            raise RedisUnavailable(str(e)) from e
+        self.breaker.record_success()
+        return result
+
+    # Standard cache API -----------------------------------------------------
+
+    def add(self, *args, **kwargs):
+        return self._call('add', *args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return self._call('get', *args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self._call('set', *args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        return self._call('touch', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._call('delete', *args, **kwargs)
+
+    def get_many(self, *args, **kwargs):
+        return self._call('get_many', *args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self._call('set_many', *args, **kwargs)
+
+    def delete_many(self, *args, **kwargs):
+        return self._call('delete_many', *args, **kwargs)
+
+    def has_key(self, *args, **kwargs):
+        return self._call('has_key', *args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        return self._call('incr', *args, **kwargs)
+
+    def decr(self, *args, **kwargs):
+        return self._call('decr', *args, **kwargs)
+
+    def clear(self):
+        self._fallback.clear()
+        return self._call('clear')
+
+    def close(self, **kwargs):
+        if self._redis is not None:
+            try:
+                self._redis.close(**kwargs)
+            except self._connection_errors():
+                pass
+
+
+def version_seed():
+    """
+    Starting value for a version counter found missing from the cache: the
+    current time in milliseconds, above anything the counter held before it
+    was evicted or deleted after an outage, so old versioned entries never
+    match again.
+    """
+    return time.time_ns() // 1_000_000
+
+
+def execute_redis(fn, alias='default'):
+    """
+    Run `fn(client)` on the raw Redis client of cache `alias`.
+    Raises RedisUnavailable when the alias is not a ResilientRedisCache or
+    Redis is down.
+    """
+    backend = caches[alias]
+    if not isinstance(backend, ResilientRedisCache):
+        raise RedisUnavailable(f"Cache '{alias}' is not Redis-backed")
+    return backend.execute(fn)
@@ -0,0 +1,405 @@
+"""
+Redis-backed cart store with write-behind persistence.
+
+Enabled with CART_ENGINE = 'redis'. The active cart of a user lives in a Redis
+hash (`cart:<user_id>`), one field per line:
+
+    "<product_id>:<size_id>:<variant_product_id>:<variant_id>" -> quantity
+
+plus a few `_`-prefixed meta fields (cart id, version, updated_at). Writes only
+touch Redis and mark the user dirty; `flush_dirty_carts()` (run by
+`manage.py flush_cart_writes`) persists dirty carts to Cart/CartItem in batches.
+Checkout calls `flush_cart(..., evict=True)` synchronously so the database is
+the source of truth while an order is being placed.
+
+Any Redis failure raises RedisUnavailable; callers fall back to the database
+cart, which is never more than one flush interval behind. Those database
+writes go through record_db_write(), which moves Cart.version and updated_at
+past the hash: snapshot() then re-seeds the hash from the database and
+flushes skip it, so edits made during a Redis outage are not overwritten
+when Redis comes back.
+"""
+
+import logging
+from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Cart, CartItem, Product, ProductSize, ProductVariant, active_related_variants
+from .cache_backend import execute_redis, RedisUnavailable
+
+logger = logging.getLogger(__name__)
+
+DIRTY_SET = 'cart:dirty'
+META_CART_ID = '_cart_id'
+META_VERSION = '_version'
+META_UPDATED_AT = '_updated_at'
+
+
+def is_enabled():
+    return getattr(settings, 'CART_ENGINE', 'db') == 'redis'
+
+
+def _cart_key(user_id):
+    return f'cart:{user_id}'
+
+
+def _ttl():
+    return getattr(settings, 'CART_REDIS_TTL', 60 * 60 * 24 * 7)
+
+
+def line_key(product_id, size_id=None, variant_product_id=None, variant_id=None):
+    return f"{product_id}:{size_id or ''}:{variant_product_id or ''}:{variant_id or ''}"
+
+
+def parse_line_key(key):
+    """Inverse of line_key(); returns a dict of ids (None for empty parts)."""
+    product_id, size_id, variant_product_id, variant_id = (
+        int(part) if part else None for part in key.split(':')
+    )
+    return {
+        'product_id': product_id,
+        'size_id': size_id,
+        'variant_product_id': variant_product_id,
+        'variant_id': variant_id,
+    }
+
+
+def item_line_key(item):
+    return line_key(item.product_id, item.selected_size_id, item.variant_product_id, item.variant_id)
+
+
+def record_db_write(cart):
+    """Call after writing `cart`'s items in the database rather than through Redis."""
+    Cart.objects.filter(pk=cart.pk).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def _newer_in_db(meta, version, updated_at):
+    """True if the Cart row (`version`, `updated_at`) was written after the hash with `meta`."""
+    if version > int(meta.get(META_VERSION, 0)):
+        return True
+    written = meta.get(META_UPDATED_AT)
+    return not written or datetime.fromisoformat(written) < updated_at
+
+
+def _decode(raw):
+    """Split a raw HGETALL result into (meta, lines)."""
+    meta, lines = {}, {}
+    for field, value in raw.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        value = value.decode() if isinstance(value, bytes) else value
+        if field.startswith('_'):
+            meta[field] = value
+        else:
+            lines[field] = int(value)
+    return meta, lines
+
+
+class RedisCartStore:
+    """Cart operations for one user against the Redis hash."""
+
+    def __init__(self, user):
+        self.user = user
+        self.key = _cart_key(user.id)
+        # Meta fields as of the last snapshot or write made through this store
+        self.meta = {}
+        self._hydrated = False
+
+    def _hydrate(self, client, replace=False):
+        """
+        Seed the hash from the database the first time the cart is touched
+        (checked once per store); `replace` drops an out-of-date hash first.
+        """
+        if self._hydrated and not replace:
+            return
+        if replace or not client.exists(self.key):
+            cart, _ = Cart.objects.get_or_create(user=self.user)
+            pipe = client.pipeline()
+            if replace:
+                pipe.delete(self.key)
+            # HSETNX so a concurrent writer that got there first is never clobbered
+            pipe.hsetnx(self.key, META_CART_ID, cart.id)
+            pipe.hsetnx(self.key, META_VERSION, cart.version)
+            pipe.hsetnx(self.key, META_UPDATED_AT, cart.updated_at.isoformat())
+            for item in cart.items.all():
+                pipe.hsetnx(self.key, item_line_key(item), item.quantity)
+            pipe.expire(self.key, _ttl())
+            pipe.execute()
+        self._hydrated = True
+
+    def _write(self, client, mutate):
+        self._hydrate(client)
+        updated_at = timezone.now().isoformat()
+        pipe = client.pipeline()
+        mutate(pipe)
+        pipe.hincrby(self.key, META_VERSION, 1)
+        pipe.hset(self.key, META_UPDATED_AT, updated_at)
+        pipe.expire(self.key, _ttl())
+        pipe.sadd(DIRTY_SET, self.user.id)
+        results = pipe.execute()
+        self.meta[META_VERSION] = str(results[-4])
+        self.meta[META_UPDATED_AT] = updated_at
+
+    def snapshot(self):
+        """
+        Return (meta, lines) for the cart, hydrating from the DB if needed and
+        re-seeding if the database cart was written without Redis since.
+        """
+        def run(client):
+            # A hydrated hash always has its meta fields, so an empty one needs seeding
+            raw = client.hgetall(self.key)
+            if raw:
+                meta, _ = _decode(raw)
+                row = Cart.objects.filter(user=self.user).values_list('version', 'updated_at').first()
+                if row and _newer_in_db(meta, *row):
+                    logger.info(f"Cart of user {self.user.id} changed in the database; re-seeding Redis")
+                    self._hydrate(client, replace=True)
+                    raw = client.hgetall(self.key)
+            else:
+                self._hydrate(client)
+                raw = client.hgetall(self.key)
+            self._hydrated = True
+            return _decode(raw)
+        meta, lines = execute_redis(run)
+        self.meta = dict(meta)
+        return meta, lines
+
+    def add(self, key, quantity):
+        execute_redis(lambda client: self._write(client, lambda pipe: pipe.hincrby(self.key, key, quantity)))
+
+    def set_quantity(self, key, quantity):
+        execute_redis(lambda client: self._write(client, lambda pipe: pipe.hset(self.key, key, quantity)))
+
+    def remove(self, key):
+        execute_redis(lambda client: self._write(client, lambda pipe: pipe.hdel(self.key, key)))
+
+    def apply(self, changes):
+        """Write many lines in one round trip: {key: quantity} sets, {key: None} removes."""
+        def mutate(pipe):
+            for key, quantity in changes.items():
+                if quantity is None:
+                    pipe.hdel(self.key, key)
+                else:
+                    pipe.hset(self.key, key, quantity)
+        execute_redis(lambda client: self._write(client, mutate))
+
+
+# -----------------------------------------------------------------------------
+# Batch operations (shared by the Redis and database cart paths)
+# -----------------------------------------------------------------------------
+
+class CartOperationError(ValueError):
+    """An operation in a batch refers to a line that is not in the cart."""
+
+
+def apply_operations(lines, operations, resolve_item=None):
+    """
+    Apply add/update/remove operations to `lines` ({line key: quantity}) in memory.
+
+    `resolve_item` maps a client item_id to a line key (defaults to treating it
+    as a line key). Returns (new_lines, changed_keys, removed_keys); raises
+    CartOperationError for unknown items.
+    """
+    resolve_item = resolve_item or (lambda item_id: item_id)
+    lines = dict(lines)
+    changed, removed = set(), set()
+    for index, op in enumerate(operations):
+        if op['op'] == 'add':
+            key = line_key(op['product_id'], op.get('size_id'), op.get('variant_product_id'), op.get('variant_id'))
+            lines[key] = lines.get(key, 0) + op['quantity']
+            changed.add(key)
+            removed.discard(key)
+            continue
+
+        key = resolve_item(op['item_id'])
+        if key is None or key not in lines:
+            raise CartOperationError(f"Operation {index}: cart item {op['item_id']} not found")
+        if op['op'] == 'update':
+            lines[key] = op['quantity']
+            changed.add(key)
+        else:
+            del lines[key]
+            changed.discard(key)
+            removed.add(key)
+    return lines, changed, removed
+
+
+# -----------------------------------------------------------------------------
+# Reading: turn hash lines into (unsaved) CartItem instances for serialization
+# -----------------------------------------------------------------------------
+
+def build_cart_items(cart_id, lines):
+    """
+    Materialise Redis lines as unsaved CartItem objects with all relations
+    loaded in a fixed number of queries. Each item's `id` is its line key.
+    """
+    parsed = {key: parse_line_key(key) for key in lines}
+    product_ids = {p['product_id'] for p in parsed.values()}
+    product_ids |= {p['variant_product_id'] for p in parsed.values() if p['variant_product_id']}
+    size_ids = {p['size_id'] for p in parsed.values() if p['size_id']}
+    variant_ids = {p['variant_id'] for p in parsed.values() if p['variant_id']}
+
+    products = {
+        p.id: p for p in Product.objects.filter(id__in=product_ids)
+        .select_related('brand', 'category').prefetch_related('images')
+    } if product_ids else {}
+    sizes = ProductSize.objects.in_bulk(size_ids) if size_ids else {}
+    variants = ProductVariant.objects.select_related(
+        'variant_product__brand', 'variant_product__category',
+    ).prefetch_related(
+        'variant_product__images', active_related_variants(),
+    ).in_bulk(variant_ids) if variant_ids else {}
+
+    items = []
+    for key, ids in parsed.items():
+        product = products.get(ids['product_id'])
+        if product is None:
+            # Product deleted since it was added; drop the line from the view
+            continue
+        item = CartItem(
+            cart_id=cart_id,
+            product=product,
+            selected_size=sizes.get(ids['size_id']),
+            variant_product=products.get(ids['variant_product_id']),
+            variant=variants.get(ids['variant_id']),
+            quantity=lines[key],
+        )
+        item.id = key
+        items.append(item)
+    return items
+
+
+# -----------------------------------------------------------------------------
+# Write-behind persistence
+# -----------------------------------------------------------------------------
+
+def _sync_to_db(snapshots):
+    """
+    Persist {user_id: (meta, lines)} snapshots to Cart/CartItem in one
+    transaction with bulk operations. Snapshots older than the stored
+    Cart.version are ignored, so racing flushers cannot go backwards, and so
+    are hashes the database cart was written after (see record_db_write()).
+    """
+    if not snapshots:
+        return 0
+
+    with transaction.atomic():
+        carts = {
+            cart.user_id: cart for cart in
+            Cart.objects.select_for_update().filter(user_id__in=snapshots.keys()).order_by('id')
+        }
+        missing = [uid for uid in snapshots if uid not in carts]
+        for uid in missing:
+            carts[uid] = Cart.objects.create(user_id=uid)
+
+        fresh = {
+            uid: snap for uid, snap in snapshots.items()
+            if uid in missing or (
+                int(snap[0].get(META_VERSION, 0)) > carts[uid].version
+                and not _newer_in_db(snap[0], carts[uid].version, carts[uid].updated_at)
+            )
+        }
+        if not fresh:
+            return 0
+
+        cart_ids = [carts[uid].id for uid in fresh]
+        existing = {}
+        for item in CartItem.objects.filter(cart_id__in=cart_ids):
+            existing[(item.cart_id, item_line_key(item))] = item
+
+        to_create, to_update, to_delete = [], [], []
+        wanted = set()
+        for uid, (meta, lines) in fresh.items():
+            cart = carts[uid]
+            for key, quantity in lines.items():
+                if quantity < 1:
+                    continue
+                wanted.add((cart.id, key))
+                item = existing.get((cart.id, key))
+                if item is None:
+                    ids = parse_line_key(key)
+                    to_create.append(CartItem(
+                        cart=cart,
+                        product_id=ids['product_id'],
+                        selected_size_id=ids['size_id'],
+                        variant_product_id=ids['variant_product_id'],
+                        variant_id=ids['variant_id'],
+                        quantity=quantity,
+                    ))
+                elif item.quantity != quantity:
+                    item.quantity = quantity
+                    to_update.append(item)
+        to_delete = [item.id for k, item in existing.items() if k not in wanted]
+
+        if to_delete:
+            CartItem.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+
+        now = timezone.now()
+        for uid, (meta, _) in fresh.items():
+            cart = carts[uid]
+            cart.version = int(meta.get(META_VERSION, cart.version))
+            # The hash's own write time, so the row never looks newer than the hash it came from
+            cart.updated_at = datetime.fromisoformat(meta[META_UPDATED_AT]) if meta.get(META_UPDATED_AT) else now
+        Cart.objects.bulk_update([carts[uid] for uid in fresh], ['version', 'updated_at'])
+
+    return len(fresh)
+
+
+def flush_dirty_carts(batch_size=200):
+    """Claim up to `batch_size` dirty carts and persist them. Returns count flushed."""
+    def claim(client):
+        user_ids = [int(uid) for uid in client.spop(DIRTY_SET, batch_size) or []]
+        pipe = client.pipeline()
+        for uid in user_ids:
+            pipe.hgetall(_cart_key(uid))
+        return user_ids, pipe.execute()
+
+    user_ids, raws = execute_redis(claim)
+    snapshots = {uid: _decode(raw) for uid, raw in zip(user_ids, raws) if raw}
+    try:
+        return _sync_to_db(snapshots)
+    except Exception:
+        # Put them back so the next run retries
+        execute_redis(lambda client: client.sadd(DIRTY_SET, *user_ids) if user_ids else None)
+        raise
+
+
+def flush_cart(user_id, evict=False):
+    """
+    Synchronously persist one user's cart. With evict=True the Redis hash is
+    removed atomically with the read, making the database authoritative (used
+    at checkout). If persisting fails the snapshot is written back to Redis.
+    """
+    key = _cart_key(user_id)
+
+    def take(client):
+        pipe = client.pipeline(transaction=True)
+        pipe.srem(DIRTY_SET, user_id)
+        pipe.hgetall(key)
+        if evict:
+            pipe.delete(key)
+        return pipe.execute()[1]
+
+    raw = execute_redis(take)
+    if not raw:
+        return False
+    meta, lines = _decode(raw)
+    try:
+        _sync_to_db({user_id: (meta, lines)})
+    except Exception:
+        def restore(client):
+            pipe = client.pipeline()
+            if evict:
+                pipe.hset(key, mapping=raw)
+                pipe.expire(key, _ttl())
+            pipe.sadd(DIRTY_SET, user_id)
+            pipe.execute()
+        execute_redis(restore)
+        raise
+    return True
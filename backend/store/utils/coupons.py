@@ -0,0 +1,152 @@
+"""
+Coupon rules engine.
+
+Active coupons are kept in a per-process dict keyed by code, so checkout and
+coupon validation do not query the coupons table. Saving or deleting a
+Coupon bumps a version number in the shared cache; every process compares
+it with the version its dict was loaded at (at most every
+COUPON_CACHE_CHECK_SECONDS) and reloads when it changed.
+
+Redemptions only touch `used_count` through redeem(), a conditional
+`used_count = used_count + 1 WHERE used_count < usage_limit` UPDATE that
+also re-checks `active` and the validity window, so the cached copy never
+needs to be invalidated for them and a coupon can never be used more often
+than its limit or after it expires. Cancelling an order gives its use back
+through release() (see order_transitions).
+"""
+
+import time
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+from ..models import Coupon
+from .cache_backend import version_seed
+
+VERSION_KEY = 'coupons:version'
+
+_lock = threading.Lock()
+_state = {'coupons': None, 'version': None, 'checked_at': 0.0}
+
+
+class CouponError(Exception):
+    """The coupon cannot be applied; the message is safe to show to the customer."""
+
+
+class CouponNotFound(CouponError):
+    """No such coupon, or it is inactive or outside its validity window."""
+
+
+def _check_interval():
+    return getattr(settings, 'COUPON_CACHE_CHECK_SECONDS', 5)
+
+
+def _shared_version():
+    # While Redis is down other processes' bumps cannot be seen: reload every interval
+    if not getattr(cache, 'is_available', True):
+        return None
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, version_seed(), timeout=None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def _bump():
+    with _lock:
+        _state['coupons'] = None
+    cache.add(VERSION_KEY, version_seed(), timeout=None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # The key was evicted between add() and incr()
+        cache.add(VERSION_KEY, version_seed(), timeout=None)
+
+
+def invalidate(**kwargs):
+    """Signal receiver: reload coupons everywhere once the change commits."""
+    transaction.on_commit(_bump)
+
+
+post_save.connect(invalidate, sender=Coupon, dispatch_uid='coupons.invalidate_on_save')
+post_delete.connect(invalidate, sender=Coupon, dispatch_uid='coupons.invalidate_on_delete')
+
+
+def active_coupons():
+    """{code: Coupon} for coupons that are active and not yet expired."""
+    now = time.monotonic()
+    with _lock:
+        if _state['coupons'] is not None and now - _state['checked_at'] < _check_interval():
+            return _state['coupons']
+        version = _shared_version()
+        if _state['coupons'] is None or version is None or version != _state['version']:
+            _state['coupons'] = {
+                coupon.code: coupon
+                for coupon in Coupon.objects.filter(active=True, valid_to__gte=timezone.now())
+            }
+            _state['version'] = version
+        _state['checked_at'] = now
+        return _state['coupons']
+
+
+def get(code):
+    """The active coupon for `code`, or None."""
+    return active_coupons().get((code or '').strip())
+
+
+def discount_for(coupon, subtotal):
+    """
+    Discount `coupon` gives on `subtotal`: the percent off or the flat amount,
+    whichever is larger when a coupon has both, capped at max_discount_amount
+    and at the subtotal. Raises CouponError below min_purchase_amount.
+    """
+    subtotal = Decimal(subtotal)
+    if subtotal < coupon.min_purchase_amount:
+        raise CouponError(f"This coupon needs a minimum purchase of ₹{coupon.min_purchase_amount:,.2f}.")
+    discount = max(subtotal * Decimal(coupon.discount_percent) / 100, coupon.flat_discount)
+    if coupon.max_discount_amount is not None:
+        discount = min(discount, coupon.max_discount_amount)
+    return min(discount, subtotal).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def evaluate(code, subtotal):
+    """Look up `code` and price it for `subtotal`. Returns (coupon, discount)."""
+    coupon = get(code)
+    now = timezone.now()
+    if coupon is None or not (coupon.valid_from <= now <= coupon.valid_to):
+        raise CouponNotFound("Invalid or expired coupon.")
+    if coupon.used_count >= coupon.usage_limit:
+        raise CouponError("This coupon has reached its usage limit.")
+    return coupon, discount_for(coupon, subtotal)
+
+
+def redeem(coupon):
+    """
+    Count one use of `coupon`; call inside the checkout transaction, as late
+    as possible since the UPDATE holds the coupon row until commit. Raises
+    CouponError if the coupon was deactivated, expired or used up meanwhile.
+    """
+    now = timezone.now()
+    redeemed = Coupon.objects.filter(
+        pk=coupon.pk, active=True, valid_from__lte=now, valid_to__gte=now, used_count__lt=F('usage_limit')
+    ).update(used_count=F('used_count') + 1)
+    if not redeemed:
+        if Coupon.objects.filter(pk=coupon.pk, active=True, valid_from__lte=now, valid_to__gte=now).exists():
+            raise CouponError("This coupon has reached its usage limit.")
+        raise CouponNotFound("Invalid or expired coupon.")
+
+
+def release(coupon, uses=1):
+    """
+    Give back `uses` uses of `coupon` (a Coupon or its id), e.g. when the
+    order that redeemed it is cancelled. Never takes used_count below zero.
+    """
+    Coupon.objects.filter(pk=getattr(coupon, 'pk', coupon), used_count__gt=0).update(
+        used_count=Greatest(F('used_count') - uses, 0)
+    )
@@ -0,0 +1,118 @@
+"""
+Streaming order exports for finance (`manage.py export_orders`, GET /orders/export/).
+
+Rows come from a single values_list() query read with .iterator(), so
+neither model instances nor the full result are ever held in memory, and are
+written out one line at a time as CSV or JSON Lines. One row per order item
+('items', default) or per order ('orders').
+"""
+
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.db.models import F, ExpressionWrapper, DecimalField
+from django.utils import timezone
+
+from ..models import Order, OrderItem
+from . import ids
+
+FORMATS = ('csv', 'jsonl')
+
+ORDER_COLUMNS = {
+    'order_id': 'id',
+    'created_at': 'created_at',
+    'order_status': 'order_status',
+    'payment_status': 'payment_status',
+    'payment_method': 'payment_method',
+    'customer_email': 'user__email',
+    'shipping_pincode': 'shipping_address__pincode',
+    'coupon': 'coupon__code',
+    'tax_amount': 'tax_amount',
+    'shipping_cost': 'shipping_cost',
+    'discount_amount': 'discount_amount',
+    'total_amount': 'total_amount',
+    'razorpay_payment_id': 'razorpay_payment_id',
+}
+
+ITEM_COLUMNS = {
+    'order_id': 'order_id',
+    **{name: f'order__{path}' for name, path in ORDER_COLUMNS.items() if path != 'id'},
+    'item_id': 'id',
+    'product_name': 'product_name',
+    'variant_name': 'variant_name',
+    'selected_size': 'selected_size',
+    'quantity': 'quantity',
+    'unit_price': 'price_at_purchase',
+    'gst_percent': 'tax_at_purchase',
+    'line_total': 'line_total',
+}
+
+KINDS = {
+    'items': (OrderItem, ITEM_COLUMNS, ('order__created_at', 'order_id', 'id')),
+    'orders': (Order, ORDER_COLUMNS, ('created_at', 'id')),
+}
+
+# Once order ids are time-ordered (utils/ids.py) the pk index gives the same order
+PK_ORDERING = {
+    'items': ('order_id', 'id'),
+    'orders': ('id',),
+}
+
+
+def columns(kind='items'):
+    return list(KINDS[kind][1])
+
+
+def date_bounds(first=None, last=None):
+    """Aware (start, end) datetimes covering the local dates `first`..`last` inclusive."""
+    start = timezone.make_aware(datetime.combine(first, time.min)) if first else None
+    end = timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min)) if last else None
+    return start, end
+
+
+def rows(kind='items', start=None, end=None, statuses=None, chunk_size=2000):
+    """
+    Yield one tuple per order (item), in `columns(kind)` order, oldest first.
+    `start`/`end` bound the order's created_at (end exclusive); `statuses`
+    limits order_status.
+    """
+    model, fields, ordering = KINDS[kind]
+    prefix = 'order__' if model is OrderItem else ''
+    queryset = model.objects.all()
+    if model is OrderItem:
+        queryset = queryset.annotate(line_total=ExpressionWrapper(
+            F('price_at_purchase') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)
+        ))
+    queryset = queryset.filter(ids.created_between(start, end, prefix=prefix))
+    if statuses:
+        queryset = queryset.filter(**{f'{prefix}order_status__in': statuses})
+    if ids.pk_ordered(start):
+        ordering = PK_ORDERING[kind]
+    return queryset.order_by(*ordering).values_list(*fields.values()).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """File-like object whose write() returns the line instead of storing it."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(kind, records):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns(kind))
+    for record in records:
+        yield writer.writerow(record)
+
+
+def jsonl_lines(kind, records):
+    names = columns(kind)
+    for record in records:
+        yield json.dumps(dict(zip(names, record)), default=str) + '\n'
+
+
+def lines(kind='items', output='csv', **filters):
+    """The export as an iterator of text lines."""
+    if output not in FORMATS:
+        raise ValueError(f"Unknown export format '{output}'")
+    writer = csv_lines if output == 'csv' else jsonl_lines
+    return writer(kind, rows(kind, **filters))
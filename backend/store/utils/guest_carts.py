@@ -0,0 +1,182 @@
+"""
+Server-side guest carts.
+
+Anonymous shoppers get an opaque cart token (returned in the `X-Cart-Token`
+header and `cart_token` field). Their lines live in the cache under that
+token with a sliding TTL, using the same line keys as the Redis cart store,
+so the cart views treat both alike. On login/registration the guest cart is
+merged into the user's Cart with bulk writes and one stock query.
+"""
+
+import secrets
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Cart, CartItem
+from . import cart_store, inventory, reservations
+from .cache_backend import RedisUnavailable
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Cart-Token'
+
+
+def _cache_key(token):
+    return f'guest-cart:{token}'
+
+
+def _ttl():
+    return getattr(settings, 'GUEST_CART_TTL', 60 * 60 * 24 * 7)
+
+
+def get_token(request):
+    """Cart token sent by the client (header preferred, body as fallback)."""
+    token = request.headers.get(TOKEN_HEADER)
+    if not token and hasattr(request, 'data') and hasattr(request.data, 'get'):
+        token = request.data.get('cart_token')
+    # Tokens are generated by new_token(); reject anything that is not shaped like one
+    if token and 10 <= len(token) <= 64 and token.replace('-', '').replace('_', '').isalnum():
+        return token
+    return None
+
+
+def new_token():
+    return secrets.token_urlsafe(24)
+
+
+class GuestCartStore:
+    """Same interface as cart_store.RedisCartStore, backed by the cache."""
+
+    def __init__(self, token=None):
+        self.token = token or new_token()
+        self._data = None
+
+    @property
+    def meta(self):
+        return {cart_store.META_UPDATED_AT: self._load()['updated_at']}
+
+    def _load(self):
+        # Read once per store (one per request); writes keep the copy current
+        if self._data is None:
+            self._data = cache.get(_cache_key(self.token)) or {'lines': {}, 'updated_at': None}
+        return self._data
+
+    def _save(self, lines):
+        self._data = {'lines': lines, 'updated_at': timezone.now().isoformat()}
+        cache.set(_cache_key(self.token), self._data, _ttl())
+
+    def snapshot(self):
+        return self.meta, dict(self._load()['lines'])
+
+    def add(self, key, quantity):
+        lines = dict(self._load()['lines'])
+        lines[key] = lines.get(key, 0) + quantity
+        self._save(lines)
+
+    def set_quantity(self, key, quantity):
+        lines = dict(self._load()['lines'])
+        lines[key] = quantity
+        self._save(lines)
+
+    def remove(self, key):
+        lines = dict(self._load()['lines'])
+        lines.pop(key, None)
+        self._save(lines)
+
+    def apply(self, changes):
+        lines = dict(self._load()['lines'])
+        for key, quantity in changes.items():
+            if quantity is None:
+                lines.pop(key, None)
+            else:
+                lines[key] = quantity
+        self._save(lines)
+
+    def delete(self):
+        self._data = None
+        cache.delete(_cache_key(self.token))
+
+
+def merge_into_user_cart(token, user):
+    """
+    Merge the guest cart `token` into `user`'s Cart and drop the guest cart.
+
+    Quantities for lines already in the user's cart are added together and
+    clamped to available stock (checked with one query); inactive or invalid
+    lines are dropped. The guest's stock holds move to the user. Returns the
+    number of lines merged.
+    """
+    guest = GuestCartStore(token)
+    _, guest_lines = guest.snapshot()
+    if not guest_lines:
+        return 0
+
+    if cart_store.is_enabled():
+        try:
+            # Make the database authoritative before merging into it
+            cart_store.flush_cart(user.id, evict=True)
+        except RedisUnavailable:
+            logger.warning(f"Redis cart store unavailable while merging guest cart for user {user.id}")
+
+    owner = reservations.user_owner(user)
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        existing = {cart_store.item_line_key(item): item for item in cart.items.select_for_update()}
+
+        wanted = {}
+        for key, quantity in guest_lines.items():
+            try:
+                ids = cart_store.parse_line_key(key)
+            except ValueError:
+                continue
+            current = existing[key].quantity if key in existing else 0
+            wanted[key] = {**ids, 'quantity': current + quantity}
+
+        # The guest's own holds must not count against the merged cart
+        reservations.release(reservations.guest_owner(token))
+        levels = inventory.stock_levels(
+            {ids['product_id'] for ids in wanted.values()}
+            | {ids['variant_product_id'] for ids in wanted.values() if ids['variant_product_id']},
+            {ids['size_id'] for ids in wanted.values() if ids['size_id']},
+            exclude_owner=owner,
+        )
+
+        to_create, to_update = [], []
+        for key, line in wanted.items():
+            product = levels.get(('product', line['product_id']))
+            level = levels.get(inventory.stock_key(line['product_id'], line['size_id'], line['variant_product_id']))
+            if not product or not product['is_active'] or not level or level['available'] < 1:
+                continue
+            if line['size_id'] and level['product_id'] != line['product_id']:
+                continue
+            quantity = min(line['quantity'], level['available'])
+            if key in existing:
+                if existing[key].quantity != quantity:
+                    existing[key].quantity = quantity
+                    to_update.append(existing[key])
+            else:
+                to_create.append(CartItem(
+                    cart=cart,
+                    product_id=line['product_id'],
+                    selected_size_id=line['size_id'],
+                    variant_product_id=line['variant_product_id'],
+                    variant_id=line['variant_id'],
+                    quantity=quantity,
+                ))
+
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        cart_store.record_db_write(cart)
+
+        reservations.hold(owner, {
+            cart_store.item_line_key(item): item.quantity
+            for item in [*existing.values(), *to_create]
+        })
+
+    guest.delete()
+    return len(to_create) + len(to_update)
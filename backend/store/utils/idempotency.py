@@ -0,0 +1,138 @@
+"""
+Idempotency-Key support for unsafe endpoints (order creation, payment verification).
+
+The first request with a given key claims an IdempotencyRecord row (the
+unique constraint makes the claim atomic), runs the handler and stores its
+response. Retries with the same key then get:
+
+- the stored response (header `Idempotent-Replayed: true`) once it completed,
+- 409 Conflict while the first request is still running,
+- 422 if the key is reused with a different request body.
+
+Server errors and exceptions drop the record so the client may retry.
+The decorator must sit outside any transaction.atomic on the handler, so
+the claim is visible to concurrent retries before the handler starts.
+"""
+
+import json
+import hashlib
+import logging
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from ..models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24))
+
+
+def _lock_timeout():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+
+def fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def _claim(user, scope, key, digest):
+    """Create the record, or return the existing one (None if we created it)."""
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(
+                    user=user, scope=scope, key=key, fingerprint=digest,
+                    expires_at=timezone.now() + _ttl(),
+                )
+            return None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyRecord.objects.filter(user=user, scope=scope, key=key).first()
+        if record is None:
+            continue
+        now = timezone.now()
+        # Expired records, and claims whose handler died mid-way, may be taken over
+        stale = record.expires_at <= now or (
+            record.status == 'processing' and record.created_at <= now - _lock_timeout()
+        )
+        if not stale:
+            return record
+        IdempotencyRecord.objects.filter(id=record.id, status=record.status, created_at=record.created_at).delete()
+    return record
+
+
+def idempotent(scope=None):
+    """
+    Decorator for ViewSet methods; requests without the header are untouched.
+
+        @action(detail=False, methods=['post'])
+        @idempotent('orders.verify_payment')
+        def verify_payment(self, request): ...
+    """
+    def decorator(view):
+        view_scope = scope or view.__qualname__
+
+        @wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key or not request.user.is_authenticated:
+                return view(self, request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({'error': f'{HEADER} must be at most 255 characters'}, status=status.HTTP_400_BAD_REQUEST)
+
+            digest = fingerprint(request)
+            record = _claim(request.user, view_scope, key, digest)
+            if record is not None:
+                if record.fingerprint != digest:
+                    return Response(
+                        {'error': f'{HEADER} was already used for a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                if record.status == 'processing':
+                    return Response(
+                        {'error': 'A request with this key is still being processed'},
+                        status=status.HTTP_409_CONFLICT,
+                        headers={'Retry-After': '1'}
+                    )
+                return Response(record.response_body, status=record.response_status, headers={REPLAYED_HEADER: 'true'})
+
+            claimed = IdempotencyRecord.objects.filter(user=request.user, scope=view_scope, key=key)
+            try:
+                response = view(self, request, *args, **kwargs)
+            except Exception:
+                claimed.delete()
+                raise
+
+            if response.status_code >= 500:
+                claimed.delete()
+            else:
+                claimed.update(status='completed', response_status=response.status_code, response_body=response.data)
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired(batch_size=5000):
+    """Delete expired records in batches. Returns the number removed."""
+    removed = 0
+    now = timezone.now()
+    while True:
+        ids = list(IdempotencyRecord.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        removed += IdempotencyRecord.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,110 @@
+"""
+Time-ordered UUIDs (RFC 9562 version 7) for Order and ReturnRequest keys.
+
+    48 bits  Unix time in milliseconds
+     4 bits  version (7)
+    12 bits  counter: ids from one process keep increasing within a millisecond
+     2 bits  variant
+    62 bits  random
+
+New rows land at the right-hand edge of the primary key index, and a range
+of primary keys is a range of creation times, so time-bounded scans can walk
+the pk index instead of created_at.
+
+Rows created before the switch keep their random uuid4 keys, which say
+nothing about time. ORDER_UUID7_SINCE (set it to when this was deployed)
+tells created_between() which part of a range can use the pk index; left
+unset, filters fall back to created_at only.
+"""
+
+import os
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# An id is generated when the model is instantiated, created_at when it is
+# saved; pk bounds are widened by this much so no row falls outside them
+CLOCK_SLACK = timedelta(hours=1)
+
+_lock = threading.Lock()
+_last = {'ms': 0, 'counter': 0}
+
+
+def uuid7():
+    """A new version 7 UUID, greater than any generated before it in this process."""
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last['ms']:
+            # Start low in the 12 bits so the counter has room within this millisecond
+            counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            ms, counter = _last['ms'], _last['counter'] + 1
+            if counter > 0xFFF:
+                ms, counter = ms + 1, 0
+        _last['ms'], _last['counter'] = ms, counter
+    tail = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    return uuid.UUID(int=(ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | tail)
+
+
+def is_uuid7(value):
+    return uuid.UUID(str(value)).version == 7
+
+
+def timestamp(value):
+    """The creation time encoded in a version 7 UUID."""
+    value = uuid.UUID(str(value))
+    if value.version != 7:
+        raise ValueError(f'{value} is not a version 7 UUID')
+    return datetime.fromtimestamp((value.int >> 80) / 1000, tz=dt_timezone.utc)
+
+
+def floor(moment):
+    """The smallest version 7 UUID that can be generated at or after `moment`."""
+    return uuid.UUID(int=int(moment.timestamp() * 1000) << 80)
+
+
+def uuid7_since():
+    """When Order/ReturnRequest ids became time-ordered (ORDER_UUID7_SINCE), or None."""
+    value = getattr(settings, 'ORDER_UUID7_SINCE', None)
+    if not value:
+        return None
+    moment = parse_datetime(value) if isinstance(value, str) else value
+    if moment is None:
+        raise ValueError(f'ORDER_UUID7_SINCE is not a datetime: {value!r}')
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def created_between(start=None, end=None, prefix=''):
+    """
+    Q for rows created in [start, end) (either may be None), with primary
+    key bounds for the part of the range after ORDER_UUID7_SINCE so the
+    database can scan the pk index. `prefix` reaches the order through a
+    relation, e.g. 'order__'.
+    """
+    query = Q()
+    if start:
+        query &= Q(**{f'{prefix}created_at__gte': start})
+    if end:
+        query &= Q(**{f'{prefix}created_at__lt': end})
+    since = uuid7_since()
+    if since is None or (end and end <= since):
+        return query
+    lower = max(start, since) if start else since
+    keyed = Q(**{f'{prefix}pk__gte': floor(lower - CLOCK_SLACK)})
+    if end:
+        keyed &= Q(**{f'{prefix}pk__lt': floor(end + CLOCK_SLACK)})
+    if start and start >= since:
+        return query & keyed
+    # Older rows may still have uuid4 keys
+    return query & (Q(**{f'{prefix}created_at__lt': since}) | keyed)
+
+
+def pk_ordered(start=None):
+    """True when every row from `start` on has a time-ordered key, so sorting by pk sorts by creation."""
+    since = uuid7_since()
+    return since is not None and start is not None and start >= since
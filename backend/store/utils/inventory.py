@@ -0,0 +1,267 @@
+"""
+Inventory helpers shared by cart, guest cart and checkout code.
+
+Stock for a cart line lives on the selected ProductSize if a size was picked,
+otherwise on the variant product (if any), otherwise on the product itself.
+
+Every stock change goes through apply_movements(): it updates balances with
+conditional atomic UPDATEs and appends InventoryMovement ledger rows, which
+`manage.py reconcile_inventory` checks the balances against.
+"""
+
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import Value, F, Q, Case, When, CharField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import Product, ProductSize, StockReservation, InventoryMovement
+
+
+class InsufficientStock(Exception):
+    """A conditional stock update matched fewer rows than requested."""
+
+
+def stock_key(product_id, size_id=None, variant_product_id=None):
+    """Identify the row that holds stock for a line: ('size', id) or ('product', id)."""
+    if size_id:
+        return ('size', size_id)
+    return ('product', variant_product_id or product_id)
+
+
+def _reserved_by_others(kind, exclude_owner):
+    """Correlated subquery: live reserved units of a stock row, excluding one owner."""
+    holds = StockReservation.objects.filter(kind=kind, ref_id=OuterRef('id'), expires_at__gt=timezone.now())
+    if exclude_owner:
+        holds = holds.exclude(owner=exclude_owner)
+    total = holds.order_by().values('ref_id').annotate(total=Sum('quantity')).values('total')[:1]
+    return Coalesce(Subquery(total, output_field=IntegerField()), 0)
+
+
+def stock_levels(product_ids, size_ids, exclude_owner=None):
+    """
+    Fetch stock for many products and sizes in a single UNION query.
+
+    Live reservations held by anyone other than `exclude_owner` are
+    subtracted. Returns {('product'|'size', id): {'stock', 'reserved',
+    'available', 'product_id', 'is_active'}}.
+    """
+    product_ids, size_ids = set(product_ids), set(size_ids)
+    querysets = []
+    if product_ids:
+        querysets.append(
+            Product.objects.filter(id__in=product_ids).order_by()
+            .annotate(
+                kind=Value('product', output_field=CharField()), owner=F('id'),
+                reserved=_reserved_by_others('product', exclude_owner),
+            )
+            .values_list('kind', 'id', 'inventory_count', 'reserved', 'owner', 'is_active')
+        )
+    if size_ids:
+        querysets.append(
+            ProductSize.objects.filter(id__in=size_ids).order_by()
+            .annotate(
+                kind=Value('size', output_field=CharField()),
+                reserved=_reserved_by_others('size', exclude_owner),
+            )
+            .values_list('kind', 'id', 'stock_count', 'reserved', 'product_id', 'is_active')
+        )
+    if not querysets:
+        return {}
+
+    rows = querysets[0].union(*querysets[1:], all=True) if len(querysets) > 1 else querysets[0]
+    return _levels(rows)
+
+
+def _levels(rows):
+    return {
+        (kind, pk): {
+            'stock': stock,
+            'reserved': reserved,
+            'available': max(stock - reserved, 0),
+            'product_id': owner,
+            'is_active': is_active,
+        }
+        for kind, pk, stock, reserved, owner, is_active in rows
+    }
+
+
+def _line_ids(lines):
+    product_ids, size_ids = set(), set()
+    for line in lines.values():
+        product_ids.add(line['product_id'])
+        if line.get('variant_product_id'):
+            product_ids.add(line['variant_product_id'])
+        if line.get('size_id'):
+            size_ids.add(line['size_id'])
+    return product_ids, size_ids
+
+
+def validate_lines(lines, owner=None):
+    """
+    Check requested quantities against available stock for many cart lines.
+
+    `lines` maps an arbitrary label to a dict with product_id, size_id,
+    variant_product_id and quantity. Lines drawing on the same stock row are
+    summed; reservations of `owner` itself do not count against it. Returns
+    {label: error message} for every line that cannot be satisfied (empty dict
+    if all are fine). One query.
+    """
+    product_ids, size_ids = _line_ids(lines)
+    return line_errors(lines, stock_levels(product_ids, size_ids, exclude_owner=owner))
+
+
+def line_errors(lines, levels):
+    """validate_lines() against levels that were already fetched."""
+    requested = defaultdict(int)
+    for line in lines.values():
+        requested[stock_key(line['product_id'], line.get('size_id'), line.get('variant_product_id'))] += line['quantity']
+
+    errors = {}
+    for label, line in lines.items():
+        product = levels.get(('product', line['product_id']))
+        if not product or not product['is_active']:
+            errors[label] = "This product is no longer active."
+            continue
+        if line.get('variant_product_id'):
+            variant_product = levels.get(('product', line['variant_product_id']))
+            if not variant_product or not variant_product['is_active']:
+                errors[label] = "This variant is no longer available."
+                continue
+        if line.get('size_id'):
+            size = levels.get(('size', line['size_id']))
+            if not size or size['product_id'] != line['product_id']:
+                errors[label] = "Invalid size for this product."
+                continue
+
+        key = stock_key(line['product_id'], line.get('size_id'), line.get('variant_product_id'))
+        if requested[key] > levels[key]['available']:
+            errors[label] = f"Only {levels[key]['available']} units available."
+    return errors
+
+
+# -----------------------------------------------------------------------------
+# Ledger: every stock change is an InventoryMovement
+# -----------------------------------------------------------------------------
+
+STOCK_FIELDS = {
+    'product': (Product, 'inventory_count'),
+    'size': (ProductSize, 'stock_count'),
+}
+
+
+def movement(key, delta, reason, **fields):
+    """Build an (unsaved) ledger entry for stock row `key`."""
+    kind, ref_id = key
+    return InventoryMovement(kind=kind, ref_id=ref_id, delta=delta, reason=reason, **fields)
+
+
+def apply_movements(movements):
+    """
+    Apply ledger entries to stock balances and record them.
+
+    Balances change with one conditional UPDATE per table
+    (`SET stock = stock + delta WHERE stock >= -delta` for every row), so no
+    row lock is taken beforehand. If any row lacks the stock, InsufficientStock
+    is raised and the caller's transaction must be rolled back.
+    """
+    totals = defaultdict(int)
+    for entry in movements:
+        totals[(entry.kind, entry.ref_id)] += entry.delta
+
+    with transaction.atomic():
+        for kind, (model, field) in STOCK_FIELDS.items():
+            deltas = {ref_id: delta for (k, ref_id), delta in totals.items() if k == kind and delta}
+            if not deltas:
+                continue
+            enough = reduce(or_, (
+                Q(id=ref_id, **{f'{field}__gte': -delta}) if delta < 0 else Q(id=ref_id)
+                for ref_id, delta in deltas.items()
+            ))
+            updated = model.objects.filter(enough).update(**{field: Case(
+                *(When(id=ref_id, then=F(field) + Value(delta)) for ref_id, delta in deltas.items()),
+                default=F(field),
+                output_field=model._meta.get_field(field),
+            )})
+            if updated != len(deltas):
+                raise InsufficientStock(f"Stock changed for {len(deltas) - updated} {kind} row(s)")
+        InventoryMovement.objects.bulk_create(movements)
+    return movements
+
+
+def adjust(key, delta, reason='adjustment', created_by=None, note=''):
+    """Change one stock row by `delta` (e.g. an admin edit or a goods receipt)."""
+    if delta:
+        apply_movements([movement(key, delta, reason, created_by=created_by, note=note)])
+
+
+def restock_order(order, reason, order_items=None, created_by=None):
+    """
+    Put back the stock an order (or some of its items) took, as `reason`
+    movements. Only what is still outstanding is restored, so calling this
+    twice (or after a partial return) never restocks the same units again.
+    Orders placed before the ledger existed have no sale movements and are
+    left alone. Returns the movements applied.
+    """
+    outstanding = InventoryMovement.objects.filter(order=order, order_item__isnull=False)
+    if order_items is not None:
+        outstanding = outstanding.filter(order_item__in=order_items)
+    return _restock(outstanding, reason, created_by)
+
+
+def restock_orders(order_ids, reason, created_by=None):
+    """restock_order() for many whole orders, with one aggregate query."""
+    return _restock(
+        InventoryMovement.objects.filter(order_id__in=order_ids, order_item__isnull=False), reason, created_by
+    )
+
+
+def _restock(outstanding, reason, created_by):
+    outstanding = (
+        outstanding.order_by()
+        .values('order_id', 'order_item_id', 'kind', 'ref_id')
+        .annotate(net=Sum('delta'))
+        .filter(net__lt=0)
+    )
+    return apply_movements([
+        movement((row['kind'], row['ref_id']), -row['net'], reason,
+                 order_id=row['order_id'], order_item_id=row['order_item_id'], created_by=created_by)
+        for row in outstanding
+    ])
+
+
+def _ledger_total(kind):
+    total = (
+        InventoryMovement.objects.filter(kind=kind, ref_id=OuterRef('id'))
+        .order_by().values('ref_id').annotate(total=Sum('delta')).values('total')[:1]
+    )
+    return Coalesce(Subquery(total, output_field=IntegerField()), 0)
+
+
+def reconcile(fix=False):
+    """
+    Compare every stock balance with the sum of its ledger movements.
+
+    Returns [(kind, id, balance, ledger total)] for rows that drifted (stock
+    changed outside apply_movements()). With fix=True an 'adjustment'
+    movement is recorded for each so the ledger matches the balance again;
+    the balance itself is left as is.
+    """
+    drift = []
+    for kind, (model, field) in STOCK_FIELDS.items():
+        drift += [
+            (kind, pk, balance, ledger)
+            for pk, balance, ledger in
+            model.objects.annotate(ledger=_ledger_total(kind))
+            .exclude(**{field: F('ledger')})
+            .values_list('id', field, 'ledger')
+            .iterator()
+        ]
+    if fix and drift:
+        InventoryMovement.objects.bulk_create([
+            movement((kind, pk), balance - ledger, 'adjustment', note='Reconciliation')
+            for kind, pk, balance, ledger in drift
+        ], batch_size=1000)
+    return drift
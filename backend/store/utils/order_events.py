@@ -0,0 +1,42 @@
+"""
+Order status event log.
+
+Every change to Order.order_status / payment_status is recorded as an
+OrderEvent row (kind, previous -> new status, actor, source), written in
+bulk in the same transaction as the change. Bulk status changes go through
+order_transitions.transition(), which records its events here.
+"""
+
+from ..models import OrderEvent
+
+STATUS_FIELDS = {'order': 'order_status', 'payment': 'payment_status'}
+
+
+def event(order, kind, status, previous='', actor=None, source='', note=''):
+    """Build an (unsaved) event; `order` may be an Order or its id."""
+    order_id = getattr(order, 'pk', order)
+    return OrderEvent(
+        order_id=order_id, kind=kind, status=status, previous_status=previous or '',
+        actor=actor, source=source, note=note,
+    )
+
+
+def record(events):
+    """Write events in one INSERT."""
+    if events:
+        OrderEvent.objects.bulk_create(events)
+    return events
+
+
+def changes(order, previous, actor=None, source='', note=''):
+    """
+    Events for the status fields of `order` that differ from `previous`
+    ({'order_status': ..., 'payment_status': ...}; missing keys mean the
+    order is new, so its current statuses are recorded as initial events).
+    """
+    return [
+        event(order, kind, getattr(order, field), previous.get(field, ''), actor, source, note)
+        for kind, field in STATUS_FIELDS.items()
+        if getattr(order, field) != previous.get(field)
+    ]
+
@@ -0,0 +1,151 @@
+"""
+Bulk order status transitions.
+
+transition() moves any number of orders to a new order_status in batches of
+ORDER_TRANSITION_BATCH_SIZE. Each batch, in one transaction:
+
+- locks its rows and keeps only moves allowed by ALLOWED_TRANSITIONS,
+- writes them with a single UPDATE; per-row fields (payment_status,
+  delivered_at, tracking_number) are Case/When expressions,
+- records the OrderEvents in one INSERT,
+- returns stock through the ledger and coupon uses when cancelling,
+- enqueues one outbox message for the customer notifications.
+"""
+
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value, F
+from django.utils import timezone
+
+from ..models import Order
+from . import coupons, inventory, order_events, outbox, rollups
+
+ALLOWED_TRANSITIONS = {
+    'pending': {'processing', 'cancelled'},
+    'processing': {'shipped', 'cancelled'},
+    'shipped': {'delivered'},
+    'delivered': {'refunded'},
+    'cancelled': {'refunded'},
+    'refunded': set(),
+}
+
+NOTIFY_STATUSES = {'shipped', 'delivered', 'cancelled'}
+
+# Statuses that change what an order contributes to the sales rollups
+ROLLUP_STATUSES = {'cancelled', 'refunded'}
+
+
+def is_allowed(current, new):
+    return new in ALLOWED_TRANSITIONS.get(current, ())
+
+
+def refusal(current, new):
+    """Why an order in `current` cannot move to `new`, for staff-facing messages."""
+    if current == 'pending' and new != 'processing':
+        # Unpaid online orders must not ship; they move on once the payment is verified
+        return "payment has not been received yet"
+    allowed = ALLOWED_TRANSITIONS.get(current)
+    if not allowed:
+        return f"{current} is a final status"
+    return f"{current} orders can only move to {' or '.join(sorted(allowed))}"
+
+
+def _payment_after(order_status, payment_status, forced=None):
+    if forced:
+        return forced
+    if order_status == 'delivered' and payment_status == 'pending':
+        # Cash on delivery is collected by the courier
+        return 'paid'
+    return payment_status
+
+
+def _by_value(values, field):
+    """Case/When setting `field` per row from {pk: value}, one WHEN per distinct value."""
+    groups = defaultdict(list)
+    for pk, value in values.items():
+        groups[value].append(pk)
+    return Case(
+        *(When(pk__in=pks, then=Value(value)) for value, pks in groups.items()),
+        default=F(field),
+        output_field=Order._meta.get_field(field),
+    )
+
+
+def transition(queryset, order_status, actor=None, source='', note='',
+               payment_status=None, tracking_numbers=None, notify=True, batch_size=None):
+    """
+    Move the orders in `queryset` to `order_status`.
+
+    `payment_status` forces a payment status on every moved order (otherwise
+    delivery marks pending payments as paid); `tracking_numbers` maps order
+    id to a tracking number to set. Orders already in `order_status` are left
+    alone. Returns (ids of moved orders, {id: current status} of orders the
+    move is not allowed from).
+    """
+    if order_status not in ALLOWED_TRANSITIONS:
+        raise ValueError(f"Unknown order status '{order_status}'")
+    batch_size = batch_size or getattr(settings, 'ORDER_TRANSITION_BATCH_SIZE', 500)
+    tracking_numbers = {str(pk): number for pk, number in (tracking_numbers or {}).items()}
+
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    moved, skipped = [], {}
+    for start in range(0, len(pks), batch_size):
+        batch_moved, batch_skipped = _apply_batch(
+            queryset, pks[start:start + batch_size], order_status, actor, source, note,
+            payment_status, tracking_numbers, notify,
+        )
+        moved += batch_moved
+        skipped.update(batch_skipped)
+    return moved, skipped
+
+
+@transaction.atomic
+def _apply_batch(queryset, pks, order_status, actor, source, note, forced_payment, tracking_numbers, notify):
+    # Re-applying the queryset's filters under the lock drops orders that changed meanwhile
+    rows = (
+        queryset.select_for_update().filter(pk__in=pks).order_by('pk')
+        .values_list('pk', 'order_status', 'payment_status', 'delivered_at')
+    )
+    moved, skipped, events = [], {}, []
+    payments, tracking, stamped = {}, {}, []
+    for pk, current, paid, delivered_at in rows:
+        if current == order_status:
+            continue
+        if not is_allowed(current, order_status):
+            skipped[pk] = current
+            continue
+        moved.append(pk)
+        events.append(order_events.event(pk, 'order', order_status, current, actor, source, note))
+        new_payment = _payment_after(order_status, paid, forced_payment)
+        if new_payment != paid:
+            payments[pk] = new_payment
+            events.append(order_events.event(pk, 'payment', new_payment, paid, actor, source, note))
+        if str(pk) in tracking_numbers:
+            tracking[pk] = tracking_numbers[str(pk)]
+        if order_status == 'delivered' and delivered_at is None:
+            stamped.append(pk)
+    if not moved:
+        return moved, skipped
+
+    now = timezone.now()
+    updates = {'order_status': order_status, 'updated_at': now}
+    if payments:
+        updates['payment_status'] = _by_value(payments, 'payment_status')
+    if tracking:
+        updates['tracking_number'] = _by_value(tracking, 'tracking_number')
+    if stamped:
+        updates['delivered_at'] = _by_value(dict.fromkeys(stamped, now), 'delivered_at')
+    Order.objects.filter(pk__in=moved).update(**updates)
+    order_events.record(events)
+
+    if order_status == 'cancelled':
+        inventory.restock_orders(moved, 'cancel', created_by=actor)
+        redeemed = Order.objects.filter(pk__in=moved, coupon__isnull=False).values_list('coupon_id', flat=True)
+        for coupon_id, uses in Counter(redeemed).items():
+            coupons.release(coupon_id, uses)
+    if order_status in ROLLUP_STATUSES:
+        rollups.schedule(moved)
+    if notify and order_status in NOTIFY_STATUSES:
+        outbox.enqueue('email.order_status', {'order_ids': [str(pk) for pk in moved], 'status': order_status})
+    return moved, skipped
@@ -0,0 +1,141 @@
+"""
+Transactional outbox.
+
+Business code calls `enqueue(topic, payload)` inside its own transaction, so
+the side effect is recorded if and only if the change commits. Handlers are
+plain functions registered per topic with `@handler('topic')` (see
+store/tasks.py) and run by `manage.py run_outbox_worker`:
+
+- `claim()` picks due rows with SELECT ... FOR UPDATE SKIP LOCKED, so any
+  number of workers can run side by side without a broker.
+- A failed handler is retried with exponential backoff up to
+  OUTBOX_MAX_ATTEMPTS, then the row is marked 'dead' for inspection.
+- Rows claimed by a worker that died are picked up again once their lease
+  (OUTBOX_LEASE_SECONDS) runs out, so handlers must be idempotent.
+"""
+
+import random
+import logging
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import Q, F, Min, Count
+from django.utils import timezone
+
+from ..models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def handler(topic):
+    """Register `fn(payload)` as the handler for `topic`."""
+    def decorator(fn):
+        _handlers[topic] = fn
+        return fn
+    return decorator
+
+
+def enqueue(topic, payload=None, delay=0):
+    """Record a side effect; call inside the transaction making the change."""
+    return OutboxMessage.objects.create(
+        topic=topic,
+        payload=payload or {},
+        available_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _backoff(attempts):
+    """Seconds until the next try: exponential with jitter, capped."""
+    base = _setting('OUTBOX_RETRY_BASE_SECONDS', 5)
+    cap = _setting('OUTBOX_RETRY_MAX_SECONDS', 60 * 60)
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(batch_size=50):
+    """Lock and mark up to `batch_size` due messages as processing; returns them."""
+    now = timezone.now()
+    lease_expired = now - timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 300))
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status='pending', available_at__lte=now)
+                | Q(status='processing', locked_at__lt=lease_expired)
+            )
+            .order_by('available_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        OutboxMessage.objects.filter(id__in=ids).update(
+            status='processing', locked_at=now, attempts=F('attempts') + 1
+        )
+    return list(OutboxMessage.objects.filter(id__in=ids).order_by('available_at', 'id'))
+
+
+def process(message):
+    """Run one claimed message and record the outcome. Returns the new status."""
+    close_old_connections()
+    try:
+        fn = _handlers.get(message.topic)
+        if fn is None:
+            raise LookupError(f"No outbox handler registered for topic '{message.topic}'")
+        fn(message.payload)
+    except Exception as e:
+        dead = message.attempts >= _setting('OUTBOX_MAX_ATTEMPTS', 8)
+        new_status = 'dead' if dead else 'pending'
+        log = logger.error if dead else logger.warning
+        log(f"Outbox {message} attempt {message.attempts} failed: {e}")
+        updates = {
+            'status': new_status,
+            'last_error': traceback.format_exc()[-4000:],
+            'available_at': timezone.now() + timedelta(seconds=_backoff(message.attempts)),
+        }
+    else:
+        new_status = 'done'
+        updates = {'status': 'done', 'processed_at': timezone.now(), 'last_error': ''}
+
+    # Only record the outcome if our lease was not taken over meanwhile
+    OutboxMessage.objects.filter(id=message.id, locked_at=message.locked_at).update(**updates)
+    return new_status
+
+
+def stats():
+    """Backlog and lag figures for monitoring."""
+    now = timezone.now()
+    counts = dict(
+        OutboxMessage.objects.exclude(status='done').order_by()
+        .values_list('status').annotate(n=Count('id'))
+    )
+    oldest_due = OutboxMessage.objects.filter(status='pending', available_at__lte=now).aggregate(
+        oldest=Min('available_at')
+    )['oldest']
+    return {
+        'pending': counts.get('pending', 0),
+        'processing': counts.get('processing', 0),
+        'dead': counts.get('dead', 0),
+        # How far behind the worker is: age of the oldest message that is due
+        'lag_seconds': round((now - oldest_due).total_seconds(), 1) if oldest_due else 0.0,
+    }
+
+
+def purge_done(older_than_days=7, batch_size=5000):
+    """Delete processed messages older than `older_than_days`. Returns count."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    removed = 0
+    while True:
+        ids = list(
+            OutboxMessage.objects.filter(status='done', processed_at__lt=cutoff)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += OutboxMessage.objects.filter(id__in=ids).delete()[0]
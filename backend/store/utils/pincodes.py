@@ -0,0 +1,202 @@
+"""
+Pincode serviceability, shipping zones and delivery estimates.
+
+`manage.py load_pincodes` compiles a CSV into one binary file
+(PINCODE_INDEX_PATH) that every worker mmaps read-only, so ~150k pincodes
+cost a few hundred KB of shared page cache and no per-process parsing:
+
+    header   MAGIC, record count, zone names (JSON)
+    keys     sorted uint32 pincodes, little-endian
+    values   4 bytes per pincode: zone index, ETA min days, ETA max days, COD
+
+Lookups binary-search the keys in place (O(log n), microseconds). The
+loader replaces the file atomically and workers re-open it when it changes.
+When no index has been loaded every pincode counts as serviceable at the
+flat shipping rate, so nothing breaks before the first load.
+"""
+
+import os
+import csv
+import mmap
+import json
+import time
+import bisect
+import struct
+import threading
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.utils import timezone
+
+MAGIC = b'PINIDX01'
+_HEADER = struct.Struct('<8sII')  # magic, record count, zone JSON length
+_VALUE = struct.Struct('<BBBB')  # zone index, ETA min, ETA max, COD
+
+Serviceability = namedtuple('Serviceability', 'pincode zone eta_min_days eta_max_days cod')
+
+
+class PincodeIndexError(ValueError):
+    """The CSV or index file is malformed."""
+
+
+def index_path():
+    return str(getattr(settings, 'PINCODE_INDEX_PATH', os.path.join(settings.BASE_DIR, 'data', 'pincodes.idx')))
+
+
+def normalize(pincode):
+    """The pincode as an int, or None if it is not 6 digits."""
+    pincode = str(pincode or '').replace(' ', '')
+    if len(pincode) != 6 or not pincode.isdigit() or pincode[0] == '0':
+        return None
+    return int(pincode)
+
+
+# -----------------------------------------------------------------------------
+# Building
+# -----------------------------------------------------------------------------
+
+def read_csv(path):
+    """
+    Parse a CSV with columns pincode, zone, eta_min_days, eta_max_days and
+    optionally cod (1/0, yes/no; default yes). Later rows win on duplicates.
+    Returns {pincode: (zone, eta_min, eta_max, cod)}.
+    """
+    rows = {}
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        required = {'pincode', 'zone', 'eta_min_days', 'eta_max_days'}
+        if not required <= set(reader.fieldnames or []):
+            raise PincodeIndexError(f"CSV needs the columns {', '.join(sorted(required))}")
+        for line, row in enumerate(reader, start=2):
+            pincode = normalize(row['pincode'])
+            zone = (row['zone'] or '').strip().upper()
+            try:
+                eta_min, eta_max = int(row['eta_min_days']), int(row['eta_max_days'])
+            except (TypeError, ValueError):
+                eta_min = eta_max = -1
+            if pincode is None or not zone or not 0 <= eta_min <= eta_max <= 255:
+                raise PincodeIndexError(f"Line {line}: invalid row {row}")
+            cod = (row.get('cod') or 'yes').strip().lower() not in ('0', 'no', 'n', 'false')
+            rows[pincode] = (zone, eta_min, eta_max, cod)
+    return rows
+
+
+def write_index(rows, path=None):
+    """Write {pincode: (zone, eta_min, eta_max, cod)} as an index file, atomically."""
+    path = path or index_path()
+    zones = sorted({zone for zone, _, _, _ in rows.values()})
+    if len(zones) > 255:
+        raise PincodeIndexError("At most 255 zones are supported")
+    zone_ids = {zone: i for i, zone in enumerate(zones)}
+    zone_json = json.dumps(zones).encode()
+    zone_json += b' ' * (-(_HEADER.size + len(zone_json)) % 4)  # keep the keys 4-byte aligned
+
+    pincodes = sorted(rows)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.tmp{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(pincodes), len(zone_json)))
+        f.write(zone_json)
+        f.write(struct.pack(f'<{len(pincodes)}I', *pincodes))
+        for pincode in pincodes:
+            zone, eta_min, eta_max, cod = rows[pincode]
+            f.write(_VALUE.pack(zone_ids[zone], eta_min, eta_max, cod))
+    # Workers keep reading the old file until they notice the new one
+    os.replace(tmp, path)
+    return len(pincodes), zones
+
+
+# -----------------------------------------------------------------------------
+# Lookups
+# -----------------------------------------------------------------------------
+
+class _Index:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, zone_len = _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise PincodeIndexError(f"{path} is not a pincode index")
+        self.zones = json.loads(self.mm[_HEADER.size:_HEADER.size + zone_len])
+        self.keys_at = _HEADER.size + zone_len
+        self.values_at = self.keys_at + 4 * self.count
+        self.keys = _Keys(self.mm, self.keys_at, self.count)
+
+    def get(self, pincode):
+        i = bisect.bisect_left(self.keys, pincode)
+        if i == self.count or self.keys[i] != pincode:
+            return None
+        zone, eta_min, eta_max, cod = _VALUE.unpack_from(self.mm, self.values_at + 4 * i)
+        return Serviceability(str(pincode), self.zones[zone], eta_min, eta_max, bool(cod))
+
+
+class _Keys:
+    """Read-only sequence view of the packed pincodes, for bisect."""
+    _KEY = struct.Struct('<I')
+
+    def __init__(self, mm, offset, count):
+        self.mm, self.offset, self.count = mm, offset, count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self._KEY.unpack_from(self.mm, self.offset + 4 * i)[0]
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'checked_at': 0.0}
+
+
+def _index():
+    """This process's mmap of the index (None if there is none), re-opened when the file changes."""
+    now = time.monotonic()
+    if now - _state['checked_at'] < getattr(settings, 'PINCODE_INDEX_CHECK_SECONDS', 30):
+        return _state['index']
+    with _lock:
+        current = _state['index']
+        try:
+            stat = os.stat(index_path())
+        except FileNotFoundError:
+            _state['index'] = None
+        else:
+            if current is None or (stat.st_ino, stat.st_mtime_ns) != (current.stat.st_ino, current.stat.st_mtime_ns):
+                _state['index'] = _Index(index_path())
+        _state['checked_at'] = now
+        return _state['index']
+
+
+def is_loaded():
+    return _index() is not None
+
+
+def lookup(pincode):
+    """Serviceability for `pincode`, or None if it is not served (or invalid)."""
+    number = normalize(pincode)
+    index = _index()
+    if number is None or index is None:
+        return None
+    return index.get(number)
+
+
+def is_serviceable(pincode):
+    if normalize(pincode) is None:
+        return False
+    return not is_loaded() or lookup(pincode) is not None
+
+
+def zone_shipping_fee(zone):
+    """Shipping fee for a zone (PINCODE_ZONE_SHIPPING), or None to use the flat fee."""
+    fee = getattr(settings, 'PINCODE_ZONE_SHIPPING', {}).get(zone)
+    return Decimal(str(fee)).quantize(Decimal('0.01')) if fee is not None else None
+
+
+def delivery_estimate(pincode, start=None):
+    """(earliest, latest) delivery dates for an order placed `start` (default today), or None."""
+    service = lookup(pincode)
+    if service is None:
+        return None
+    start = start or timezone.localdate()
+    return start + timedelta(days=service.eta_min_days), start + timedelta(days=service.eta_max_days)
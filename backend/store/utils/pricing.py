@@ -0,0 +1,186 @@
+"""
+Basket pricing shared by the cart view, quotes and checkout.
+
+price_lines() prices a whole basket in one pass over Decimals: unit prices
+(Product.final_price of the variant product if one is picked), GST per line
+from Product.tax_percent, and shipping. with_shipping() charges shipping by
+the destination's pincode zone and with_coupon() applies a coupon on top.
+
+Basket results are cached under a digest of the cart's lines, which changes
+with every cart write and so acts as its version. Saving a product bumps a
+catalog version that is part of the key, so price edits are picked up at
+once; PRICING_CACHE_TTL bounds anything else (bulk updates).
+"""
+
+import hashlib
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from ..models import Product
+from . import cart_store, coupons, pincodes
+from .cache_backend import version_seed
+
+CATALOG_VERSION_KEY = 'pricing:catalog_version'
+
+FREE_SHIPPING_ABOVE = Decimal('1000')
+SHIPPING_FEE = Decimal('99.00')
+
+CENT = Decimal('0.01')
+
+
+def _money(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _bump_catalog_version():
+    cache.add(CATALOG_VERSION_KEY, version_seed(), timeout=None)
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, version_seed(), timeout=None)
+
+
+def invalidate(**kwargs):
+    """Signal receiver: drop all cached basket prices once the product change commits."""
+    transaction.on_commit(_bump_catalog_version)
+
+
+post_save.connect(invalidate, sender=Product, dispatch_uid='pricing.catalog_version_on_save')
+post_delete.connect(invalidate, sender=Product, dispatch_uid='pricing.catalog_version_on_delete')
+
+
+def catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, version_seed(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 0)
+    return version
+
+
+def _cache_key(lines):
+    digest = hashlib.sha1(repr(sorted(lines.items())).encode()).hexdigest()
+    return f'pricing:{catalog_version()}:{digest}'
+
+
+def shipping_for(subtotal, pincode=None):
+    """Free above FREE_SHIPPING_ABOVE, else the destination zone's fee (or the flat fee)."""
+    if subtotal > FREE_SHIPPING_ABOVE:
+        return Decimal('0.00')
+    service = pincodes.lookup(pincode) if pincode else None
+    fee = pincodes.zone_shipping_fee(service.zone) if service else None
+    return SHIPPING_FEE if fee is None else fee
+
+
+def price_lines(lines, products=None):
+    """
+    Price a basket given as {line key: quantity} (see cart_store.line_key).
+
+    `products` ({id: Product}) may pass products the caller already loaded;
+    the rest are fetched in one query. Returns {'lines': {key: {'unit_price',
+    'quantity', 'line_total', 'tax_percent', 'tax'}}, 'subtotal',
+    'tax_amount', 'shipping_cost', 'discount_amount', 'coupon', 'pincode',
+    'total'}; lines whose product no longer exists are left out.
+    """
+    key = _cache_key(lines)
+    pricing = cache.get(key)
+    if pricing is None:
+        pricing = _compute(lines, products or {})
+        cache.set(key, pricing, getattr(settings, 'PRICING_CACHE_TTL', 300))
+    return pricing
+
+
+def _compute(lines, products):
+    parsed = {key: cart_store.parse_line_key(key) for key in lines}
+    wanted = {ids['variant_product_id'] or ids['product_id'] for ids in parsed.values()}
+    missing = wanted - set(products)
+    if missing:
+        products = {
+            **products,
+            **Product.objects.only('id', 'price', 'discount_price', 'tax_percent').in_bulk(missing),
+        }
+
+    priced = {}
+    subtotal = tax_amount = Decimal('0')
+    for key, ids in parsed.items():
+        product = products.get(ids['variant_product_id'] or ids['product_id'])
+        if product is None:
+            continue
+        unit_price = product.final_price
+        line_total = unit_price * lines[key]
+        tax = _money(line_total * product.tax_percent / 100)
+        priced[key] = {
+            'unit_price': unit_price,
+            'quantity': lines[key],
+            'line_total': line_total,
+            'tax_percent': product.tax_percent,
+            'tax': tax,
+        }
+        subtotal += line_total
+        tax_amount += tax
+
+    shipping_cost = shipping_for(subtotal)
+    return {
+        'lines': priced,
+        'subtotal': _money(subtotal),
+        'tax_amount': _money(tax_amount),
+        'shipping_cost': shipping_cost,
+        'discount_amount': Decimal('0.00'),
+        'coupon': None,
+        'pincode': None,
+        'total': _money(subtotal + tax_amount + shipping_cost),
+    }
+
+
+def with_shipping(pricing, pincode):
+    """`pricing` with shipping charged for delivery to `pincode` (the cached result is not modified)."""
+    shipping_cost = shipping_for(pricing['subtotal'], pincode)
+    return {
+        **pricing,
+        'shipping_cost': shipping_cost,
+        'pincode': pincode,
+        'total': pricing['total'] - pricing['shipping_cost'] + shipping_cost,
+    }
+
+
+def with_coupon(pricing, code):
+    """
+    `pricing` with `code` applied (the cached result is not modified).
+    Returns (pricing, Coupon); raises coupons.CouponError if it does not apply.
+    """
+    coupon, discount = coupons.evaluate(code, pricing['subtotal'])
+    return {
+        **pricing,
+        'discount_amount': discount,
+        'coupon': coupon.code,
+        'total': pricing['total'] - discount,
+    }, coupon
+
+
+def summary(pricing):
+    """The totals of `pricing` as strings, for API responses."""
+    return {
+        field: str(pricing[field])
+        for field in ('subtotal', 'tax_amount', 'shipping_cost', 'discount_amount', 'total')
+    }
+
+
+def item_lines(items):
+    """{line key: quantity} for CartItem objects."""
+    lines = defaultdict(int)
+    for item in items:
+        lines[cart_store.item_line_key(item)] += item.quantity
+    return dict(lines)
+
+
+def basket_pricing(items):
+    """price_lines() for CartItem objects, reusing the products they already loaded."""
+    products = {}
+    for item in items:
+        for product in (item.product, item.variant_product):
+            if product is not None:
+                products[product.id] = product
+    return price_lines(item_lines(items), products)
@@ -0,0 +1,85 @@
+"""
+Checkout quotes.
+
+POST /orders/quote/ prices the cart (utils/pricing.py) and checks stock
+without locking anything, then keeps the result in the cache for QUOTE_TTL
+seconds. The client gets a signed quote_id; passing it to order creation
+pins the quoted totals, so checkout only re-verifies that the cart, catalog
+prices and coupon are unchanged (and stock, as always) inside its
+transaction.
+"""
+
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import coupons, pricing
+
+SALT = 'store.quotes'
+
+
+class QuoteError(Exception):
+    """The quote cannot be used; the message is safe to show to the customer."""
+
+
+def _ttl():
+    return getattr(settings, 'QUOTE_TTL', 10 * 60)
+
+
+def _key(quote_id):
+    return f'quote:{quote_id}'
+
+
+def create(user, lines, priced):
+    """
+    Store a quote for `lines` ({line key: quantity}) priced as `priced`.
+    Returns (signed quote_id, expires_at).
+    """
+    quote_id = uuid.uuid4().hex
+    cache.set(_key(quote_id), {
+        'user_id': user.id,
+        'lines': lines,
+        'pricing': priced,
+        'catalog_version': pricing.catalog_version(),
+    }, _ttl())
+    return signing.TimestampSigner(salt=SALT).sign(quote_id), timezone.now() + timedelta(seconds=_ttl())
+
+
+def load(signed_id, user):
+    """Return (quote_id, quote) for a signed id issued to `user`; raises QuoteError."""
+    try:
+        quote_id = signing.TimestampSigner(salt=SALT).unsign(str(signed_id), max_age=_ttl())
+    except signing.SignatureExpired:
+        raise QuoteError("This quote has expired. Please review your order again.")
+    except signing.BadSignature:
+        raise QuoteError("Invalid quote.")
+    quote = cache.get(_key(quote_id))
+    if quote is None or quote['user_id'] != user.id:
+        raise QuoteError("This quote has expired. Please review your order again.")
+    return quote_id, quote
+
+
+def verify(quote, lines, pincode):
+    """
+    Check `quote` still applies to the cart `lines` shipped to `pincode`.
+    Returns the quote's Coupon (or None); raises QuoteError if the cart,
+    destination, prices or coupon changed.
+    """
+    if quote['lines'] != lines:
+        raise QuoteError("Your cart changed since this quote. Please review your order again.")
+    if quote['pricing'].get('pincode') not in (None, pincode):
+        raise QuoteError("The shipping address changed since this quote. Please review your order again.")
+    if quote['catalog_version'] != pricing.catalog_version():
+        raise QuoteError("Prices changed since this quote. Please review your order again.")
+    code = quote['pricing']['coupon']
+    coupon = coupons.get(code) if code else None
+    if code and coupon is None:
+        raise QuoteError("The coupon on this quote is no longer available.")
+    return coupon
+
+
+def discard(quote_id):
+    cache.delete(_key(quote_id))
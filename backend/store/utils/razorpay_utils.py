@@ -1,18 +1,236 @@
 """
 Razorpay Payment Gateway Utilities.
 Handles order creation, payment verification, and signature validation.
+
+All calls go through one razorpay.Client per process (get_client()), built
+on a requests session with a keep-alive connection pool, so checkout does
+not pay for a TLS handshake per call. Every request has connect/read
+timeouts (RAZORPAY_CONNECT_TIMEOUT, RAZORPAY_READ_TIMEOUT). GETs
+(payment.fetch) are retried with backoff on connection errors, timeouts and
+5xx/429 by the pool itself. order.create is retried here instead (the only
+retry layer for it), and only after checking by receipt that a failed
+attempt which reached the gateway did not create the order anyway. Latency and error counts per operation are counted in process and
+added to the shared cache in batches (stats(), `manage.py razorpay_stats`).
+RAZORPAY_BASE_URL points the client at a stub server (`manage.py
+razorpay_stub`) for local testing.
 """
 
+import os
+import time
+import atexit
+import random
 import razorpay
 import hashlib
 import hmac
+import threading
+import requests
+from collections import Counter
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.retry import Retry
+from razorpay.errors import BadRequestError, GatewayError, ServerError
 from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction
 from decimal import Decimal
 import logging
 
+from ..models import Order
+from . import order_events, order_transitions
+from .cache_backend import execute_redis, RedisUnavailable
+
 logger = logging.getLogger(__name__)
 
+# Failures after which an order.create may or may not have gone through
+AMBIGUOUS_ERRORS = (requests.exceptions.RequestException, GatewayError, ServerError)
+
+OPERATIONS = ('order.create', 'order.lookup', 'payment.fetch')
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000)
+METRICS_PREFIX = 'razorpay:metrics'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class _TimeoutSession(requests.Session):
+    """Session that applies a default (connect, read) timeout to every request."""
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(*args, **kwargs)
+
+
+class _GetRetry(Retry):
+    """Retry that leaves other methods alone, connection errors included (their callers retry)."""
+
+    def increment(self, method=None, *args, **kwargs):
+        if method and method.upper() not in self.allowed_methods:
+            # Exhausted from the start: the error is raised on the first failure
+            return Retry.increment(self.new(total=0), method, *args, **kwargs)
+        return super().increment(method, *args, **kwargs)
+
+
+def _never_sent(error):
+    """True if `error` happened before a connection was made, so the gateway never saw the request."""
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectTimeout) or isinstance(reason, ConnectTimeoutError)
+
+
+def _session():
+    session = _TimeoutSession((
+        _setting('RAZORPAY_CONNECT_TIMEOUT', 3.05),
+        _setting('RAZORPAY_READ_TIMEOUT', 10.0),
+    ))
+    retries = _setting('RAZORPAY_MAX_RETRIES', 2)
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=_setting('RAZORPAY_POOL_SIZE', 10),
+        # GETs only: they are safe to repeat. order.create (POST) is retried by
+        # create_razorpay_order(), so a retry loop never runs inside another
+        max_retries=_GetRetry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET'}), raise_on_status=False,
+        ),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_client_lock = threading.Lock()
+_client_state = {'client': None, 'pid': None}
+
+
+def get_client():
+    """The process-wide razorpay.Client, created on first use (and again after a fork)."""
+    if not settings.RAZORPAY_KEY_ID or not settings.RAZORPAY_KEY_SECRET:
+        raise ValueError(
+            "Razorpay credentials not configured. "
+            "Set RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET in environment variables."
+        )
+    with _client_lock:
+        if _client_state['client'] is None or _client_state['pid'] != os.getpid():
+            options = {}
+            base_url = _setting('RAZORPAY_BASE_URL', '')
+            if base_url:
+                options['base_url'] = base_url.rstrip('/')
+            _client_state['client'] = razorpay.Client(
+                session=_session(), auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET), **options
+            )
+            _client_state['pid'] = os.getpid()
+        return _client_state['client']
+
+
+def reset_client():
+    """Drop the shared client, e.g. after changing settings; the next call builds a new one."""
+    with _client_lock:
+        _client_state['client'] = None
+
+
+# -----------------------------------------------------------------------------
+# Metrics
+# -----------------------------------------------------------------------------
+
+_metrics_lock = threading.Lock()
+_metrics = {'pending': Counter(), 'flushed_at': time.monotonic()}
+
+
+def _count(counts):
+    """
+    Bump process-local counters. They reach the shared cache in one batch
+    every RAZORPAY_METRICS_FLUSH_SECONDS (and at exit), not one write per call.
+    """
+    with _metrics_lock:
+        _metrics['pending'].update(counts)
+        due = time.monotonic() - _metrics['flushed_at'] >= _setting('RAZORPAY_METRICS_FLUSH_SECONDS', 10)
+    if due:
+        flush_metrics()
+
+
+def _incr(key, delta):
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, delta, timeout=None)
+
+
+def flush_metrics():
+    """Add this process's pending counters to the shared cache, in one Redis pipeline when possible."""
+    with _metrics_lock:
+        pending, _metrics['pending'] = _metrics['pending'], Counter()
+        _metrics['flushed_at'] = time.monotonic()
+    if not pending:
+        return
+
+    def run(client):
+        pipe = client.pipeline(transaction=False)
+        for key, delta in pending.items():
+            pipe.incrby(cache.make_key(key), delta)
+        pipe.execute()
+
+    try:
+        execute_redis(run)
+    except RedisUnavailable:
+        for key, delta in pending.items():
+            _incr(key, delta)
+
+
+atexit.register(flush_metrics)
+
+
+def _record(operation, started, failure=None):
+    """Count a call; `failure` is the counter for a failed one ('errors' or 'rejected')."""
+    elapsed_ms = (time.monotonic() - started) * 1000
+    prefix = f'{METRICS_PREFIX}:{operation}'
+    bucket = next((f'le_{limit}' for limit in LATENCY_BUCKETS_MS if elapsed_ms <= limit), 'le_inf')
+    counts = {f'{prefix}:calls': 1, f'{prefix}:total_ms': int(elapsed_ms), f'{prefix}:{bucket}': 1}
+    if failure:
+        counts[f'{prefix}:{failure}'] = 1
+    _count(counts)
+    if failure:
+        logger.warning(f"razorpay {operation} failed ({failure}) after {elapsed_ms:.0f}ms")
+    else:
+        logger.info(f"razorpay {operation} ok in {elapsed_ms:.0f}ms")
+
+
+def _call(operation, fn):
+    """Run one gateway call, recording its latency and outcome."""
+    started = time.monotonic()
+    try:
+        result = fn()
+    except BadRequestError:
+        _record(operation, started, 'rejected')
+        raise
+    except Exception:
+        _record(operation, started, 'errors')
+        raise
+    _record(operation, started)
+    return result
+
+
+def stats():
+    """
+    Gateway call counts, errors, retries and latency per operation, across
+    processes (each process's counts show up once it has flushed them).
+    """
+    flush_metrics()
+    names = ['calls', 'errors', 'rejected', 'retries', 'total_ms'] + [f'le_{limit}' for limit in LATENCY_BUCKETS_MS] + ['le_inf']
+    keys = [f'{METRICS_PREFIX}:{operation}:{name}' for operation in OPERATIONS for name in names]
+    values = cache.get_many(keys)
+    result = {}
+    for operation in OPERATIONS:
+        figures = {name: values.get(f'{METRICS_PREFIX}:{operation}:{name}', 0) for name in names}
+        total_ms = figures.pop('total_ms')
+        figures['avg_ms'] = round(total_ms / figures['calls'], 1) if figures['calls'] else 0.0
+        result[operation] = figures
+    return result
+
 
 class RazorpayPaymentHandler:
     """
@@ -21,16 +239,8 @@ class RazorpayPaymentHandler:
     """
     
     def __init__(self):
-        """Initialize Razorpay client with API keys from settings."""
-        if not settings.RAZORPAY_KEY_ID or not settings.RAZORPAY_KEY_SECRET:
-            raise ValueError(
-                "Razorpay credentials not configured. "
-                "Set RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET in environment variables."
-            )
-        
-        self.client = razorpay.Client(
-            auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET)
-        )
+        """Use the shared pooled client (see get_client())."""
+        self.client = get_client()
         self.key_id = settings.RAZORPAY_KEY_ID
         self.key_secret = settings.RAZORPAY_KEY_SECRET
     
@@ -50,22 +260,47 @@ class RazorpayPaymentHandler:
         Raises:
             Exception: If Razorpay API call fails
         """
+        data = {
+            'amount': amount_in_paise,
+            'currency': 'INR',
+            'receipt': str(order_id),  # Your order ID as receipt
+            'notes': {
+                'order_id': str(order_id),
+            }
+        }
+        attempts = _setting('RAZORPAY_MAX_RETRIES', 2) + 1
+        for attempt in range(1, attempts + 1):
+            try:
+                razorpay_order = _call('order.create', lambda: self.client.order.create(data=data))
+                logger.info(f"Razorpay order created: {razorpay_order['id']}")
+                return razorpay_order
+            except AMBIGUOUS_ERRORS as e:
+                # The request may have reached Razorpay: reuse the order if it exists
+                existing = None if _never_sent(e) else self._find_order(str(order_id), amount_in_paise)
+                if existing:
+                    logger.info(f"Razorpay order {existing['id']} found by receipt after: {e}")
+                    return existing
+                if attempt == attempts:
+                    logger.error(f"Failed to create Razorpay order: {str(e)}")
+                    raise Exception(f"Failed to create payment order: {str(e)}")
+                _count({f'{METRICS_PREFIX}:order.create:retries': 1})
+                time.sleep(0.3 * 2 ** (attempt - 1) * random.uniform(0.8, 1.2))
+            except Exception as e:
+                logger.error(f"Failed to create Razorpay order: {str(e)}")
+                raise Exception(f"Failed to create payment order: {str(e)}")
+
+    def _find_order(self, receipt, amount_in_paise):
+        """An unpaid Razorpay order for `receipt` and amount, or None (also if the lookup fails)."""
         try:
-            razorpay_order = self.client.order.create(
-                data={
-                    'amount': amount_in_paise,
-                    'currency': 'INR',
-                    'receipt': str(order_id),  # Your order ID as receipt
-                    'notes': {
-                        'order_id': str(order_id),
-                    }
-                }
-            )
-            logger.info(f"Razorpay order created: {razorpay_order['id']}")
-            return razorpay_order
+            orders = _call('order.lookup', lambda: self.client.order.all({'receipt': receipt}))
         except Exception as e:
-            logger.error(f"Failed to create Razorpay order: {str(e)}")
-            raise Exception(f"Failed to create payment order: {str(e)}")
+            logger.warning(f"Razorpay order lookup for receipt {receipt} failed: {e}")
+            return None
+        return next((
+            order for order in orders.get('items', [])
+            if order.get('receipt') == receipt and order.get('amount') == amount_in_paise
+            and order.get('status') == 'created'
+        ), None)
     
     def verify_payment_signature(self, razorpay_order_id, razorpay_payment_id, razorpay_signature):
         """
@@ -119,8 +354,7 @@ class RazorpayPaymentHandler:
             Exception: If API call fails
         """
         try:
-            payment = self.client.payment.fetch(razorpay_payment_id)
-            return payment
+            return _call('payment.fetch', lambda: self.client.payment.fetch(razorpay_payment_id))
         except Exception as e:
             logger.error(f"Failed to fetch payment details: {str(e)}")
             raise Exception(f"Failed to fetch payment details: {str(e)}")
@@ -173,6 +407,23 @@ def handle_razorpay_payment_for_order(order, total_amount_in_rupees):
     }
 
 
+def release_unpaid_order(order):
+    """
+    Compensating action when the gateway order could not be created after
+    checkout committed: cancel the still-unpaid order and return its stock
+    and coupon use (the cancel transition releases both).
+    Does nothing if the order has moved on (e.g. it was paid meanwhile).
+    """
+    released, _ = order_transitions.transition(
+        Order.objects.filter(id=order.id, payment_status='pending', order_status='pending'),
+        'cancelled', source='payment', note='Payment initialization failed',
+        payment_status='failed', notify=False,
+    )
+    if released:
+        logger.info(f"Order {order.id} cancelled and stock released after payment initialization failed")
+    return bool(released)
+
+
 def verify_and_process_razorpay_payment(order, razorpay_payment_id, razorpay_order_id, razorpay_signature):
     """
     Verify Razorpay payment signature and mark order as paid if valid.
@@ -249,11 +500,13 @@ def verify_and_process_razorpay_payment(order, razorpay_payment_id, razorpay_ord
 
     # All checks passed; update order with payment details
     with transaction.atomic():
+        previous = {'order_status': order.order_status, 'payment_status': order.payment_status}
         order.razorpay_payment_id = razorpay_payment_id
         order.razorpay_signature = razorpay_signature
         order.payment_status = 'paid'
         order.order_status = 'processing'  # Move to processing after payment
         order.save(update_fields=['razorpay_payment_id', 'razorpay_signature', 'payment_status', 'order_status'])
+        order_events.record(order_events.changes(order, previous, actor=order.user, source='payment'))
 
     logger.info(f"Order {order.id} payment verified and marked as paid")
     return True, "Payment verified successfully. Order is now being processed."
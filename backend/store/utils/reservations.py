@@ -0,0 +1,77 @@
+"""
+Soft stock reservations for carts.
+
+Every cart write re-syncs the owner's holds to match the cart (one upsert plus
+one delete) and pushes their expiry out by STOCK_RESERVATION_TTL. Stock checks
+in inventory.stock_levels() subtract live holds of *other* owners, and
+checkout consumes the buyer's holds. Expired rows are ignored by every query
+and removed in bulk by `manage.py reap_reservations`.
+"""
+
+from datetime import timedelta
+from collections import defaultdict
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import StockReservation
+from . import cart_store, inventory
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+
+
+def user_owner(user):
+    return f'user:{user.id}'
+
+
+def guest_owner(token):
+    return f'guest:{token}'
+
+
+def hold(owner, lines):
+    """
+    Make `owner`'s reservations match `lines` ({line key: quantity}, the full
+    cart). Lines sharing a stock row are summed.
+    """
+    wanted = defaultdict(int)
+    for key, quantity in lines.items():
+        ids = cart_store.parse_line_key(key)
+        wanted[inventory.stock_key(ids['product_id'], ids['size_id'], ids['variant_product_id'])] += quantity
+
+    expires_at = timezone.now() + _ttl()
+    if wanted:
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(owner=owner, kind=kind, ref_id=ref_id, quantity=quantity, expires_at=expires_at)
+                for (kind, ref_id), quantity in wanted.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['owner', 'kind', 'ref_id'],
+            update_fields=['quantity', 'expires_at'],
+        )
+
+    stale = StockReservation.objects.filter(owner=owner)
+    for kind in ('product', 'size'):
+        ref_ids = [ref_id for (k, ref_id) in wanted if k == kind]
+        if ref_ids:
+            stale = stale.exclude(kind=kind, ref_id__in=ref_ids)
+    stale.delete()
+
+
+def release(owner):
+    """Drop all of `owner`'s holds (checkout consumed them, or the cart moved)."""
+    StockReservation.objects.filter(owner=owner).delete()
+
+
+def reap(batch_size=5000):
+    """Delete expired holds in batches. Returns the number removed."""
+    removed = 0
+    now = timezone.now()
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += StockReservation.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,203 @@
+"""
+Daily sales rollups (DailySales) per product, category, brand and payment
+method, so dashboards read a few thousand pre-aggregated rows instead of
+scanning order items.
+
+Rows are maintained incrementally: whatever changes an order's sale or its
+returns calls schedule(), and the 'rollups.refresh' outbox handler runs
+refresh(). SalesRollupState remembers what each order currently contributes
+(whether the sale is counted, which items are counted as returned); refresh()
+recomputes the wanted state from the order and applies only the difference
+as `F() + delta` updates, so it is idempotent and events may arrive late or
+twice. `manage.py rebuild_sales_rollups` recomputes a date range from scratch.
+
+An order counts as a sale unless it was cancelled or its payment failed, on
+the local date it was placed. The order discount is spread over its lines by
+value; tax is the GST charged per line. Completed returns (a whole order for
+requests without an item, and refunded orders) count as returned units and
+their gross amount.
+"""
+
+from collections import defaultdict, namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import DailySales, SalesRollupState, Order, OrderItem, ReturnRequest
+from . import exports, ids, outbox
+
+TOPIC = 'rollups.refresh'
+
+FIELDS = ('orders', 'units', 'gross', 'discount', 'tax', 'returned_units', 'returned_amount')
+
+CENT = Decimal('0.01')
+
+ORDER_FIELDS = ('id', 'created_at', 'order_status', 'payment_status', 'payment_method', 'discount_amount')
+
+_Line = namedtuple('_Line', 'id order_id product_id category_id brand_id quantity price tax_percent')
+
+
+def schedule(order_ids):
+    """Queue a rollup refresh for `order_ids`; call inside the transaction changing them."""
+    if order_ids:
+        outbox.enqueue(TOPIC, {'order_ids': [str(pk) for pk in order_ids]})
+
+
+def _money(value):
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _load(orders):
+    """
+    Everything the rollups need about `orders` (a values() queryset) in three
+    queries: ({id: order}, {order id: [_Line]}, {order id: returned item ids}).
+    """
+    orders = {order['id']: order for order in orders}
+    lines = defaultdict(list)
+    items = OrderItem.objects.filter(order_id__in=orders).order_by('order_id', 'id').values_list(
+        'id', 'order_id', 'product_id', 'product__category_id', 'product__brand_id',
+        'quantity', 'price_at_purchase', 'tax_at_purchase',
+    )
+    for row in items:
+        lines[row[1]].append(_Line(*row))
+    returned = defaultdict(set)
+    completed = ReturnRequest.objects.filter(order_id__in=orders, status='completed')
+    for order_id, item_id in completed.values_list('order_id', 'order_item_id'):
+        returned[order_id].update([item_id] if item_id else [line.id for line in lines[order_id]])
+    return orders, lines, returned
+
+
+def _wanted(order, lines, returned):
+    """(sale counted, ids of items counted as returned) for the order as it is now."""
+    if order['order_status'] == 'cancelled' or order['payment_status'] == 'failed':
+        return False, set()
+    if order['order_status'] == 'refunded':
+        return True, {line.id for line in lines}
+    return True, returned & {line.id for line in lines}
+
+
+def _keys(order, line):
+    keys = (
+        ('product', line.product_id),
+        ('category', line.category_id),
+        ('brand', line.brand_id),
+        ('payment_method', order['payment_method']),
+    )
+    return [(dimension, str(key)) for dimension, key in keys if key not in (None, '')]
+
+
+def _values(order, lines):
+    """{item id: (gross, discount, tax)}, the order discount split by line value."""
+    gross = {line.id: line.price * line.quantity for line in lines}
+    total = sum(gross.values())
+    remaining = order['discount_amount']
+    values = {}
+    for i, line in enumerate(lines):
+        if i == len(lines) - 1:
+            discount = remaining
+        else:
+            discount = _money(order['discount_amount'] * gross[line.id] / total) if total else Decimal('0')
+            remaining -= discount
+        values[line.id] = (gross[line.id], discount, _money(gross[line.id] * line.tax_percent / 100))
+    return values
+
+
+def _contribute(deltas, order, lines, sale_sign, return_signs):
+    """Add (sale_sign = 1) or take away (-1) the order's sale and its lines' returns."""
+    day = timezone.localtime(order['created_at']).date()
+    values = _values(order, lines)
+    if sale_sign:
+        for dimension, key in {key for line in lines for key in _keys(order, line)}:
+            deltas[(day, dimension, key)]['orders'] += sale_sign
+    for line in lines:
+        gross, discount, tax = values[line.id]
+        return_sign = return_signs.get(line.id, 0)
+        if not (sale_sign or return_sign):
+            continue
+        for dimension, key in _keys(order, line):
+            row = deltas[(day, dimension, key)]
+            if sale_sign:
+                row['units'] += sale_sign * line.quantity
+                row['gross'] += sale_sign * gross
+                row['discount'] += sale_sign * discount
+                row['tax'] += sale_sign * tax
+            if return_sign:
+                row['returned_units'] += return_sign * line.quantity
+                row['returned_amount'] += return_sign * gross
+
+
+def _new_deltas():
+    return defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+
+
+def _apply(deltas):
+    """Add `deltas` ({(date, dimension, key): {field: delta}}) to DailySales."""
+    DailySales.objects.bulk_create([
+        DailySales(date=day, dimension=dimension, key=key) for day, dimension, key in deltas
+    ], ignore_conflicts=True)
+    for (day, dimension, key), values in deltas.items():
+        changes = {field: F(field) + value for field, value in values.items() if value}
+        if changes:
+            DailySales.objects.filter(date=day, dimension=dimension, key=key).update(**changes)
+
+
+@transaction.atomic
+def refresh(order_ids):
+    """Bring the rollups in line with the current state of `order_ids`."""
+    # Locking the orders keeps concurrent refreshes (and rebuilds) of the same order apart
+    rows = Order.objects.select_for_update().filter(id__in=order_ids).order_by('id').values(*ORDER_FIELDS)
+    orders, lines, returned = _load(rows)
+    if not orders:
+        return
+    SalesRollupState.objects.bulk_create(
+        [SalesRollupState(order_id=pk) for pk in orders], ignore_conflicts=True
+    )
+    deltas, changed, now = _new_deltas(), [], timezone.now()
+    for state in SalesRollupState.objects.filter(order_id__in=orders):
+        order = orders[state.order_id]
+        counted, wanted_returns = _wanted(order, lines[order['id']], returned[order['id']])
+        had_returns = set(state.returned_items)
+        if counted == state.counted and wanted_returns == had_returns:
+            continue
+        return_signs = {
+            **{pk: 1 for pk in wanted_returns - had_returns},
+            **{pk: -1 for pk in had_returns - wanted_returns},
+        }
+        sale_sign = (counted > state.counted) - (counted < state.counted)
+        _contribute(deltas, order, lines[order['id']], sale_sign, return_signs)
+        state.counted, state.returned_items, state.updated_at = counted, sorted(wanted_returns), now
+        changed.append(state)
+    _apply(deltas)
+    SalesRollupState.objects.bulk_update(changed, ['counted', 'returned_items', 'updated_at'])
+
+
+@transaction.atomic
+def rebuild(first, last, chunk_size=1000):
+    """
+    Recompute the rollups for local dates `first`..`last` from the orders
+    placed on them. Returns (orders, rollup rows).
+    """
+    start, end = exports.date_bounds(first, last)
+    orders = Order.objects.filter(ids.created_between(start, end))
+    order_ids = list(orders.order_by('id').values_list('id', flat=True))
+
+    DailySales.objects.filter(date__gte=first, date__lte=last).delete()
+    totals = _new_deltas()
+    for i in range(0, len(order_ids), chunk_size):
+        chunk = order_ids[i:i + chunk_size]
+        rows = Order.objects.select_for_update().filter(id__in=chunk).order_by('id').values(*ORDER_FIELDS)
+        orders, lines, returned = _load(rows)
+        states = []
+        for order in orders.values():
+            counted, wanted_returns = _wanted(order, lines[order['id']], returned[order['id']])
+            _contribute(totals, order, lines[order['id']], int(counted), dict.fromkeys(wanted_returns, 1))
+            states.append(SalesRollupState(order_id=order['id'], counted=counted, returned_items=sorted(wanted_returns)))
+        SalesRollupState.objects.filter(order_id__in=chunk).delete()
+        SalesRollupState.objects.bulk_create(states)
+
+    DailySales.objects.bulk_create([
+        DailySales(date=day, dimension=dimension, key=key, **values)
+        for (day, dimension, key), values in totals.items()
+    ], batch_size=chunk_size)
+    return len(order_ids), len(totals)
@@ -1,14 +1,17 @@
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse, Http404
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction, models
-from django.db.models import F, Q, Avg, Count
+from django.db.models import F, Q, Avg, Count, Prefetch, prefetch_related_objects
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from django.utils import timezone
 from decimal import Decimal
+from datetime import date
 from rest_framework import viewsets, status, generics, permissions, filters, mixins
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from rest_framework.exceptions import PermissionDenied
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -20,20 +23,25 @@ import logging
 
 from .models import (
     User, Address, Category, Brand, Product, ProductSize, ProductVariant,
-    Cart, CartItem, Order, OrderItem, Review, Coupon, Wishlist, PasswordResetOTP, ReturnRequest
+    Cart, CartItem, Order, OrderItem, Review, Wishlist, PasswordResetOTP, ReturnRequest, ArchivedOrder
 )
 from .serializers import (
     UserSerializer, AddressSerializer,
     CategorySerializer, BrandSerializer,
     ProductListSerializer, ProductDetailSerializer,
-    CartSerializer, CartItemSerializer,
-    OrderSerializer, ReviewSerializer, ReturnRequestSerializer
+    CartSerializer, CartItemSerializer, StoredCartItemSerializer, CartBatchSerializer,
+    OrderSerializer, OrderSummarySerializer, ReviewSerializer, ReturnRequestSerializer
 )
-from .utils.razorpay_utils import handle_razorpay_payment_for_order, verify_and_process_razorpay_payment
-from .emails import send_otp_email
+from .utils.razorpay_utils import (
+    handle_razorpay_payment_for_order, verify_and_process_razorpay_payment, release_unpaid_order
+)
+from .utils import archive, cart_store, coupons, exports, guest_carts, inventory, order_events, order_transitions, pincodes, pricing, quotes, reservations, rollups, outbox
+from .utils.pricing import basket_pricing
+from .utils.cache_backend import RedisUnavailable
+from .utils.idempotency import idempotent
+from .pagination import OrderCursorPagination
 
 logger = logging.getLogger(__name__)
-from .emails import send_otp_email
 
 # -----------------------------------------------------------------------------
 # 1. AUTHENTICATION & USERS
@@ -72,11 +80,25 @@ class AuthViewSet(viewsets.ViewSet):
             # Generate Tokens
             refresh = RefreshToken.for_user(user)
             
-            return Response({
+            response_data = {
                 'user': UserSerializer(user).data,
                 'refresh': str(refresh),
                 'access': str(refresh.access_token),
-            }, status=status.HTTP_201_CREATED)
+            }
+        response_data.update(self._merge_guest_cart(request, user))
+        return Response(response_data, status=status.HTTP_201_CREATED)
+
+    def _merge_guest_cart(self, request, user):
+        """Merge the caller's guest cart (if any) into the user's cart."""
+        token = guest_carts.get_token(request)
+        if not token:
+            return {}
+        try:
+            return {'merged_cart_items': guest_carts.merge_into_user_cart(token, user)}
+        except Exception as e:
+            # Never fail a login because of the cart
+            logger.error(f"Failed to merge guest cart for user {user.id}: {str(e)}")
+            return {'merged_cart_items': 0}
 
     @action(detail=False, methods=['post'])
     def login(self, request):
@@ -114,6 +136,7 @@ class AuthViewSet(viewsets.ViewSet):
             'user': UserSerializer(user).data,
             'refresh': str(refresh),
             'access': str(refresh.access_token),
+            **self._merge_guest_cart(request, user),
         }, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'])
@@ -160,17 +183,18 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_200_OK
             )
 
-        # Invalidate old unused OTPs for this user
-        PasswordResetOTP.objects.filter(user=user, is_used=False).update(is_used=True)
-
         # Generate new 6-digit OTP
         otp_code = ''.join(random.choices(string.digits, k=6))
-        
-        # Save OTP to DB
-        PasswordResetOTP.objects.create(user=user, otp=otp_code)
 
-        # Send Email
-        send_otp_email(user.email, otp_code)
+        with transaction.atomic():
+            # Invalidate old unused OTPs for this user
+            PasswordResetOTP.objects.filter(user=user, is_used=False).update(is_used=True)
+
+            # Save OTP to DB
+            otp = PasswordResetOTP.objects.create(user=user, otp=otp_code)
+
+            # Email is sent by the outbox worker once this commits
+            outbox.enqueue('email.password_reset_otp', {'otp_id': otp.id})
 
         return Response(
             {'message': 'If an account exists with this email, an OTP has been sent.'},
@@ -260,6 +284,30 @@ class UserViewSet(viewsets.GenericViewSet):
             return Response(serializer.data)
 
  
+class PincodeViewSet(viewsets.ViewSet):
+    """GET /pincodes/<pincode>/: serviceability, COD, shipping fee and delivery estimate."""
+    permission_classes = [AllowAny]
+    lookup_value_regex = r'[0-9 ]+'
+
+    def retrieve(self, request, pk=None):
+        if pincodes.normalize(pk) is None:
+            return Response({'error': 'Enter a valid 6-digit pincode.'}, status=status.HTTP_400_BAD_REQUEST)
+        service = pincodes.lookup(pk)
+        if not pincodes.is_serviceable(pk):
+            return Response({'pincode': pk, 'serviceable': False})
+
+        estimate = pincodes.delivery_estimate(pk)
+        return Response({
+            'pincode': str(pincodes.normalize(pk)),
+            'serviceable': True,
+            'zone': service.zone if service else None,
+            'cod': service.cod if service else True,
+            'shipping_cost': str(pricing.shipping_for(Decimal('0'), pk)),
+            'free_shipping_above': str(pricing.FREE_SHIPPING_ABOVE),
+            'delivery_estimate': {'earliest': estimate[0], 'latest': estimate[1]} if estimate else None,
+        })
+
+
 class AddressViewSet(viewsets.ModelViewSet):
     serializer_class = AddressSerializer
     permission_classes = [IsAuthenticated]
@@ -487,21 +535,116 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
 # -----------------------------------------------------------------------------
 
 class CartViewSet(viewsets.ViewSet):
-    permission_classes = [IsAuthenticated]
+    """
+    Shopping cart. With CART_ENGINE='redis' reads and writes go to the Redis
+    cart store (persisted write-behind); if Redis is unavailable, or the
+    engine is 'db', the Cart/CartItem tables are used directly.
+
+    Anonymous shoppers get a guest cart kept in the cache under an opaque
+    token (X-Cart-Token), merged into their Cart on login.
+
+    Every write validates the resulting cart against stock minus other
+    shoppers' live reservations, then re-syncs this cart's own holds.
+    """
+    permission_classes = [AllowAny]
 
     def _get_cart(self, request):
         cart, _ = Cart.objects.get_or_create(user=request.user)
         return cart
 
+    def _serialize_cart(self, request, cart):
+        # Load all lines with their products, images, sizes and SQL line totals in one go
+        prefetch_related_objects([cart], Prefetch('items', queryset=CartItem.objects.for_display()))
+        data = CartSerializer(cart, context={'request': request}).data
+        data['pricing'] = pricing.summary(basket_pricing(cart.items.all()))
+        return data
+
+    def _get_store(self, request):
+        if not request.user.is_authenticated:
+            store = guest_carts.GuestCartStore(guest_carts.get_token(request))
+            self.guest_token = store.token
+            return store
+        return cart_store.RedisCartStore(request.user) if cart_store.is_enabled() else None
+
+    def _owner(self, request):
+        if request.user.is_authenticated:
+            return reservations.user_owner(request.user)
+        return reservations.guest_owner(self.guest_token)
+
+    def _stock_errors(self, request, lines, touched):
+        """
+        Validate the whole cart `lines` ({line key: quantity}) against available
+        stock in one query; returns a 400 Response for errors on `touched`
+        lines, or None if they are fine.
+        """
+        errors = inventory.validate_lines(
+            {key: {**cart_store.parse_line_key(key), 'quantity': quantity} for key, quantity in lines.items()},
+            owner=self._owner(request),
+        )
+        errors = {key: error for key, error in errors.items() if key in touched}
+        if not errors:
+            return None
+        return Response(
+            {'error': next(iter(errors.values())), 'items': errors},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def _hold(self, request, lines):
+        reservations.hold(self._owner(request), lines)
+
+    def _db_lines(self, cart):
+        return {cart_store.item_line_key(item): item.quantity for item in cart.items.all()}
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'guest_token', None):
+            response[guest_carts.TOKEN_HEADER] = self.guest_token
+        return response
+
+    def _render_store(self, request, store, lines=None):
+        """Render the stored cart; `lines` the caller already holds (after its write) saves a re-read."""
+        if lines is None:
+            meta, lines = store.snapshot()
+        else:
+            meta = store.meta
+        items = cart_store.build_cart_items(meta.get(cart_store.META_CART_ID), lines)
+        data = {
+            'id': int(meta[cart_store.META_CART_ID]) if meta.get(cart_store.META_CART_ID) else None,
+            'items': StoredCartItemSerializer(items, many=True, context={'request': request}).data,
+            'total_price': str(sum((item.total_price for item in items), Decimal('0.00'))),
+            'pricing': pricing.summary(basket_pricing(items)),
+            'updated_at': meta.get(cart_store.META_UPDATED_AT),
+        }
+        if isinstance(store, guest_carts.GuestCartStore):
+            data['cart_token'] = store.token
+        return data
+
+    def _resolve_line(self, request, lines, item_id):
+        """Map an item_id (line key, or a legacy numeric CartItem id) to a key in `lines`."""
+        item_id = str(item_id or '')
+        if ':' in item_id:
+            return item_id if item_id in lines else None
+        if item_id.isdigit() and request.user.is_authenticated:
+            item = CartItem.objects.filter(id=item_id, cart__user=request.user).first()
+            if item:
+                key = cart_store.item_line_key(item)
+                return key if key in lines else None
+        return None
+
     def list(self, request):
+        store = self._get_store(request)
+        if store:
+            try:
+                return Response(self._render_store(request, store))
+            except RedisUnavailable:
+                logger.warning("Redis cart store unavailable; serving cart from database")
         cart = self._get_cart(request)
-        # Prefetch to minimize DB hits when serializing items
-        serializer = CartSerializer(cart, context={'request': request})
-        return Response(serializer.data)
+        return Response(self._serialize_cart(request, cart))
 
     @action(detail=False, methods=['post'])
     def add(self, request):
-        cart = self._get_cart(request)
+        store = self._get_store(request)
+        cart = None if store else self._get_cart(request)
         serializer = CartItemSerializer(data=request.data, context={'cart': cart})
         
         if serializer.is_valid():
@@ -511,23 +654,53 @@ class CartViewSet(viewsets.ViewSet):
             variant = serializer.validated_data.get('variant')  # Backward compatibility
             quantity = serializer.validated_data['quantity']
 
-            # Update existing item or create new
-            # Match by product, size, and variant_product
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                selected_size=selected_size,
-                variant_product=variant_product,
-                variant=variant,  # Backward compatibility
-                defaults={'quantity': 0}
+            key = cart_store.line_key(
+                product.id,
+                selected_size.id if selected_size else None,
+                variant_product.id if variant_product else None,
+                variant.id if variant else None,
             )
-            
-            # Validation logic is inside serializer, but double check stock here if needed
-            cart_item.quantity += quantity
-            cart_item.save()
-            
+
+            if store:
+                try:
+                    _, lines = store.snapshot()
+                    lines[key] = lines.get(key, 0) + quantity
+                    error_response = self._stock_errors(request, lines, {key})
+                    if error_response:
+                        return error_response
+                    store.add(key, quantity)
+                    self._hold(request, lines)
+                    return Response(self._render_store(request, store, lines))
+                except RedisUnavailable:
+                    logger.warning("Redis cart store unavailable; writing cart to database")
+                    cart = self._get_cart(request)
+
+            with transaction.atomic():
+                # Lock the cart so concurrent adds are validated and applied one after the other
+                cart = Cart.objects.select_for_update().get(pk=cart.pk)
+                lines = self._db_lines(cart)
+                lines[key] = lines.get(key, 0) + quantity
+                error_response = self._stock_errors(request, lines, {key})
+                if error_response:
+                    return error_response
+
+                # Update existing item or create new
+                # Match by product, size, and variant_product
+                cart_item, created = CartItem.objects.get_or_create(
+                    cart=cart,
+                    product=product,
+                    selected_size=selected_size,
+                    variant_product=variant_product,
+                    variant=variant,  # Backward compatibility
+                    defaults={'quantity': quantity}
+                )
+                if not created:
+                    CartItem.objects.filter(pk=cart_item.pk).update(quantity=F('quantity') + quantity)
+                cart_store.record_db_write(cart)
+                self._hold(request, lines)
+
             # Return full updated cart
-            return Response(CartSerializer(cart, context={'request': request}).data)
+            return Response(self._serialize_cart(request, cart))
             
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -536,28 +709,203 @@ class CartViewSet(viewsets.ViewSet):
         item_id = request.data.get('item_id')
         quantity = int(request.data.get('quantity', 1))
         
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        
         if quantity < 1:
             return Response({'error': 'Quantity must be at least 1'}, status=400)
-            
-        # Check Stock Limit
-        stock_limit = cart_item.variant.stock_count if cart_item.variant else cart_item.product.inventory_count
-        if quantity > stock_limit:
-             return Response({'error': f'Only {stock_limit} units available'}, status=400)
 
-        cart_item.quantity = quantity
-        cart_item.save()
+        store = self._get_store(request)
+        if store:
+            try:
+                _, lines = store.snapshot()
+                key = self._resolve_line(request, lines, item_id)
+                if key is None:
+                    return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
+                lines[key] = quantity
+                error_response = self._stock_errors(request, lines, {key})
+                if error_response:
+                    return error_response
+                store.set_quantity(key, quantity)
+                self._hold(request, lines)
+                return Response(self._render_store(request, store, lines))
+            except RedisUnavailable:
+                logger.warning("Redis cart store unavailable; writing cart to database")
         
-        return Response(CartSerializer(cart_item.cart, context={'request': request}).data)
+        with transaction.atomic():
+            # Lock the cart so concurrent writes are validated and applied one after the other
+            cart = get_object_or_404(Cart.objects.select_for_update(), user=request.user)
+            cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+
+            # Check stock, net of other shoppers' reservations
+            key = cart_store.item_line_key(cart_item)
+            lines = self._db_lines(cart)
+            lines[key] = quantity
+            error_response = self._stock_errors(request, lines, {key})
+            if error_response:
+                return error_response
+
+            CartItem.objects.filter(pk=cart_item.pk).update(quantity=quantity)
+            cart_store.record_db_write(cart)
+            self._hold(request, lines)
+
+        return Response(self._serialize_cart(request, cart))
 
     @action(detail=False, methods=['post'])
     def remove_item(self, request):
         item_id = request.data.get('item_id')
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        cart = cart_item.cart
-        cart_item.delete()
-        return Response(CartSerializer(cart, context={'request': request}).data)
+
+        store = self._get_store(request)
+        if store:
+            try:
+                _, lines = store.snapshot()
+                key = self._resolve_line(request, lines, item_id)
+                if key is None:
+                    return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
+                store.remove(key)
+                del lines[key]
+                self._hold(request, lines)
+                return Response(self._render_store(request, store, lines))
+            except RedisUnavailable:
+                logger.warning("Redis cart store unavailable; writing cart to database")
+
+        with transaction.atomic():
+            cart = get_object_or_404(Cart.objects.select_for_update(), user=request.user)
+            get_object_or_404(CartItem, id=item_id, cart=cart).delete()
+            cart_store.record_db_write(cart)
+            self._hold(request, self._db_lines(cart))
+        return Response(self._serialize_cart(request, cart))
+
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Apply several cart operations in one transaction, validating stock for
+        all touched lines with a single query.
+
+        Expected payload:
+        {
+            "operations": [
+                {"op": "add", "product_id": 1, "size_id": 4, "quantity": 1},
+                {"op": "update", "item_id": 12, "quantity": 3},
+                {"op": "remove", "item_id": 15}
+            ],
+            "response": "full" | "delta"
+        }
+
+        "delta" returns only changed and removed lines plus the new totals.
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        operations = serializer.validated_data['operations']
+        delta = serializer.validated_data['response'] == 'delta'
+
+        variant_ids = {op['variant_id'] for op in operations if op.get('variant_id')}
+        if variant_ids and ProductVariant.objects.filter(id__in=variant_ids).count() != len(variant_ids):
+            return Response({'error': 'Invalid variant_id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        store = self._get_store(request)
+        if store:
+            try:
+                return self._batch_store(request, store, operations, delta)
+            except RedisUnavailable:
+                logger.warning("Redis cart store unavailable; applying batch to database cart")
+        return self._batch_db(request, operations, delta)
+
+    def _batch_db(self, request, operations, delta):
+        with transaction.atomic():
+            cart = self._get_cart(request)
+            items = {cart_store.item_line_key(item): item for item in cart.items.select_for_update()}
+            by_id = {str(item.id): key for key, item in items.items()}
+            try:
+                lines, changed, removed = cart_store.apply_operations(
+                    {key: item.quantity for key, item in items.items()},
+                    operations,
+                    resolve_item=lambda item_id: by_id.get(str(item_id), item_id),
+                )
+            except cart_store.CartOperationError as e:
+                return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+            error_response = self._stock_errors(request, lines, changed)
+            if error_response:
+                return error_response
+
+            to_create, to_update = [], []
+            for key in changed:
+                if key in items:
+                    items[key].quantity = lines[key]
+                    to_update.append(items[key])
+                else:
+                    ids = cart_store.parse_line_key(key)
+                    to_create.append(CartItem(
+                        cart=cart,
+                        product_id=ids['product_id'],
+                        selected_size_id=ids['size_id'],
+                        variant_product_id=ids['variant_product_id'],
+                        variant_id=ids['variant_id'],
+                        quantity=lines[key],
+                    ))
+            removed_ids = [items[key].id for key in removed if key in items]
+            if removed_ids:
+                CartItem.objects.filter(id__in=removed_ids).delete()
+            if to_update:
+                CartItem.objects.bulk_update(to_update, ['quantity'])
+            if to_create:
+                CartItem.objects.bulk_create(to_create)
+            cart_store.record_db_write(cart)
+            self._hold(request, lines)
+
+        if not delta:
+            return Response(self._serialize_cart(request, cart))
+
+        changed_items = CartItem.objects.for_display().filter(id__in=[item.id for item in to_update + to_create])
+        return Response({
+            'id': cart.id,
+            'changed': CartItemSerializer(changed_items, many=True, context={'request': request}).data,
+            'removed': removed_ids,
+            'total_price': str(cart.items.total()),
+            'item_count': len(lines),
+            'updated_at': cart.updated_at,
+        })
+
+    def _batch_store(self, request, store, operations, delta):
+        meta, current = store.snapshot()
+        # Clients may still hold numeric ids from the database cart
+        numeric_ids = [str(op['item_id']) for op in operations if str(op.get('item_id', '')).isdigit()]
+        if not request.user.is_authenticated:
+            numeric_ids = []
+        legacy = {
+            str(item.id): cart_store.item_line_key(item)
+            for item in CartItem.objects.filter(id__in=numeric_ids, cart__user=request.user)
+        } if numeric_ids else {}
+        try:
+            lines, changed, removed = cart_store.apply_operations(
+                current, operations, resolve_item=lambda item_id: legacy.get(str(item_id), item_id)
+            )
+        except cart_store.CartOperationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        error_response = self._stock_errors(request, lines, changed)
+        if error_response:
+            return error_response
+
+        store.apply({**{key: lines[key] for key in changed}, **{key: None for key in removed}})
+        self._hold(request, lines)
+        if not delta:
+            return Response(self._render_store(request, store, lines))
+
+        items = cart_store.build_cart_items(meta.get(cart_store.META_CART_ID), lines)
+        data = {
+            'id': int(meta[cart_store.META_CART_ID]) if meta.get(cart_store.META_CART_ID) else None,
+            'changed': StoredCartItemSerializer(
+                [item for item in items if item.id in changed], many=True, context={'request': request}
+            ).data,
+            'removed': sorted(removed),
+            'total_price': str(sum((item.total_price for item in items), Decimal('0.00'))),
+            'item_count': len(lines),
+            'updated_at': timezone.now(),
+        }
+        if isinstance(store, guest_carts.GuestCartStore):
+            data['cart_token'] = store.token
+        return Response(data)
 
 
 # -----------------------------------------------------------------------------
@@ -570,32 +918,79 @@ class OrderViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'head'] # No PUT/PATCH allowed on orders for safety
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user) \
-            .prefetch_related('items__product', 'items__variant') \
-            .select_related('shipping_address') \
-            .order_by('-created_at')
+        return Order.objects.filter(user=self.request.user).for_display().order_by('-created_at')
+
+    def list(self, request, *args, **kwargs):
+        """
+        Full nested orders by default. `?view=summary` returns one light row
+        per order (status, totals, item count, first item image) from a
+        single query, cursor-paginated newest first. `?archived=true` lists
+        the orders moved to the archive instead, in the same shapes.
+
+        Old finished orders are archived (utils/archive.py) and no longer
+        appear here; `archived_count` says how many the customer has, to
+        be fetched with `?archived=true`.
+        """
+        if request.query_params.get('archived') in ('1', 'true'):
+            return self._archived_list(request)
+        if request.query_params.get('view') != 'summary':
+            response = super().list(request, *args, **kwargs)
+        else:
+            queryset = Order.objects.filter(user=request.user).summaries()
+            paginator = OrderCursorPagination()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = OrderSummarySerializer(page, many=True, context={'request': request})
+            response = paginator.get_paginated_response(serializer.data)
+        response.data['archived_count'] = ArchivedOrder.objects.filter(user=request.user).count()
+        return response
+
+    def _archived_list(self, request):
+        summary = request.query_params.get('view') == 'summary'
+        queryset = ArchivedOrder.objects.filter(user=request.user).order_by('-created_at')
+        paginator = OrderCursorPagination() if summary else self.paginator
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer_class = OrderSummarySerializer if summary else OrderSerializer
+        serializer = serializer_class(archive.orders(page), many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        """Orders moved to the archive are served from there, read-only."""
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            try:
+                order = archive.get(kwargs.get('pk'), user=request.user)
+            except (ValueError, DjangoValidationError):
+                order = None
+            if order is None:
+                raise
+            return Response(self.get_serializer(order).data)
 
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Cancel an order if it's in processing status"""
         order = self.get_object()
-        
-        # Only allow cancellation for processing orders
-        if order.order_status != 'processing':
+
+        # Only processing orders can be cancelled; the transition re-checks the
+        # status under a row lock, so a concurrent shipment is never undone
+        moved, _ = order_transitions.transition(
+            Order.objects.filter(pk=order.pk, order_status='processing'), 'cancelled',
+            actor=request.user, source='customer',
+        )
+        order.refresh_from_db()
+        if not moved:
             return Response(
                 {'error': f'Order cannot be cancelled. Current status: {order.order_status}'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        order.order_status = 'cancelled'
-        order.save()
-        
+
         return Response(
             {'message': 'Order cancelled successfully', 'data': OrderSerializer(order).data},
             status=status.HTTP_200_OK
         )
 
     @action(detail=False, methods=['post'])
+    @idempotent('orders.verify_payment')
     def verify_payment(self, request):
         """
         Verify Razorpay payment signature and mark order as paid.
@@ -796,95 +1191,253 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'])
     def validate_coupon(self, request):
-        """Validate a coupon code without creating an order (used by frontend)."""
+        """Price a coupon against the user's cart without creating an order (used by frontend)."""
         coupon_code = request.data.get('coupon_code')
         if not coupon_code:
             return Response({'valid': False, 'error': 'No coupon code provided'}, status=status.HTTP_400_BAD_REQUEST)
 
+        self._flush_cart(request)
+        items = CartItem.objects.filter(cart__user=request.user).select_related('product', 'variant_product')
         try:
-            coupon_obj = Coupon.objects.get(code=coupon_code, active=True, valid_to__gte=timezone.now())
-            # Simple demo discount calculation; in real app this would depend on coupon type
-            discount = Decimal('100')
-            return Response({'valid': True, 'discount': str(discount), 'coupon': coupon_obj.code}, status=status.HTTP_200_OK)
-        except Coupon.DoesNotExist:
-            return Response({'valid': False, 'error': 'Invalid or expired coupon'}, status=status.HTTP_404_NOT_FOUND)
+            priced, coupon_obj = pricing.with_coupon(basket_pricing(items), coupon_code)
+        except coupons.CouponNotFound as e:
+            return Response({'valid': False, 'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except coupons.CouponError as e:
+            # Exists but does not apply to this cart (minimum purchase, usage limit)
+            return Response({'valid': False, 'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'valid': True,
+            'discount': str(priced['discount_amount']),
+            'coupon': coupon_obj.code,
+            'pricing': pricing.summary(priced),
+        }, status=status.HTTP_200_OK)
 
-    @transaction.atomic
+    def _flush_cart(self, request):
+        if cart_store.is_enabled():
+            try:
+                # Persist the Redis cart synchronously; the DB is authoritative for pricing and checkout
+                cart_store.flush_cart(request.user.id, evict=True)
+            except RedisUnavailable:
+                logger.warning(f"Redis cart store unavailable; using database cart for user {request.user.id}")
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """
+        Staff-only streaming export: ?kind=items|orders&output=csv|jsonl
+        &from=YYYY-MM-DD&to=YYYY-MM-DD&status=delivered (status repeatable).
+
+        Archived orders are not exported; when the range has some, their
+        number is sent in the X-Archived-Orders-Excluded header.
+        """
+        params = request.query_params
+        kind, output = params.get('kind', 'items'), params.get('output', 'csv')
+        if kind not in exports.KINDS or output not in exports.FORMATS:
+            return Response(
+                {'error': f'kind must be one of {sorted(exports.KINDS)}, output one of {list(exports.FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            first, last = (date.fromisoformat(params[key]) if params.get(key) else None for key in ('from', 'to'))
+        except ValueError:
+            return Response({'error': 'Dates must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+        start, end = exports.date_bounds(first, last)
+        lines = exports.lines(kind, output, start=start, end=end, statuses=params.getlist('status') or None)
+        response = StreamingHttpResponse(
+            lines, content_type='text/csv' if output == 'csv' else 'application/x-ndjson'
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders-{kind}-{timezone.localdate()}.{output}"'
+        excluded = archive.between(start, end).count()
+        if excluded:
+            response['X-Archived-Orders-Excluded'] = str(excluded)
+        return response
+
+    @action(detail=False, methods=['post'])
+    def quote(self, request):
+        """
+        Price the cart (shipping to `shipping_address_id` if given) and check
+        its stock without locking anything. Returns a short-lived signed
+        `quote_id`; sending it with the order pins these totals (409 if the
+        cart, address, prices or coupon changed meanwhile).
+        """
+        self._flush_cart(request)
+        cart_items = list(
+            CartItem.objects.filter(cart__user=request.user)
+            .select_related('product', 'variant_product', 'selected_size')
+        )
+        if not cart_items:
+            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = inventory.validate_lines(
+            self._stock_lines(cart_items), owner=reservations.user_owner(request.user)
+        )
+        if errors:
+            return self._out_of_stock(cart_items, errors)
+
+        priced = basket_pricing(cart_items)
+        if request.data.get('shipping_address_id'):
+            address = get_object_or_404(Address, id=request.data['shipping_address_id'], user=request.user)
+            if not pincodes.is_serviceable(address.pincode):
+                return Response(
+                    {'error': f'We do not deliver to pincode {address.pincode} yet.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            priced = pricing.with_shipping(priced, address.pincode)
+        coupon_code = request.data.get('coupon_code')
+        if coupon_code:
+            try:
+                priced, _ = pricing.with_coupon(priced, coupon_code)
+            except coupons.CouponError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        quote_id, expires_at = quotes.create(request.user, pricing.item_lines(cart_items), priced)
+        return Response({
+            'quote_id': quote_id,
+            'expires_at': expires_at,
+            'items': [
+                {
+                    'item_id': item.id,
+                    'product_name': (item.variant_product or item.product).title,
+                    'size': item.selected_size.size if item.selected_size else None,
+                    'quantity': item.quantity,
+                    'unit_price': str(line['unit_price']),
+                    'tax_percent': str(line['tax_percent']),
+                    'tax': str(line['tax']),
+                }
+                for item, line in (
+                    (item, priced['lines'][cart_store.item_line_key(item)]) for item in cart_items
+                )
+            ],
+            'coupon': priced['coupon'],
+            **pricing.summary(priced),
+        }, status=status.HTTP_201_CREATED)
+
+    def _stock_lines(self, cart_items):
+        return {
+            item.id: {
+                'product_id': item.product_id,
+                'size_id': item.selected_size_id,
+                'variant_product_id': item.variant_product_id,
+                'quantity': item.quantity,
+            } for item in cart_items
+        }
+
+    def _out_of_stock(self, cart_items, errors):
+        item = next(item for item in cart_items if item.id in errors)
+        product = item.variant_product or item.product
+        return Response({'error': f'Out of stock: {product.title}', 'items': errors}, status=400)
+
+    @idempotent('orders.create')
     def create(self, request, *args, **kwargs):
+        """
+        Place an order from the user's cart. Send an `Idempotency-Key` header
+        so retries return the first response instead of placing a second order,
+        and the `quote_id` from /orders/quote/ to pin the quoted totals.
+        """
+        self._flush_cart(request)
+
+        # The order and stock changes are committed before the gateway is
+        # called, so no row stays locked during the Razorpay round trip
+        response = self._checkout(request)
+        if response.status_code != status.HTTP_201_CREATED or response.data.get('payment_method') != 'RAZORPAY':
+            return response
+
+        order = Order.objects.select_related('user').get(id=response.data['id'])
+        try:
+            response.data['razorpay_order'] = handle_razorpay_payment_for_order(order, order.total_amount)
+            logger.info(f"Razorpay order created for order {order.id}")
+        except Exception as e:
+            logger.error(f"Failed to create Razorpay order for order {order.id}: {str(e)}")
+            # Compensate: cancel the unpaid order and put its stock back
+            release_unpaid_order(order)
+            return Response(
+                {'error': f'Failed to initialize payment: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return response
+
+    @transaction.atomic
+    def _checkout(self, request):
         """
         Transactional Checkout Process:
-        1. Validate Cart
-        2. Lock Inventory Rows (select_for_update)
-        3. Create Order
-        4. Create OrderItems
-        5. Deduct Stock
-        6. Clear Cart
+        1. Validate Cart against available stock
+        2. Create Order
+        3. Bulk-create OrderItems
+        4. Deduct Stock via 'sale' ledger movements (one conditional UPDATE
+           per table; no row locks, a concurrent sellout rolls back)
+        5. Clear Cart
         """
         user = request.user
         cart = Cart.objects.filter(user=user).first()
-        
-        if not cart or not cart.items.exists():
+        cart_items = list(
+            cart.items.select_related('product', 'variant_product', 'selected_size', 'variant')
+            .prefetch_related('product__images', 'variant_product__images')
+        ) if cart else []
+
+        if not cart_items:
             return Response({'error': 'Cart is empty'}, status=400)
 
         shipping_address_id = request.data.get('shipping_address_id')
         address = get_object_or_404(Address, id=shipping_address_id, user=user)
+        service = pincodes.lookup(address.pincode)
+        if not pincodes.is_serviceable(address.pincode):
+            return Response({'error': f'We do not deliver to pincode {address.pincode} yet.'}, status=400)
+
+        # 1. Validate against stock net of other shoppers' live reservations
+        owner = reservations.user_owner(user)
+        errors = inventory.validate_lines(self._stock_lines(cart_items), owner=owner)
+        if errors:
+            transaction.set_rollback(True) # Force rollback
+            return self._out_of_stock(cart_items, errors)
+
+        # 2. Price the basket: a quote pins its totals once cart, prices and
+        #    coupon are verified unchanged; otherwise price it now (cached per
+        #    cart contents, shared with the cart view)
+        quote_id = request.data.get('quote_id')
+        if quote_id:
+            try:
+                quote_id, quote = quotes.load(quote_id, user)
+                coupon_obj = quotes.verify(quote, pricing.item_lines(cart_items), address.pincode)
+            except quotes.QuoteError as e:
+                transaction.set_rollback(True)
+                return Response({'error': str(e), 'code': 'quote_invalid'}, status=status.HTTP_409_CONFLICT)
+            priced = quote['pricing']
+            if priced.get('pincode') is None:
+                priced = pricing.with_shipping(priced, address.pincode)
+        else:
+            priced = pricing.with_shipping(basket_pricing(cart_items), address.pincode)
+            coupon_code = request.data.get('coupon_code')
+            coupon_obj = None
+            if coupon_code:
+                try:
+                    priced, coupon_obj = pricing.with_coupon(priced, coupon_code)
+                except coupons.CouponError as e:
+                    transaction.set_rollback(True)
+                    return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 1. Prepare Totals
-        subtotal = 0
         order_items_payload = []
-
-        # Iterate items
-        cart_items = cart.items.select_related('product', 'variant').all()
-        
         for item in cart_items:
-            # LOCKING: Get fresh product/variant instance with lock
-            if item.variant:
-                # Lock the variant row
-                variant = ProductVariant.objects.select_for_update().get(id=item.variant.id)
-                product = item.product # No need to lock product if tracking stock on variant
-                stock = variant.stock_count
+            product = item.variant_product or item.product
+            line = priced['lines'][cart_store.item_line_key(item)]
+
+            if item.selected_size:
+                variant_name = f"Size: {item.selected_size.size}"
             else:
-                # Lock the product row
-                product = Product.objects.select_for_update().get(id=item.product.id)
-                variant = None
-                stock = product.inventory_count
-            
-            # Check Stock again inside lock
-            if item.quantity > stock:
-                transaction.set_rollback(True) # Force rollback
-                return Response({'error': f'Out of stock: {product.title}'}, status=400)
-
-            # Calculate Line Price
-            price = product.final_price
-            if variant:
-                price += variant.price_adjustment
-            
-            subtotal += (price * item.quantity)
-            
+                variant_name = item.variant.difference if item.variant else ''
             order_items_payload.append({
-                'product': product,
-                'variant': variant,
-                'price': price,
+                'stock_key': inventory.stock_key(item.product_id, item.selected_size_id, item.variant_product_id),
+                'product': item.product,
+                'variant_product': item.variant_product,
+                'variant': item.variant,
+                'selected_size': item.selected_size.size if item.selected_size else '',
+                'product_name': product.title,
+                'variant_name': variant_name,
+                'image': product.primary_image or item.product.primary_image,
+                'price': line['unit_price'],
+                'tax_percent': line['tax_percent'],
                 'quantity': item.quantity
             })
 
-        # 2. Financials
-        shipping_cost = Decimal('0') if subtotal > Decimal('1000') else Decimal('99')
-        tax_amount = subtotal * Decimal('0.18') # 18% GST Simplified
-        discount_amount = Decimal('0')
-        
-        # Coupon Logic (Simplified)
-        coupon_code = request.data.get('coupon_code')
-        coupon_obj = None
-        if coupon_code:
-            try:
-                coupon_obj = Coupon.objects.get(code=coupon_code, active=True, valid_to__gte=timezone.now())
-                # ... advanced validation ...
-                # Assuming valid for demo
-                discount_amount = Decimal('100') # Mock calculation
-            except Coupon.DoesNotExist:
-                coupon_obj = None
-
         # Payment method handling with whitelist to prevent injection
         ALLOWED_PAYMENT_METHODS = ['COD', 'RAZORPAY', 'CARD', 'UPI']
         payment_method = (request.data.get('payment_method') or 'CARD').upper()
@@ -896,6 +1449,13 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if payment_method == 'COD' and service and not service.cod:
+            transaction.set_rollback(True)
+            return Response(
+                {'error': f'Cash on delivery is not available for pincode {address.pincode}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         # For COD leave payment_status pending; for online methods handle based on type
         if payment_method == 'COD':
             payment_status = 'pending'
@@ -905,62 +1465,67 @@ class OrderViewSet(viewsets.ModelViewSet):
         else:
             payment_status = 'paid'
         
-        total_amount = subtotal + tax_amount + shipping_cost - discount_amount
-
         # 3. Create Order
         order = Order.objects.create(
             user=user,
             shipping_address=address,
             billing_address=address, # Simplified
-            total_amount=total_amount,
-            tax_amount=tax_amount,
-            shipping_cost=shipping_cost,
-            discount_amount=discount_amount,
+            total_amount=priced['total'],
+            tax_amount=priced['tax_amount'],
+            shipping_cost=priced['shipping_cost'],
+            discount_amount=priced['discount_amount'],
             coupon=coupon_obj,
             order_status='pending' if payment_method == 'RAZORPAY' else 'processing',
             payment_status=payment_status,
             payment_method=payment_method
         )
+        order_events.record(order_events.changes(order, {}, actor=user, source='checkout'))
+        rollups.schedule([order.id])
 
         # 4. Create Items & Deduct Stock
-        for payload in order_items_payload:
-            OrderItem.objects.create(
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
                 order=order,
                 product=payload['product'],
+                variant_product=payload['variant_product'],
                 variant=payload['variant'],
+                selected_size=payload['selected_size'],
+                product_name=payload['product_name'],
+                variant_name=payload['variant_name'],
+                product_image=payload['image'].image.name if payload['image'] else '',
                 quantity=payload['quantity'],
-                price_at_purchase=payload['price']
+                price_at_purchase=payload['price'],
+                tax_at_purchase=payload['tax_percent']
             )
-            
-            # Deduct Stock (Already locked)
-            if payload['variant']:
-                payload['variant'].stock_count = F('stock_count') - payload['quantity']
-                payload['variant'].save()
-            else:
-                payload['product'].inventory_count = F('inventory_count') - payload['quantity']
-                payload['product'].save()
-
-        # 5. Clear Cart
-        cart.items.all().delete()
-
-        # 6. Handle Razorpay payment if selected
-        response_data = OrderSerializer(order).data
-        
-        if payment_method == 'RAZORPAY':
+            for payload in order_items_payload
+        ])
+        try:
+            inventory.apply_movements([
+                inventory.movement(payload['stock_key'], -payload['quantity'], 'sale', order=order, order_item=order_item)
+                for payload, order_item in zip(order_items_payload, order_items)
+            ])
+        except inventory.InsufficientStock:
+            transaction.set_rollback(True)
+            return Response({'error': 'Some items just sold out. Please review your cart.'}, status=400)
+
+        # Count the coupon use last: the conditional UPDATE holds its row until commit
+        if coupon_obj:
             try:
-                razorpay_response = handle_razorpay_payment_for_order(order, total_amount)
-                response_data['razorpay_order'] = razorpay_response
-                logger.info(f"Razorpay order created for order {order.id}")
-            except Exception as e:
-                logger.error(f"Failed to create Razorpay order for order {order.id}: {str(e)}")
-                # Delete the order since Razorpay initialization failed
-                order.delete()
-                return Response(
-                    {'error': f'Failed to initialize payment: {str(e)}'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+                coupons.redeem(coupon_obj)
+            except coupons.CouponError as e:
+                transaction.set_rollback(True)
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(response_data, status=status.HTTP_201_CREATED)
+        # 5. Clear Cart (its stock holds are consumed by the order)
+        cart.items.all().delete()
+        cart_store.record_db_write(cart)
+        reservations.release(owner)
+        if quote_id:
+            transaction.on_commit(lambda: quotes.discard(quote_id))
+
+        # Razorpay orders are created by create() once this transaction commits
+        order = Order.objects.for_display().get(id=order.id)
+        return Response(OrderSerializer(order, context={'request': request}).data, status=status.HTTP_201_CREATED)
 
 
 # -----------------------------------------------------------------------------
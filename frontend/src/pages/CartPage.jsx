@@ -8,7 +8,7 @@ import Button from '../components/ui/Button';
 const CartPage = () => {
   const dispatch = useDispatch();
   const navigate = useNavigate();
-  const { items, totalPrice, loading } = useSelector((state) => state.cart);
+  const { items, totalPrice, pricing, loading } = useSelector((state) => state.cart);
   const { isAuthenticated } = useSelector((state) => state.auth);
 
   useEffect(() => {
@@ -40,9 +40,10 @@ const CartPage = () => {
     );
   }
 
-  const shipping = totalPrice > 1000 ? 0 : 99;
-  const tax = Math.round(totalPrice * 0.18); // 18% GST estimate
-  const finalTotal = parseFloat(totalPrice) + shipping + tax;
+  // Prefer the server's pricing (per-product GST); fall back to an 18% estimate
+  const shipping = pricing ? Number(pricing.shipping_cost) : (totalPrice > 1000 ? 0 : 99);
+  const tax = pricing ? Number(pricing.tax_amount) : Math.round(totalPrice * 0.18);
+  const finalTotal = pricing ? Number(pricing.total) : parseFloat(totalPrice) + shipping + tax;
 
   return (
     <div className="container mx-auto px-4 md:px-6 py-12">
@@ -13,7 +13,7 @@ const CheckoutPage = () => {
   const navigate = useNavigate();
   const dispatch = useDispatch();
   const [searchParams] = useSearchParams();
-  const { items, totalPrice } = useSelector((state) => state.cart);
+  const { items, totalPrice, pricing } = useSelector((state) => state.cart);
   
   const [addresses, setAddresses] = useState([]);
   const [selectedAddress, setSelectedAddress] = useState(null);
@@ -214,10 +214,10 @@ const CheckoutPage = () => {
   };
 
   // Calculations
-  const shipping = totalPrice > 1000 ? 0 : 99;
-  const tax = Math.round(totalPrice * 0.18);
+  const shipping = pricing ? Number(pricing.shipping_cost) : (totalPrice > 1000 ? 0 : 99);
+  const tax = pricing ? Number(pricing.tax_amount) : Math.round(totalPrice * 0.18);
   const discountAmount = appliedCoupon ? Number(appliedCoupon.discount || 0) : 0;
-  const finalTotal = parseFloat(totalPrice) + shipping + tax - discountAmount;
+  const finalTotal = (pricing ? Number(pricing.total) : parseFloat(totalPrice) + shipping + tax) - discountAmount;
 
   return (
     <div className="container mx-auto px-4 md:px-6 py-8">
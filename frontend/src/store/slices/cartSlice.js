@@ -51,6 +51,7 @@ const cartSlice = createSlice({
   initialState: {
     items: [],
     totalPrice: 0,
+    pricing: null, // Server-computed subtotal/tax/shipping/total
     loading: false,
     error: null,
     operationLoading: false, // For adding/removing specific items to avoid full page spinner
@@ -59,6 +60,7 @@ const cartSlice = createSlice({
     clearCart: (state) => {
       state.items = [];
       state.totalPrice = 0;
+      state.pricing = null;
     },
     resetCartError: (state) => {
         state.error = null;
@@ -75,6 +77,7 @@ const cartSlice = createSlice({
         state.loading = false;
         state.items = action.payload.items;
         state.totalPrice = action.payload.total_price;
+        state.pricing = action.payload.pricing || null;
       })
       .addCase(fetchCart.rejected, (state, action) => {
         state.loading = false;
@@ -91,6 +94,7 @@ const cartSlice = createSlice({
         // Server returns the FULL updated cart, so we just replace state
         state.items = action.payload.items;
         state.totalPrice = action.payload.total_price;
+        state.pricing = action.payload.pricing || null;
       })
       .addCase(addToCart.rejected, (state, action) => {
         state.operationLoading = false;
@@ -102,6 +106,7 @@ const cartSlice = createSlice({
       .addCase(updateCartItem.fulfilled, (state, action) => {
         state.items = action.payload.items;
         state.totalPrice = action.payload.total_price;
+        state.pricing = action.payload.pricing || null;
       })
       .addCase(updateCartItem.rejected, (state, action) => {
         state.error = action.payload?.error || 'Failed to update cart';
@@ -111,6 +116,7 @@ const cartSlice = createSlice({
       .addCase(removeFromCart.fulfilled, (state, action) => {
         state.items = action.payload.items;
         state.totalPrice = action.payload.total_price;
+        state.pricing = action.payload.pricing || null;
       });
   },
 });